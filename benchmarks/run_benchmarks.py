@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""Scale benchmarks for oft-trace on synthetic aspec reports.
+
+Generates reports of several sizes, times parsing, analysis and the main
+commands on each, and compares the results with a stored baseline:
+
+    python benchmarks/run_benchmarks.py                      # compare with baseline.json
+    python benchmarks/run_benchmarks.py --scales 10000,1000000
+    python benchmarks/run_benchmarks.py --update-baseline    # record a new baseline
+
+The exit code is 1 if any benchmark is slower than the baseline by more than
+the tolerance. Baselines are only comparable on the same machine, so record
+one where the comparison runs.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import tempfile
+from datetime import datetime
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT_DIR)
+
+from oft_trace.synthetic import generate_aspec
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+DEFAULT_SCALES = "10000,100000"
+# Bump when the generated reports or the benchmarks change, which invalidates older baselines
+BENCHMARK_VERSION = 1
+
+# Shape of the generated reports; the number of items and cycles follows the scale
+GENERATOR_OPTIONS = {
+    "fan_out": 3,
+    "fan_in_skew": 0.5,
+    "mismatch_rate": 0.02,
+    "duplicate_rate": 0.01,
+    "uncovered_rate": 0.05,
+    "seed": 1,
+}
+
+# Timed in a fresh interpreter, which prints the time of each stage as JSON
+STAGE_SCRIPT = """
+import json, sys, time
+from oft_trace.pipeline import AnalysisPipeline
+
+timings = {}
+start = time.perf_counter()
+pipeline = AnalysisPipeline(sys.argv[1], use_cache=False)
+pipeline.parse()
+timings["parse"] = time.perf_counter() - start
+
+start = time.perf_counter()
+pipeline.classify()
+pipeline.cycles()
+pipeline.rules()
+timings["analysis"] = time.perf_counter() - start
+
+start = time.perf_counter()
+AnalysisPipeline(sys.argv[1], cache_dir=sys.argv[2]).parse()
+timings["parse_and_cache"] = time.perf_counter() - start
+
+start = time.perf_counter()
+AnalysisPipeline(sys.argv[1], cache_dir=sys.argv[2]).parse()
+timings["cache_load"] = time.perf_counter() - start
+
+print(json.dumps(timings))
+"""
+
+def command_benchmarks(aspec_file, out_dir):
+    """Return (name, arguments) of the commands to time on a report."""
+    return [
+        ("trace", ["trace", aspec_file, "feat-0", "-o", os.path.join(out_dir, "trace.txt")]),
+        ("list_items", ["list-items", aspec_file, "-o", os.path.join(out_dir, "items.txt")]),
+        ("trace_failures_text", ["trace-failures", aspec_file, "-o", os.path.join(out_dir, "failures.txt")]),
+        ("trace_failures_json", ["trace-failures", aspec_file, "--format", "json",
+                                 "-o", os.path.join(out_dir, "failures.json")]),
+    ]
+
+def run_python(args, env):
+    """Run the interpreter with the package importable and return its stdout."""
+    env = dict(env, PYTHONPATH=ROOT_DIR + os.pathsep + env.get("PYTHONPATH", ""))
+    result = subprocess.run([sys.executable, *args], capture_output=True, text=True, env=env, cwd=ROOT_DIR)
+    if result.returncode != 0:
+        raise RuntimeError(f"{' '.join(args[:3])} failed:\n{result.stderr}")
+    return result.stdout
+
+def prepare_report(scale, work_dir):
+    """Generate the report for a scale unless an identical one exists."""
+    options = dict(GENERATOR_OPTIONS, items=scale, cycles=max(1, scale // 10000))
+    name = f"synthetic-{scale}-v{BENCHMARK_VERSION}-" + "-".join(f"{options[key]}" for key in sorted(options))
+    aspec_file = os.path.join(work_dir, name + ".aspec")
+    if not os.path.exists(aspec_file):
+        print(f"Generating {scale} items...", flush=True)
+        generate_aspec(aspec_file + ".tmp", **options)
+        os.replace(aspec_file + ".tmp", aspec_file)
+    return aspec_file
+
+def benchmark_scale(scale, work_dir, repeat, only=None):
+    """Time all benchmarks on one scale; returns {name: {"min", "median"}} in seconds."""
+    aspec_file = prepare_report(scale, work_dir)
+    samples = {}
+
+    with tempfile.TemporaryDirectory(prefix="run-", dir=work_dir) as run_dir:
+        env = dict(os.environ, OFT_TRACE_CACHE_DIR=os.path.join(run_dir, "cache"))
+        for run in range(repeat):
+            print(f"  {scale} items, run {run + 1}/{repeat}: stages", flush=True)
+            stage_cache = os.path.join(run_dir, f"stage-cache-{run}")
+            timings = json.loads(run_python(["-c", STAGE_SCRIPT, aspec_file, stage_cache], env))
+            for name, elapsed in timings.items():
+                if only is None or name in only:
+                    samples.setdefault(name, []).append(elapsed)
+
+            # Commands run with a warm cache, as they do when a report is inspected repeatedly
+            for name, args in command_benchmarks(aspec_file, run_dir):
+                if only is not None and name not in only:
+                    continue
+                print(f"  {scale} items, run {run + 1}/{repeat}: {name}", flush=True)
+                if run == 0:
+                    run_python(["-m", "oft_trace.main", *args], env)  # Fill the cache
+                start = time.perf_counter()
+                run_python(["-m", "oft_trace.main", *args], env)
+                samples.setdefault(name, []).append(time.perf_counter() - start)
+
+    return {name: {"min": round(min(values), 4), "median": round(sorted(values)[len(values) // 2], 4)}
+            for name, values in samples.items()}
+
+def machine_info():
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+def compare(results, baseline, tolerance, min_delta):
+    """Print the results next to the baseline and return the regressions."""
+    regressions = []
+    print(f"\n{'scale':>8}  {'benchmark':<22}{'baseline s':>11}{'current s':>11}{'change':>9}")
+    for scale, benchmarks in results["scales"].items():
+        for name, timing in benchmarks.items():
+            reference = baseline.get("scales", {}).get(scale, {}).get(name)
+            if reference is None:
+                print(f"{scale:>8}  {name:<22}{'-':>11}{timing['min']:>11.3f}{'new':>9}")
+                continue
+            change = timing["min"] / reference["min"] - 1 if reference["min"] else 0.0
+            slower = timing["min"] - reference["min"] > min_delta and change > tolerance
+            marker = "  REGRESSION" if slower else ""
+            print(f"{scale:>8}  {name:<22}{reference['min']:>11.3f}{timing['min']:>11.3f}{change:>+9.0%}{marker}")
+            if slower:
+                regressions.append((scale, name, reference["min"], timing["min"]))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark oft-trace on synthetic aspec reports")
+    parser.add_argument("--scales", default=DEFAULT_SCALES, help="Comma-separated item counts (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per benchmark; the fastest counts (default: 3)")
+    parser.add_argument("--only", help="Comma-separated benchmarks to run, e.g. parse,trace")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline file (default: benchmarks/baseline.json)")
+    parser.add_argument("--update-baseline", action="store_true", help="Store the results as the new baseline")
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed slowdown against the baseline as a fraction (default: 0.25)")
+    parser.add_argument("--min-delta", type=float, default=0.05,
+                        help="Ignore slowdowns smaller than this many seconds (default: 0.05)")
+    parser.add_argument("--work-dir", default=os.path.join(tempfile.gettempdir(), "oft-trace-bench"),
+                        help="Directory for generated reports, reused between runs")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.work_dir, exist_ok=True)
+    only = set(args.only.split(",")) if args.only else None
+    results = {
+        "version": BENCHMARK_VERSION,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "machine": machine_info(),
+        "generator": GENERATOR_OPTIONS,
+        "scales": {}
+    }
+    for scale in [int(value) for value in args.scales.split(",")]:
+        results["scales"][str(scale)] = benchmark_scale(scale, args.work_dir, args.repeat, only)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+
+    if args.update_baseline:
+        # Keep the scales of the old baseline that were not run this time
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding="utf-8") as f:
+                previous = json.load(f)
+            if previous.get("version") == BENCHMARK_VERSION:
+                for scale, benchmarks in previous.get("scales", {}).items():
+                    results["scales"].setdefault(scale, benchmarks)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --update-baseline to create one")
+        return 0
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("version") != BENCHMARK_VERSION:
+        print(f"Baseline is for benchmark version {baseline.get('version')}, not {BENCHMARK_VERSION}; "
+              f"run with --update-baseline")
+        return 0
+    if baseline.get("machine") != results["machine"]:
+        print("Warning: the baseline was recorded on a different machine or Python; timings may not compare")
+
+    regressions = compare(results, baseline, args.tolerance, args.min_delta)
+    if regressions:
+        print(f"\n{len(regressions)} benchmarks regressed by more than {args.tolerance:.0%}")
+        return 1
+    print("\nNo regressions")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,19 +1,84 @@
 """Analysis logic for aspec trace chains."""
 from typing import Dict, List, Set, Optional, Any
 from collections import defaultdict
+from collections.abc import Mapping
 
 from oft_trace.models import SpecItem
+from oft_trace.graph import TraceGraph
+from oft_trace.profiling import profile_stage
+
+# Coverage types in report order
+COVERAGE_TYPES = ("COVERED", "ORPHANED", "SHALLOW", "OUTDATED", "UNCOVERED", "UNKNOWN", "CIRCULAR")
+# Per-doctype counter of each coverage type that is counted by doctype
+DOCTYPE_COUNTERS = {
+    "COVERED": "covered",
+    "ORPHANED": "orphaned",
+    "SHALLOW": "shallow",
+    "OUTDATED": "outdated",
+    "UNCOVERED": "uncovered"
+}
+
+def new_doctype_stats() -> Dict[str, int]:
+    """Return zeroed per-doctype coverage counters."""
+    return dict.fromkeys(("total", *DOCTYPE_COUNTERS.values()), 0)
+
+def find_strongly_connected_components(graph):
+    """Find the strongly connected components of a directed graph.
+    
+    The graph maps each node key to a list of its successors. Components are
+    returned as lists of keys in reverse topological order.
+    """
+    trace_graph = TraceGraph.from_adjacency(graph)
+    return [[trace_graph.keys[node] for node in component]
+            for component in trace_graph.strongly_connected_components()]
+
+def find_cycles(graph):
+    """Return the components of the graph that contain a cycle, as lists of keys."""
+    trace_graph = TraceGraph.from_adjacency(graph)
+    return [[trace_graph.keys[node] for node in cycle] for cycle in trace_graph.find_cycles()]
 
 class TraceAnalyzer:
     """Analyzer for trace chains to identify issues and relationships."""
     
-    def __init__(self, spec_items, id_map, covering_map, covered_by_map, broken_chains, aspec_file=None):
+    def __init__(self, spec_items, id_map, covering_map, covered_by_map, broken_chains=None, aspec_file=None):
         self.spec_items = spec_items
         self.id_map = id_map
         self.covering_map = covering_map
         self.covered_by_map = covered_by_map
-        self.broken_chains = broken_chains
+        self._broken_chains = broken_chains
         self.aspec_file = aspec_file
+        self.circular_dependencies = None
+        self._graph = None
+        self._indexes = None
+        self._version_mismatches = None
+        self._classification = None
+    
+    @property
+    def broken_chains(self):
+        """Keys of the items whose reported coverage is not COVERED, found on first use.
+        
+        Circular dependencies do not count here; items in a cycle are only
+        listed if OpenFastTrace itself reports them as not covered.
+        """
+        if self._broken_chains is None:
+            self._broken_chains = [
+                item_key for item_key, item in self.spec_items.items()
+                if item.reported_coverage_type != "COVERED"
+            ]
+        return self._broken_chains
+    
+    @broken_chains.setter
+    def broken_chains(self, value):
+        self._broken_chains = value
+    
+    @property
+    def graph(self):
+        """Integer-keyed view of the relationship maps, built on first use."""
+        if self._graph is None:
+            with profile_stage('graph') as stage:
+                self._graph = TraceGraph.from_maps(self.spec_items, self.covering_map, self.covered_by_map)
+                stage.count(nodes=self._graph.node_count, edges=self._graph.edge_count)
+        return self._graph
     
     def get_item_by_id(self, spec_id, doctype=None, version=None):
         """Find an item by ID and optionally by doctype and version."""
@@ -26,86 +91,326 @@ class TraceAnalyzer:
             return None
         
         # Find by ID and optionally doctype
-        for key, item in self.spec_items.items():
-            if key.startswith(f"{spec_id}~") and (doctype is None or item.doctype == doctype):
-                return key
+        if doctype is None:
+            keys = self._get_index('id').get(spec_id)
+        else:
+            keys = self._get_index('id_doctype').get((spec_id, doctype))
         
-        return None
+        return keys[0] if keys else None
     
-    def is_version_mismatch(self, source_key, target_key):
-        """Check if there's a version mismatch between items."""
-        if source_key not in self.spec_items or target_key not in self.spec_items:
-            return False
+    def _get_index(self, name):
+        """Return a secondary index, building all of them on first use."""
+        if name == 'coverage_type':
+            # Coverage types come from the single classification pass
+            return self.categorize_items_by_coverage()
         
-        source = self.spec_items[source_key]
-        target = self.spec_items[target_key]
+        if self._indexes is None:
+            self._build_indexes()
         
-        # If we have coverage details about version mismatches
-        for covering in source.coverage.get('coveringItems', []):
-            if covering['id'] == target.id:
-                if covering.get('coveringStatus') == 'COVERING_WRONG_VERSION':
-                    return True
-        
-        # If the item is in the covering map but with wrong version
-        source_id = source_key.split('~')[0]
-        target_id = target_key.split('~')[0]
+        return self._indexes[name]
+    
+    def _build_indexes(self):
+        """Build the lookup indexes by ID, ID and doctype, doctype and status."""
+        with profile_stage('indexes') as stage:
+            indexes = {
+                'id': defaultdict(list),
+                'id_doctype': defaultdict(list),
+                'doctype': defaultdict(list),
+                'status': defaultdict(list),
+            }
+            for key, item in self.spec_items.items():
+                indexes['id'][item.id].append(key)
+                indexes['id_doctype'][(item.id, item.doctype)].append(key)
+                indexes['doctype'][item.doctype].append(key)
+                indexes['status'][item.status].append(key)
+            
+            # Plain dicts, so lookups of missing values don't add entries
+            self._indexes = {index_name: dict(index) for index_name, index in indexes.items()}
+            stage.count(items=len(self.spec_items))
+    
+    def reset_indexes(self):
+        """Drop the lookup indexes after spec_items or their coverage changed."""
+        self._indexes = None
+        self._version_mismatches = None
+        self._classification = None
+    
+    def prepare(self):
+        """Build the graph, the indexes and the version mismatch table now.
         
-        if source_id in self.id_map and target_id in self.id_map:
-            for source_variant in self.id_map[source_id]:
-                for target_variant in self.id_map[target_id]:
-                    if source_variant != source_key or target_variant != target_key:
-                        if source_variant in self.covering_map and target_variant in self.covering_map[source_variant]:
-                            return True
+        Afterwards lookups only read shared state, so the analyzer can be used
+        from several threads or forked worker processes without rebuilding it.
+        """
+        self.graph
+        self._get_index('id')
+        if self._version_mismatches is None:
+            self._build_version_mismatch_index()
+        self.categorize_items_by_coverage()
+        return self
+    
+    def apply_changes(self, changes, flag_cycles=True):
+        """Update the analysis after update_model() patched the model in place.
+        
+        changes is the ModelChanges it returned. Only the changed items are
+        classified again, cycle membership is recomputed for the items
+        reachable from changed links, and the version mismatch table only for
+        the links of the changed IDs. The graph, the lookup indexes, the
+        classification lists and the list of cycles are rebuilt on next use.
+        Pass flag_cycles=False if circular dependencies were never marked.
+        """
+        with profile_stage('reanalysis') as stage:
+            if flag_cycles:
+                stage.count(cycle_items=self._update_cycle_flags(changes))
+            if self._version_mismatches is not None:
+                self._update_version_mismatches(changes)
+            self._graph = None
+            self._indexes = None
+            self._classification = None
+            self._broken_chains = None
+    
+    def _update_cycle_flags(self, changes):
+        """Flag the items in circular dependencies after links changed; returns the number of items checked."""
+        for item_key in changes.changed:
+            self.spec_items[item_key].in_circular_dependency = changes.previous[item_key].in_circular_dependency
+        
+        old_cycles = self.circular_dependencies
+        if changes.relinked or changes.reordered:
+            # The order of the cycles follows the graph, so the list is rebuilt on next use
+            self.circular_dependencies = None
+        if not changes.relinked:
+            return 0
+        
+        # Only cycles through a changed link, or reachable from one, can have changed
+        seeds = [key for key in changes.relinked if key in self.spec_items]
+        for cycle in old_cycles or ():
+            if not changes.relinked.isdisjoint(cycle):
+                seeds.extend(key for key in cycle if key in self.spec_items)
+        
+        reachable, cycles = self._find_reachable_cycles(seeds)
+        in_cycle = {item_key for cycle in cycles for item_key in cycle}
+        for item_key in reachable:
+            item = self.spec_items.get(item_key)
+            if item is not None and item.in_circular_dependency != (item_key in in_cycle):
+                item.in_circular_dependency = item_key in in_cycle
+        return len(reachable)
+    
+    def _update_version_mismatches(self, changes):
+        """Recompute the version mismatch state of the links of the changed IDs."""
+        ids = changes.ids
+        for item_key in changes.changed + changes.removed:
+            self._wrong_version_coverage.pop(item_key, None)
+        for item_key in changes.changed + changes.added:
+            expected = self._expected_versions(self.spec_items[item_key])
+            if expected:
+                self._wrong_version_coverage[item_key] = expected
+        
+        for item_key in changes.removed:
+            self._key_ids.pop(item_key, None)
+            self._key_positions.pop(item_key, None)
+        for spec_id in ids:
+            for position, key in enumerate(self.id_map.get(spec_id, ())):
+                self._key_ids[key] = spec_id
+                self._key_positions[key] = position
+        
+        for source_key, target_keys in changes.previous_links.items():
+            for target_key in target_keys:
+                sources = self._linked_from.get(target_key)
+                if sources is not None:
+                    sources.pop(source_key, None)
+                    if not sources:
+                        del self._linked_from[target_key]
+        for source_key in changes.relinked:
+            for target_key in self.covering_map.get(source_key, ()):
+                self._linked_from[target_key][source_key] = None
+        
+        # Links between versions of the changed IDs and any other ID
+        self._variant_links = defaultdict(list, {
+            pair: links for pair, links in self._variant_links.items() if pair[0] not in ids and pair[1] not in ids})
+        rebuilt = defaultdict(list)
+        keys = [key for spec_id in ids for key in dict.fromkeys(self.id_map.get(spec_id, ()))]
+        for source_key in keys:
+            for target_key in dict.fromkeys(self.covering_map.get(source_key, ())):
+                if target_key in self._key_ids:
+                    rebuilt[(self._key_ids[source_key], self._key_ids[target_key])].append((source_key, target_key))
+        for target_key in keys:
+            for source_key in self._linked_from.get(target_key, ()):
+                source_id = self._key_ids.get(source_key)
+                if source_id is not None and source_id not in ids:
+                    rebuilt[(source_id, self._key_ids[target_key])].append((source_key, target_key))
+        self._sort_variant_links(rebuilt.values())
+        self._variant_links.update(rebuilt)
+        
+        affected = set(keys).union(changes.removed)
+        stale = [edge for edge in self._version_mismatches
+                 if edge[0] in affected or edge[1] in affected
+                 or edge[0].split('~')[0] in ids or edge[1].split('~')[0] in ids]
+        for edge in stale:
+            del self._version_mismatches[edge]
+        
+        # Stale entries whose link is gone are not stored again
+        edges = [(source_key, target_key) for source_key, target_key in stale
+                 if target_key in self.covering_map.get(source_key, ())
+                 or source_key in self.covered_by_map.get(target_key, ())]
+        for item_key in keys:
+            edges.extend((item_key, target_key) for target_key in self.covering_map.get(item_key, ()))
+            edges.extend((source_key, item_key) for source_key in self.covered_by_map.get(item_key, ()))
+            edges.extend((source_key, item_key) for source_key in self._linked_from.get(item_key, ()))
+        for source_key, target_key in edges:
+            self._store_version_mismatch(source_key, target_key)
+    
+    def find_items(self, spec_id=None, doctype=None, status=None, coverage_type=None):
+        """Return the keys of all items matching the given filters, in report order.
         
-        return False
+        Each filter is answered from an index, so the cost depends on the number
+        of candidates of the most selective filter rather than the report size.
+        """
+        filters = [(attribute, value) for attribute, value in [
+            ('id', spec_id),
+            ('doctype', doctype),
+            ('status', status),
+            ('coverage_type', coverage_type),
+        ] if value]
+        
+        if not filters:
+            return list(self.spec_items)
+        
+        candidates = [(self._get_index(attribute).get(value, []), attribute, value)
+                      for attribute, value in filters]
+        candidates.sort(key=lambda candidate: len(candidate[0]))
+        keys = candidates[0][0]
+        
+        # Check the remaining filters on the smallest candidate list only
+        for _, attribute, value in candidates[1:]:
+            keys = [key for key in keys if getattr(self.spec_items[key], attribute) == value]
+        
+        return list(keys)
+    
+    def is_version_mismatch(self, source_key, target_key):
+        """Check if there's a version mismatch between items."""
+        return self._get_version_mismatch(source_key, target_key)[0]
     
     def get_version_mismatch_details(self, source_key, target_key):
         """Get detailed information about a version mismatch."""
+        return self._get_version_mismatch(source_key, target_key)[1]
+    
+    def _get_version_mismatch(self, source_key, target_key):
+        """Return (is_mismatch, details) for a link from the version mismatch table.
+        
+        The table holds every link in the relationship maps and is filled on
+        first use. Other pairs are computed on each call and not stored, so
+        probing arbitrary pairs does not grow the table.
+        """
+        if self._version_mismatches is None:
+            self._build_version_mismatch_index()
+        
+        result = self._version_mismatches.get((source_key, target_key))
+        if result is None:
+            result = self._compute_version_mismatch(source_key, target_key)
+        return result
+    
+    def _store_version_mismatch(self, source_key, target_key):
+        """Compute the version mismatch state of a link into the table, unless it is there already."""
+        edge = (source_key, target_key)
+        if edge not in self._version_mismatches:
+            self._version_mismatches[edge] = self._compute_version_mismatch(source_key, target_key)
+    
+    def _build_version_mismatch_index(self):
+        """Precompute the version mismatch state of every link between items."""
+        with profile_stage('version_mismatches') as stage:
+            # Items covered with the wrong version, with the first expected version per covering ID
+            self._wrong_version_coverage = {}
+            for item_key, item in self.spec_items.items():
+                expected = self._expected_versions(item)
+                if expected:
+                    self._wrong_version_coverage[item_key] = expected
+            
+            # Links between any versions of two IDs, in id_map order
+            self._key_ids = {}
+            self._key_positions = {}
+            for spec_id, keys in self.id_map.items():
+                for position, key in enumerate(keys):
+                    self._key_ids[key] = spec_id
+                    self._key_positions[key] = position
+            
+            # Items linking to each key, hanging ones included
+            self._linked_from = defaultdict(dict)
+            self._variant_links = defaultdict(list)
+            for source_key, target_keys in self.covering_map.items():
+                for target_key in dict.fromkeys(target_keys):
+                    self._linked_from[target_key][source_key] = None
+                if source_key not in self._key_ids:
+                    continue
+                for target_key in dict.fromkeys(target_keys):
+                    if target_key in self._key_ids:
+                        self._variant_links[(self._key_ids[source_key], self._key_ids[target_key])].append(
+                            (source_key, target_key))
+            self._sort_variant_links(self._variant_links.values())
+            
+            self._version_mismatches = {}
+            for source_key, target_keys in self.covering_map.items():
+                for target_key in target_keys:
+                    self._store_version_mismatch(source_key, target_key)
+            for target_key, source_keys in self.covered_by_map.items():
+                for source_key in source_keys:
+                    self._store_version_mismatch(source_key, target_key)
+            stage.count(links=len(self._version_mismatches))
+    
+    @staticmethod
+    def _expected_versions(item):
+        """Return the first expected version per ID of the items covering an item with the wrong version."""
+        expected = {}
+        for covering in item.coverage.coveringItems or ():
+            if covering.coveringStatus == 'COVERING_WRONG_VERSION' and covering['id'] not in expected:
+                expected[covering['id']] = covering.get('version', 'unknown')
+        return expected
+    
+    def _sort_variant_links(self, link_lists):
+        for links in link_lists:
+            links.sort(key=lambda link: (self._key_positions[link[0]], self._key_positions[link[1]]))
+    
+    def _compute_version_mismatch(self, source_key, target_key):
+        """Determine (is_mismatch, details) for a single link."""
         if source_key not in self.spec_items or target_key not in self.spec_items:
-            return None
+            return False, None
         
-        source = self.spec_items[source_key]
         target = self.spec_items[target_key]
         
-        # Check coverage details
-        for covering in source.coverage.get('coveringItems', []):
-            if covering['id'] == target.id:
-                if covering.get('coveringStatus') == 'COVERING_WRONG_VERSION':
-                    return {
-                        'current': {
-                            'id': target.id,
-                            'version': target.version
-                        },
-                        'expected': {
-                            'id': target.id,
-                            'version': covering.get('version', 'unknown')
-                        }
-                    }
-        
-        # Check other versions
-        source_id = source_key.split('~')[0]
-        target_id = target_key.split('~')[0]
-        
-        expected_version = None
-        for source_variant in self.id_map[source_id]:
-            for target_variant in self.id_map[target_id]:
-                if source_variant != source_key or target_variant != target_key:
-                    if source_variant in self.covering_map and target_variant in self.covering_map[source_variant]:
-                        expected_version = target_variant.split('~')[1]
-        
-        if expected_version:
-            return {
-                'current': {
-                    'id': target.id,
-                    'version': target.version
-                },
-                'expected': {
-                    'id': target.id,
-                    'version': expected_version
-                }
+        # If we have coverage details about version mismatches
+        expected_version = self._wrong_version_coverage.get(source_key, {}).get(target.id)
+        if expected_version is None:
+            # If another version of either item is linked instead, the last such
+            # link names the expected version
+            other_link = None
+            source_id = source_key.split('~')[0]
+            target_id = target_key.split('~')[0]
+            for link in reversed(self._variant_links.get((source_id, target_id), ())):
+                if link != (source_key, target_key):
+                    other_link = link
+                    break
+            
+            if other_link is None:
+                return False, None
+            
+            expected_version = other_link[1].split('~')[1]
+            if not expected_version:
+                return True, None
+        
+        return True, {
+            'current': {
+                'id': target.id,
+                'version': target.version
+            },
+            'expected': {
+                'id': target.id,
+                'version': expected_version
             }
-        
-        return None
+        }
+    
+    def get_circular_dependencies(self):
+        """Return each circular dependency once, as a list of the item keys involved."""
+        if self.circular_dependencies is None:
+            graph = self.graph
+            self.circular_dependencies = [[graph.keys[node] for node in cycle] for cycle in graph.find_cycles()]
+        return self.circular_dependencies
     
     def determine_failure_reasons(self, item_key):
         """Determine the reasons for an item's coverage failure."""
@@ -121,14 +426,13 @@ class TraceAnalyzer:
             bi_directional_with = []
             
             # Check covers relationships
-            for covered_ref in item.covers:
-                covered_id = covered_ref.get('id')
-                covered_version = covered_ref.get('version', '1')
-                covered_key = f"{covered_id}~{covered_version}"
-                
+            graph = self.graph
+            node = graph.node(item_key)
+            for covered in graph.successors(node):
                 # Check if the covered item also covers this item (bidirectional)
-                if covered_key in self.spec_items and item_key in self.covered_by_map.get(covered_key, []):
-                    bi_directional_with.append(covered_id)
+                covered_item = graph.items[covered]
+                if covered_item is not None and node in graph.predecessors(covered):
+                    bi_directional_with.append(covered_item.id)
             
             if bi_directional_with:
                 reasons.append(f"⟲ Bidirectional reference with: {', '.join(bi_directional_with)}")
@@ -178,150 +482,189 @@ class TraceAnalyzer:
         return reasons
 
     def categorize_items_by_coverage(self):
-        """Categorize items by their coverage status for reporting."""
-        categories = {
-            "COVERED": [],
-            "ORPHANED": [],
-            "SHALLOW": [],
-            "OUTDATED": [],
-            "UNCOVERED": [],
-            "UNKNOWN": []
-        }
+        """Categorize items by their coverage status for reporting.
         
-        for item_key, item in self.spec_items.items():
-            categories[item.coverage_type].append(item_key)
-        
-        return categories
+        The result is shared between calls and must not be modified.
+        """
+        return self._classify_items()[0]
     
     def count_coverage_by_doctype(self):
-        """Count coverage statistics by document type."""
-        by_doctype = {}
-        for item_key, item in self.spec_items.items():
-            doctype = item.doctype
-            if doctype not in by_doctype:
-                by_doctype[doctype] = {
-                    "total": 0,
-                    "covered": 0,
-                    "orphaned": 0,
-                    "shallow": 0,
-                    "outdated": 0,
-                    "uncovered": 0
-                }
-            
-            by_doctype[doctype]["total"] += 1
+        """Count coverage statistics by document type.
+        
+        The result is shared between calls and must not be modified.
+        """
+        return self._classify_items()[1]
+    
+    def _classify_items(self):
+        """Classify all items once, building the categories and per-doctype counts together."""
+        if self._classification is None:
+            categories = {coverage_type: [] for coverage_type in COVERAGE_TYPES}
+            by_doctype = {}
             
-            coverage_type = item.coverage_type
-            if coverage_type == "COVERED":
-                by_doctype[doctype]["covered"] += 1
-            elif coverage_type == "ORPHANED":
-                by_doctype[doctype]["orphaned"] += 1
-            elif coverage_type == "SHALLOW":
-                by_doctype[doctype]["shallow"] += 1
-            elif coverage_type == "OUTDATED":
-                by_doctype[doctype]["outdated"] += 1
-            elif coverage_type == "UNCOVERED":
-                by_doctype[doctype]["uncovered"] += 1
-        
-        return by_doctype
-
-    def detect_circular_dependencies(self, items):
-        """Detect circular dependencies in the trace items."""
-        # Build a directed graph representation
-        graph = {}
-        for item in items:
-            # Make sure we're accessing properties correctly
-            # Some items might be dictionaries instead of SpecItem objects
-            if isinstance(item, dict):
-                item_id = item['id']
-                item_version = item.get('version', '1')
-                item_covers = item.get('covers', [])
-            else:
-                item_id = item.id
-                item_version = item.version
-                item_covers = item.covers
+            for item_key, item in self.spec_items.items():
+                coverage_type = item.coverage_type
+                categories[coverage_type].append(item_key)
                 
-            item_key = f"{item_id}~{item_version}"
-            if item_key not in graph:
-                graph[item_key] = []
-            
-            # Add edges for all covered items
-            for covered in item_covers:
-                if isinstance(covered, dict):
-                    covered_id = covered['id']
-                    covered_version = covered.get('version', '1')
-                else:
-                    covered_id = covered.id
-                    covered_version = covered.version
-                    
-                covered_key = f"{covered_id}~{covered_version}"
-                if covered_key not in graph:
-                    graph[covered_key] = []
-                graph[item_key].append(covered_key)
-        
-        # Find circular dependencies using DFS
-        circular_items = set()
-        
-        def find_cycles(node, path=None, visited=None):
-            if path is None:
-                path = []
-            if visited is None:
-                visited = set()
-            
-            # Mark the current node as visited and part of current path
-            visited.add(node)
-            path.append(node)
-            
-            # Recur for all neighbors
-            for neighbor in graph.get(node, []):
-                if neighbor in path:
-                    # Found a cycle
-                    cycle_start = path.index(neighbor)
-                    cycle = path[cycle_start:]
-                    # Add all items in the cycle to circular_items
-                    for cycle_item in cycle:
-                        circular_items.add(cycle_item)
-                elif neighbor not in visited:
-                    find_cycles(neighbor, path[:], visited)
+                stats = by_doctype.get(item.doctype)
+                if stats is None:
+                    stats = by_doctype[item.doctype] = new_doctype_stats()
+                
+                stats["total"] += 1
+                if coverage_type in DOCTYPE_COUNTERS:
+                    stats[DOCTYPE_COUNTERS[coverage_type]] += 1
             
-            # Remove node from the current path
-            path.pop()
+            self._classification = (categories, by_doctype)
         
-        # Start DFS from each node
-        for node in graph:
-            if node not in circular_items:
-                visited = set()
-                find_cycles(node, [], visited)
+        return self._classification
+
+    def detect_circular_dependencies(self, items=None):
+        """Detect circular dependencies in the trace items.
+        
+        Without items the analyzer's own graph is used. Otherwise a graph is
+        built from the given SpecItem objects or item dictionaries.
+        """
+        self.mark_circular_dependencies(items)
+        
+        # Also check for unwanted coverage which can contribute to circular dependencies
+        self.check_unwanted_coverage(items)
+    
+    def mark_circular_dependencies(self, items=None):
+        """Find the circular dependencies and flag the items that are part of one.
+        
+        Returns the cycles as lists of item keys.
+        """
+        if items is None:
+            graph = self.graph
+        else:
+            graph = self._build_item_graph(items)
+        
+        # Find circular dependencies as strongly connected components
+        cycles = graph.find_cycles()
+        self.circular_dependencies = [[graph.keys[node] for node in cycle] for cycle in cycles]
         
         # Update the items with circular dependency info
-        for item in items:
-            if isinstance(item, dict):
-                item_id = item['id']
-                item_version = item.get('version', '1')
-            else:
-                item_id = item.id
-                item_version = item.version
+        for cycle in cycles:
+            for node in cycle:
+                item = graph.items[node]
+                if item is None:
+                    continue  # Hanging reference, not an item in the report
                 
-            item_key = f"{item_id}~{item_version}"
-            if item_key in circular_items:
                 # For dictionary items, we need to handle differently than SpecItem objects
                 if isinstance(item, dict):
                     item['in_circular_dependency'] = True
                     # Can't set coverage_type on a dict, handle accordingly
                 else:
                     item.in_circular_dependency = True
-                    item.add_failure_reason("♻️ Item is part of a circular dependency chain")
+                    if hasattr(item, 'add_failure_reason'):
+                        item.add_failure_reason("♻️ Item is part of a circular dependency chain")
                     # Instead of setting coverage_type directly, use a method if available
                     if hasattr(item, 'set_coverage_type'):
                         item.set_coverage_type("UNCOVERED")
                     elif hasattr(item, 'mark_as_uncovered'):
                         item.mark_as_uncovered()
                     # Otherwise, we need to adapt to the SpecItem implementation
-                
-        # Also check for unwanted coverage which can contribute to circular dependencies
+        
+        # Circular items are classified differently now
+        if cycles:
+            self._classification = None
+        
+        return self.circular_dependencies
+    
+    def mark_reachable_circular_dependencies(self, item_keys):
+        """Flag the items of the circular dependencies reachable from the given items.
+        
+        This is all that showing the coverage type of those items needs, and
+        only the part of the report they lead to is visited. The cycles are
+        returned but not kept as the analyzer's circular_dependencies.
+        """
+        _, cycles = self._find_reachable_cycles(item_keys)
+        self._flag_cycle_items(cycles)
+        return cycles
+    
+    def _find_reachable_cycles(self, seeds):
+        """Return the keys reachable from seeds through covers links and the cycles among them.
+        
+        Every cycle through a reachable item lies within the reachable part, so
+        these are exactly the cycles the reachable items are part of.
+        """
+        reachable = set(seeds)
+        stack = list(reachable)
+        while stack:
+            for target_key in self.covering_map.get(stack.pop(), ()):
+                if target_key not in reachable:
+                    reachable.add(target_key)
+                    stack.append(target_key)
+        
+        graph = TraceGraph.from_adjacency({key: self.covering_map.get(key, []) for key in reachable})
+        return reachable, [[graph.keys[node] for node in cycle] for cycle in graph.find_cycles()]
+    
+    def set_circular_dependencies(self, cycles):
+        """Flag the items of circular dependencies found earlier, such as cached ones."""
+        self.circular_dependencies = cycles
+        self._flag_cycle_items(cycles)
+        return cycles
+    
+    def _flag_cycle_items(self, cycles):
+        """Flag the items of the given cycles of item keys; hanging references are skipped."""
+        for cycle in cycles:
+            for item_key in cycle:
+                item = self.spec_items.get(item_key)
+                if item is not None:
+                    item.in_circular_dependency = True
+        
+        # Circular items are classified differently now
+        if cycles:
+            self._classification = None
+    
+    def trace_chain_keys(self, item_key, direction='both'):
+        """Return the keys of the items the trace chain of an item shows."""
+        keys = {item_key}
+        for relationship_map, link_direction in ((self.covering_map, 'outgoing'), (self.covered_by_map, 'incoming')):
+            if direction not in ('both', link_direction):
+                continue
+            stack = [item_key]
+            seen = {item_key}
+            while stack:
+                for linked_key in relationship_map.get(stack.pop(), ()):
+                    if linked_key not in seen:
+                        seen.add(linked_key)
+                        stack.append(linked_key)
+            keys |= seen
+        return keys
+    
+    def check_unwanted_coverage(self, items=None):
+        """Check the items for coverage links that the trace rules do not allow."""
+        if items is None:
+            items = list(self.spec_items.values())
         coverage_rules = self._build_coverage_rules(items)
         for item in items:
             self.analyze_unwanted_coverage(item, coverage_rules)
+    
+    def _build_item_graph(self, items):
+        """Build a graph from a list of SpecItem objects or item dictionaries."""
+        item_map = {}
+        adjacency = {}
+        for item in items:
+            # Some items might be dictionaries instead of SpecItem objects
+            if isinstance(item, dict):
+                item_key = f"{item['id']}~{item.get('version', '1')}"
+                item_covers = item.get('covers', [])
+            else:
+                item_key = f"{item.id}~{item.version}"
+                item_covers = item.covers
+            
+            item_map[item_key] = item
+            adjacency[item_key] = [self._covered_key(covered) for covered in item_covers]
         
+        return TraceGraph.from_maps(item_map, adjacency, {})
+    
+    @staticmethod
+    def _covered_key(covered):
+        """Return the item key of a covers entry."""
+        if isinstance(covered, Mapping):
+            return f"{covered['id']}~{covered.get('version', '1')}"
+        return f"{covered.id}~{covered.version}"
+    
     def _build_coverage_rules(self, items):
         """Build a map of valid coverage rules based on artifact types.
         
@@ -356,18 +699,18 @@ class TraceAnalyzer:
         if not item_doctype:
             return
             
-        for covered in item.covers:
-            # Get the covered item's information
-            if isinstance(covered, dict):
-                covered_id = covered.get('id')
-                covered_version = covered.get('version', '1')
-            else:
-                covered_id = covered.id
-                covered_version = covered.version
-                
-            covered_key = f"{covered_id}~{covered_version}"
-            covered_item = self.spec_items.get(covered_key)
-            
+        graph = self.graph
+        node = graph.node(getattr(item, 'key', None))
+        if node is not None and graph.items[node] is item:
+            # Known item: follow the integer links
+            covered_links = [(graph.keys[covered], graph.items[covered]) for covered in graph.successors(node)]
+        else:
+            covered_links = []
+            for covered in item.covers:
+                covered_key = self._covered_key(covered)
+                covered_links.append((covered_key, self.spec_items.get(covered_key)))
+        
+        for covered_key, covered_item in covered_links:
             if covered_item and hasattr(covered_item, 'doctype') and covered_item.doctype:
                 covered_doctype = covered_item.doctype.lower()
                 
@@ -0,0 +1,143 @@
+"""Run many trace lookups against one loaded model."""
+import io
+import re
+import json
+import multiprocessing
+from contextlib import redirect_stdout
+from typing import Callable, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from oft_trace.profiling import detach
+from oft_trace.reporter import json_trace_chain
+
+BATCH_FORMATS = ('ndjson', 'text')
+QUERY_OPTIONS = ('version', 'doctype', 'direction')
+DIRECTIONS = ('both', 'incoming', 'outgoing')
+
+class BatchQuery(NamedTuple):
+    """One line of a batch file: an item ID with optional filters."""
+    spec_id: str
+    version: Optional[str] = None
+    doctype: Optional[str] = None
+    direction: Optional[str] = None
+    line: int = 0
+
+def parse_batch_queries(lines: Iterable[str]) -> List[BatchQuery]:
+    """Parse batch lines of the form 'ID [version=V] [doctype=T] [direction=D]'.
+
+    Blank lines and lines starting with # are skipped. Raises ValueError for a
+    malformed line.
+    """
+    queries = []
+    for line_number, line in enumerate(lines, 1):
+        fields = line.split()
+        if not fields or fields[0].startswith('#'):
+            continue
+
+        options = {}
+        for field in fields[1:]:
+            key, separator, value = field.partition("=")
+            if not separator or key not in QUERY_OPTIONS:
+                raise ValueError(f"line {line_number}: expected {', '.join(QUERY_OPTIONS)} as key=value, got '{field}'")
+            options[key] = value
+        if options.get('direction', 'both') not in DIRECTIONS:
+            raise ValueError(f"line {line_number}: direction must be one of: {', '.join(DIRECTIONS)}")
+
+        queries.append(BatchQuery(fields[0], line=line_number, **options))
+    return queries
+
+def resolve_query(analyzer, query: BatchQuery) -> Optional[str]:
+    """Return the item key a query refers to, or None.
+
+    An ID without a version may also be a full item key such as req-1~2.
+    """
+    item_key = analyzer.get_item_by_id(query.spec_id, query.doctype, query.version)
+    if item_key is None and not query.version and '~' in query.spec_id:
+        spec_id, version = query.spec_id.rsplit('~', 1)
+        item_key = analyzer.get_item_by_id(spec_id, query.doctype, version)
+    return item_key
+
+def _query_description(query: BatchQuery) -> dict:
+    """Return the query as it appears in the results."""
+    description = {"id": query.spec_id}
+    for option in QUERY_OPTIONS:
+        if getattr(query, option):
+            description[option] = getattr(query, option)
+    return description
+
+def text_trace_chain(analyzer, item_key: str, direction: str = 'both', render_mode: str = 'auto') -> str:
+    """Return the plain text trace chain of an item in the style of trace --output."""
+    from oft_trace.visualizer import create_ascii_chain, choose_render_mode
+
+    output = io.StringIO()
+    with redirect_stdout(output):
+        header = f"TRACE CHAIN FOR {item_key}"
+        print("=" * 80)
+        print(f"{header:^80}")
+        print("=" * 80 + "\n")
+
+        # Shared subtrees are expanded once in DAG mode
+        rendered = set() if choose_render_mode(analyzer, item_key, direction, render_mode) == 'dag' else None
+        if rendered is not None:
+            print("Shared subtrees are shown once; later occurrences refer back to them.\n")
+        create_ascii_chain(analyzer, item_key, direction=direction, rendered=rendered)
+
+    return output.getvalue()
+
+def render_query(analyzer, query: BatchQuery, format: str = 'ndjson', direction: str = 'both',
+                 render_mode: str = 'auto', indent: Optional[int] = None) -> Tuple[Optional[str], str]:
+    """Resolve and render one query.
+
+    Returns the item key, or None if the item was not found, and the result:
+    a JSON record with the query and its trace chain (or an error), or the
+    plain text trace chain.
+    """
+    item_key = resolve_query(analyzer, query)
+    direction = query.direction or direction
+
+    if format == 'text':
+        if item_key is None:
+            return None, f"Error: Item {query.spec_id} not found in the aspec file.\n"
+        return item_key, text_trace_chain(analyzer, item_key, direction, render_mode)
+
+    record = {"query": _query_description(query), "key": item_key}
+    if item_key is None:
+        record["error"] = f"Item {query.spec_id} not found"
+    else:
+        record["trace"] = json_trace_chain(analyzer, item_key, direction)
+    return item_key, json.dumps(record, indent=indent, separators=(',', ':') if indent is None else None)
+
+def result_file_name(query: BatchQuery, item_key: Optional[str], suffix: str) -> str:
+    """Return a file name for the result of a query that is safe on all platforms."""
+    name = item_key or query.spec_id
+    return re.sub(r'[^\w.~-]', '_', name) + suffix
+
+# Function and analyzer of the running parallel_map, inherited by forked workers
+_shared = {}
+
+def _call_shared(item):
+    return _shared['function'](_shared['analyzer'], item)
+
+def parallel_map(function: Callable, analyzer, items: List, jobs: Optional[int] = None,
+                 chunksize: int = 16) -> Iterator:
+    """Yield function(analyzer, item) for every item, in order.
+
+    Items are processed one by one unless jobs asks for more than one
+    process. Then they are processed in forked worker processes that inherit
+    the prepared analyzer, so the model is never pickled; only the items and
+    results travel between processes. Platforms without fork process the
+    items one by one.
+    """
+    jobs = min(len(items), jobs or 1)
+    if jobs <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+        for item in items:
+            yield function(analyzer, item)
+        return
+
+    # Build the lazy lookup structures once, before the workers copy them
+    analyzer.prepare()
+    _shared.update(function=function, analyzer=analyzer)
+    try:
+        with multiprocessing.get_context('fork').Pool(jobs, initializer=detach) as pool:
+            yield from pool.imap(_call_shared, items, chunksize)
+    finally:
+        _shared.clear()
@@ -0,0 +1,138 @@
+"""On-disk cache of parsed and analyzed aspec models."""
+import os
+import pickle
+import hashlib
+import tempfile
+from typing import Optional, Tuple
+
+# Bump when the layout of the cached model changes
+CACHE_FORMAT = 6
+CACHE_SUFFIX = ".oftcache"
+SOURCE_SUFFIX = ".oftsource"
+DEFAULT_CACHE_MAX_SIZE = 512 * 1024 * 1024  # 512 MB
+
+def default_cache_dir() -> str:
+    """Return the cache directory, honouring OFT_TRACE_CACHE_DIR and XDG_CACHE_HOME."""
+    if os.environ.get("OFT_TRACE_CACHE_DIR"):
+        return os.environ["OFT_TRACE_CACHE_DIR"]
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "oft-trace")
+
+def file_fingerprint(aspec_file: str, chunk_size: int = 1024 * 1024) -> Tuple[int, int, str]:
+    """Return the (size, mtime_ns, content hash) fingerprint of a file."""
+    stat = os.stat(aspec_file)
+    digest = hashlib.blake2b(digest_size=20)
+    with open(aspec_file, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return stat.st_size, stat.st_mtime_ns, digest.hexdigest()
+
+def cache_path(fingerprint, cache_dir: Optional[str] = None) -> str:
+    """Return the path of the cache entry for a file fingerprint."""
+    key = hashlib.blake2b(repr((CACHE_FORMAT, fingerprint)).encode(), digest_size=20)
+    return os.path.join(cache_dir or default_cache_dir(), key.hexdigest() + CACHE_SUFFIX)
+
+def load_cached_model(fingerprint, cache_dir: Optional[str] = None):
+    """Load a cached model for the fingerprint, or return None on a miss."""
+    path = cache_path(fingerprint, cache_dir)
+    try:
+        with open(path, 'rb') as f:
+            cache_format, cached_fingerprint, model = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, ValueError, TypeError, AttributeError, ImportError):
+        return None
+
+    if cache_format != CACHE_FORMAT or cached_fingerprint != fingerprint:
+        return None
+
+    # Refresh the entry so eviction drops the least recently used entries first
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+    return model
+
+def store_cached_model(fingerprint, model, cache_dir: Optional[str] = None, max_size: Optional[int] = DEFAULT_CACHE_MAX_SIZE):
+    """Store a model in the cache and evict old entries beyond max_size bytes."""
+    path = cache_path(fingerprint, cache_dir)
+    directory = os.path.dirname(path)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        # Write to a temporary file first so readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((CACHE_FORMAT, fingerprint, model), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    except (OSError, pickle.PicklingError, RecursionError, TypeError):
+        # The cache is an optimization only; models that cannot be pickled are not cached
+        return
+
+    if max_size is not None:
+        prune_cache(directory, max_size)
+
+def source_path(aspec_file: str, cache_dir: Optional[str] = None) -> str:
+    """Return the path of the file remembering the last cached fingerprint of an input file."""
+    key = hashlib.blake2b(os.path.abspath(aspec_file).encode(), digest_size=20)
+    return os.path.join(cache_dir or default_cache_dir(), key.hexdigest() + SOURCE_SUFFIX)
+
+def remember_fingerprint(aspec_file: str, fingerprint, cache_dir: Optional[str] = None):
+    """Remember the fingerprint of the latest cached model of an input file."""
+    path = source_path(aspec_file, cache_dir)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            pickle.dump((CACHE_FORMAT, fingerprint), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass
+
+def previous_fingerprint(aspec_file: str, cache_dir: Optional[str] = None):
+    """Return the fingerprint remembered for an input file, or None."""
+    try:
+        with open(source_path(aspec_file, cache_dir), 'rb') as f:
+            cache_format, fingerprint = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, ValueError, TypeError):
+        return None
+    return fingerprint if cache_format == CACHE_FORMAT else None
+
+def prune_cache(cache_dir: Optional[str] = None, max_size: int = DEFAULT_CACHE_MAX_SIZE) -> int:
+    """Delete least recently used entries until the cache fits in max_size bytes.
+
+    Returns the number of removed entries.
+    """
+    cache_dir = cache_dir or default_cache_dir()
+    try:
+        names = os.listdir(cache_dir)
+    except OSError:
+        return 0
+
+    entries = []
+    for name in names:
+        if not name.endswith(CACHE_SUFFIX):
+            continue
+        path = os.path.join(cache_dir, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    # Oldest entries first
+    entries.sort()
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size, path in entries:
+        if total <= max_size:
+            break
+        try:
+            os.unlink(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+
+    return removed
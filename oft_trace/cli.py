@@ -2,27 +2,137 @@
 import os
 import sys
 import time
-import json  # Add this import for JSON serialization
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 import typer
-from rich.console import Console
-from rich.progress import Progress, SpinnerColumn, TextColumn, BarColumn, TimeElapsedColumn
-from rich.panel import Panel
 
-# Use absolute imports instead of relative
-from oft_trace.parser import parse_aspec_file
-from oft_trace.analyzer import TraceAnalyzer
-from oft_trace.reporter import print_report_header, display_coverage_summary, analyze_and_display_failure, generate_json_report
-from oft_trace.visualizer import create_rich_tree, create_ascii_chain
+# Use absolute imports instead of relative. Rich and the analysis modules are
+# imported inside the commands that use them to keep startup fast.
+from oft_trace.console import console, get_console
 
 app = typer.Typer(help="Analyze and display trace chains for OpenFastTrace specification items")
-console = Console()
+
+# Exit code of the gating commands when the report fails the gate; 1 is used for errors
+GATE_FAILED_EXIT_CODE = 3
+
+@app.callback()
+def main_options(
+    ctx: typer.Context,
+    profile: bool = typer.Option(False, "--profile",
+                               help="Print wall time, CPU time, counts and peak memory per analysis stage"),
+    profile_json: Optional[str] = typer.Option(None, "--profile-json",
+                                             help="Write the stage profile as JSON to this file"),
+    profile_cprofile: Optional[str] = typer.Option(None, "--profile-cprofile",
+                                                 help="Write cProfile statistics of the command to this file"),
+    profile_memory: bool = typer.Option(True, "--profile-memory/--no-profile-memory",
+                                      help="Trace memory per stage while profiling (slows the command down)")
+):
+    """
+    Analyze and display trace chains for OpenFastTrace specification items.
+    """
+    if not (profile or profile_json or profile_cprofile):
+        return
+
+    from oft_trace.profiling import Profiler, activate
+
+    profiler = Profiler(ctx.invoked_subcommand, trace_memory=profile_memory).start()
+    activate(profiler)
+
+    cprofile = None
+    if profile_cprofile:
+        import cProfile
+        cprofile = cProfile.Profile()
+        cprofile.enable()
+
+    # Report once the command has finished, also when it exits early
+    def report_profile():
+        if cprofile:
+            cprofile.disable()
+            cprofile.dump_stats(profile_cprofile)
+        profiler.finish()
+        activate(None)
+
+        if profile:
+            profiler.print_table(get_console())
+        if profile_json:
+            profiler.write_json(profile_json)
+            console.print(f"[green]Profile written to {profile_json}[/]")
+        if profile_cprofile:
+            console.print(f"[green]cProfile statistics written to {profile_cprofile}[/]")
+
+    ctx.call_on_close(report_profile)
+
+def resolve_aspec_inputs(aspec_file, inputs=None):
+    """Expand the aspec file argument and --input options into a list of files, or exit."""
+    from oft_trace.pipeline import find_aspec_files
+    
+    paths = [aspec_file, *(inputs or [])]
+    for path in paths:
+        if not find_aspec_files([path]):
+            console.print(f"[bold red]Error:[/] Aspec file '{path}' not found.")
+            raise typer.Exit(code=1)
+    
+    return find_aspec_files(paths)
+
+def load_aspec_with_progress(aspec_files, use_cache=True, cache_dir=None, cache_max_size=None, jobs=None,
+                             trace_chain=None, track_changes=False):
+    """Load aspec files into an analysis pipeline while showing a progress spinner.
+    
+    With trace_chain as (spec_id, doctype, version, direction), only that
+    chain is loaded if the aspec file has an up-to-date offset index. With
+    track_changes, the pipeline can be updated in place even without the cache.
+    """
+    from rich.progress import Progress, SpinnerColumn, TextColumn, BarColumn, TimeElapsedColumn
+    from oft_trace.pipeline import AnalysisPipeline
+    
+    if len(aspec_files) == 1:
+        console.print(f"Loading data from [cyan]{os.path.basename(aspec_files[0])}[/]...")
+    else:
+        console.print(f"Loading data from [cyan]{len(aspec_files)}[/] aspec files...")
+    start_time = time.time()
+    
+    pipeline = AnalysisPipeline(
+        aspec_files,
+        use_cache=use_cache,
+        cache_dir=cache_dir,
+        cache_max_size=cache_max_size * 1024 * 1024 if cache_max_size is not None else None,
+        jobs=jobs,
+        track_changes=track_changes
+    )
+    
+    with Progress(
+        SpinnerColumn(),
+        TextColumn("[progress.description]{task.description}"),
+        BarColumn(),
+        TimeElapsedColumn(),
+        console=get_console()
+    ) as progress:
+        task = progress.add_task("Parsing aspec file...", total=None)
+        indexed = trace_chain is not None and pipeline.parse_trace_chain(*trace_chain)
+        spec_items = pipeline.parse()[0]
+        progress.update(task, completed=True)
+    
+    elapsed = time.time() - start_time
+    if indexed:
+        console.print(f"Loaded [green]{len(spec_items)}[/] items of the trace chain from the offset index "
+                      f"in [cyan]{elapsed:.2f}s[/]")
+    else:
+        console.print(f"Loaded [green]{len(spec_items)}[/] items in [cyan]{elapsed:.2f}s[/]")
+    
+    # Items defined in more than one input file are only kept once
+    if pipeline.duplicates:
+        console.print(f"[yellow]Warning:[/] {len(pipeline.duplicates)} duplicate items across input files, keeping the first definition:")
+        for item_key, kept_file, duplicate_file in pipeline.duplicates[:10]:
+            console.print(f"  {item_key}: {duplicate_file} (kept {kept_file})")
+        if len(pipeline.duplicates) > 10:
+            console.print(f"  ... and {len(pipeline.duplicates) - 10} more")
+    
+    return pipeline
 
 @app.command()
 def trace(
-    aspec_file: str = typer.Argument(..., help="Path to the aspec XML file"),
+    aspec_file: str = typer.Argument(..., help="Path to the aspec XML file, a directory of aspec files or a glob pattern"),
     spec_id: Optional[str] = typer.Argument(None, help="ID of the specification item to analyze (if omitted, shows overview)"),
     version: Optional[str] = typer.Option(None, "--version", "-v", help="Specific version of the item to trace"),
     doctype: Optional[str] = typer.Option(None, "--doctype", "-t", help="Filter by document type"),
@@ -33,41 +143,55 @@ def trace(
     show_details: bool = typer.Option(True, "--details/--no-details", 
                                     help="Show detailed trace information"),
     show_visual: bool = typer.Option(True, "--visual/--no-visual", 
-                                   help="Show visual representation of trace chain")
+                                   help="Show visual representation of trace chain"),
+    render_mode: str = typer.Option("auto", "--render-mode", "-r",
+                                  help="Render shared subtrees in full or once (dag); auto switches to dag for large chains"),
+    use_cache: bool = typer.Option(True, "--cache/--no-cache",
+                                 help="Reuse the cached model of an unchanged aspec file"),
+    cache_dir: Optional[str] = typer.Option(None, "--cache-dir",
+                                          help="Directory for cached models (default: ~/.cache/oft-trace)"),
+    cache_max_size: int = typer.Option(512, "--cache-max-size",
+                                     help="Maximum cache size in MB before the oldest entries are evicted"),
+    inputs: Optional[List[str]] = typer.Option(None, "--input", "-i",
+                                             help="Additional aspec file, directory or glob pattern (repeatable)"),
+    jobs: Optional[int] = typer.Option(None, "--jobs", "-j",
+                                     help="Number of processes for parsing several files (default: CPU count)"),
+    use_index: bool = typer.Option(True, "--index/--no-index",
+                                 help="Load only the trace chain through the offset index of the aspec file, if it is up to date")
 ):
     """
     Analyze and display the trace chain for a specification item in an aspec XML file.
     
-    If spec_id is not provided, shows an overview of the entire report.
+    If spec_id is not provided, shows an overview of the entire report. With
+    an offset index next to the aspec file (see the index command), a single
+    item's chain is loaded without parsing the rest of the report.
     """
-    if not os.path.exists(aspec_file):
-        console.print(f"[bold red]Error:[/] Aspec file '{aspec_file}' not found.")
-        raise typer.Exit(code=1)
+    from rich.panel import Panel
+    from oft_trace.reporter import print_report_header, display_coverage_summary
+    from oft_trace.visualizer import create_rich_tree, create_ascii_chain, choose_render_mode, RENDER_MODES
+    from oft_trace.profiling import begin_stage
+    
+    aspec_files = resolve_aspec_inputs(aspec_file, inputs)
     
     if direction not in ["both", "incoming", "outgoing"]:
         console.print(f"[bold red]Error:[/] Direction must be one of: both, incoming, outgoing")
         raise typer.Exit(code=1)
     
-    # Load and parse the aspec file
-    console.print(f"Loading data from [cyan]{os.path.basename(aspec_file)}[/]...")
-    start_time = time.time()
-    
-    with Progress(
-        SpinnerColumn(),
-        TextColumn("[progress.description]{task.description}"),
-        BarColumn(),
-        TimeElapsedColumn(),
-        console=console
-    ) as progress:
-        task = progress.add_task("Parsing aspec file...", total=None)
-        spec_items, id_map, covering_map, covered_by_map, broken_chains = parse_aspec_file(aspec_file)
-        progress.update(task, completed=True)
-    
-    elapsed = time.time() - start_time
-    console.print(f"Loaded [green]{len(spec_items)}[/] items in [cyan]{elapsed:.2f}s[/]")
+    if render_mode not in RENDER_MODES:
+        console.print(f"[bold red]Error:[/] Render mode must be one of: {', '.join(RENDER_MODES)}")
+        raise typer.Exit(code=1)
     
-    # Create analyzer
-    analyzer = TraceAnalyzer(spec_items, id_map, covering_map, covered_by_map, broken_chains, aspec_file)
+    # Load and parse the aspec file
+    trace_chain = (spec_id, doctype, version, direction) if spec_id and use_index else None
+    pipeline = load_aspec_with_progress(aspec_files, use_cache, cache_dir, cache_max_size, jobs, trace_chain)
+    analyzer = pipeline.analyzer
+    item_key = analyzer.get_item_by_id(spec_id, doctype, version) if spec_id else None
+    # Coverage types shown below depend on cycle detection; a single chain only needs its own cycles
+    if spec_id:
+        pipeline.cycles(analyzer.trace_chain_keys(item_key, direction) if item_key else ())
+    else:
+        pipeline.cycles()
+    begin_stage('render')
     
     # If output file is specified, redirect output
     original_stdout = None
@@ -80,9 +204,6 @@ def trace(
         print_report_header(aspec_file, bool(output_file))
         
         if spec_id:
-            # Find item by ID and optional doctype/version
-            item_key = analyzer.get_item_by_id(spec_id, doctype, version)
-            
             if not item_key:
                 error_msg = f"Error: Item {spec_id}"
                 if version:
@@ -108,12 +229,19 @@ def trace(
             
             # Display visual representation
             if show_visual:
+                # Shared subtrees are expanded once in DAG mode
+                mode = choose_render_mode(analyzer, item_key, direction, render_mode)
+                rendered = set() if mode == 'dag' else None
                 if output_file:
                     print("\nVISUAL REPRESENTATION OF THE TRACE CHAIN\n")
-                    create_ascii_chain(analyzer, item_key, direction=direction)
+                    if rendered is not None:
+                        print("Shared subtrees are shown once; later occurrences refer back to them.\n")
+                    create_ascii_chain(analyzer, item_key, direction=direction, rendered=rendered)
                 else:
                     console.print("\n[bold]VISUAL REPRESENTATION OF THE TRACE CHAIN[/]")
-                    tree = create_rich_tree(analyzer, item_key, direction=direction)
+                    if rendered is not None:
+                        console.print("[dim]Shared subtrees are shown once; later occurrences refer back to them.[/]")
+                    tree = create_rich_tree(analyzer, item_key, direction=direction, rendered=rendered)
                     console.print(tree)
         else:
             # Display overview of all items
@@ -129,41 +257,43 @@ def trace(
 
 @app.command()
 def list_items(
-    aspec_file: str = typer.Argument(..., help="Path to the aspec XML file"),
+    aspec_file: str = typer.Argument(..., help="Path to the aspec XML file, a directory of aspec files or a glob pattern"),
     doctype: Optional[str] = typer.Option(None, "--doctype", "-t", help="Filter by document type"),
     status: Optional[str] = typer.Option(None, "--status", "-s", help="Filter by status"),
     coverage: Optional[str] = typer.Option(None, "--coverage", "-c", 
                                          help="Filter by coverage status (COVERED, UNCOVERED, ORPHANED, SHALLOW, OUTDATED)"),
     output_file: Optional[str] = typer.Option(None, "--output", "-o", 
-                                            help="Path to output file (if not specified, print to console)")
+                                            help="Path to output file (if not specified, print to console)"),
+    use_cache: bool = typer.Option(True, "--cache/--no-cache",
+                                 help="Reuse the cached model of an unchanged aspec file"),
+    cache_dir: Optional[str] = typer.Option(None, "--cache-dir",
+                                          help="Directory for cached models (default: ~/.cache/oft-trace)"),
+    cache_max_size: int = typer.Option(512, "--cache-max-size",
+                                     help="Maximum cache size in MB before the oldest entries are evicted"),
+    inputs: Optional[List[str]] = typer.Option(None, "--input", "-i",
+                                             help="Additional aspec file, directory or glob pattern (repeatable)"),
+    jobs: Optional[int] = typer.Option(None, "--jobs", "-j",
+                                     help="Number of processes for parsing several files (default: CPU count)")
 ):
     """
     List all specification items in the aspec file with improved filtering.
     """
-    if not os.path.exists(aspec_file):
-        console.print(f"[bold red]Error:[/] Aspec file '{aspec_file}' not found.")
-        raise typer.Exit(code=1)
-    
-    # Load and parse the aspec file
-    console.print(f"Loading data from [cyan]{os.path.basename(aspec_file)}[/]...")
-    start_time = time.time()
+    from oft_trace.profiling import begin_stage
     
-    with Progress(
-        SpinnerColumn(),
-        TextColumn("[progress.description]{task.description}"),
-        BarColumn(),
-        TimeElapsedColumn(),
-        console=console
-    ) as progress:
-        task = progress.add_task("Parsing aspec file...", total=None)
-        spec_items, id_map, covering_map, covered_by_map, broken_chains = parse_aspec_file(aspec_file)
-        progress.update(task, completed=True)
+    aspec_files = resolve_aspec_inputs(aspec_file, inputs)
     
-    elapsed = time.time() - start_time
-    console.print(f"Loaded [green]{len(spec_items)}[/] items in [cyan]{elapsed:.2f}s[/]")
+    # Load and parse the aspec file
+    pipeline = load_aspec_with_progress(aspec_files, use_cache, cache_dir, cache_max_size, jobs)
+    analyzer = pipeline.analyzer
+    spec_items = analyzer.spec_items
     
-    # Create analyzer
-    analyzer = TraceAnalyzer(spec_items, id_map, covering_map, covered_by_map, broken_chains, aspec_file)
+    # Coverage types shown below depend on cycle detection, but only for the listed items
+    coverage_type = coverage if coverage in ["COVERED", "UNCOVERED", "ORPHANED", "SHALLOW", "OUTDATED"] else None
+    item_keys = analyzer.find_items(doctype=doctype, status=status)
+    pipeline.cycles(item_keys)
+    if coverage_type:
+        item_keys = analyzer.find_items(doctype=doctype, status=status, coverage_type=coverage_type)
+    begin_stage('render')
     
     # If output file is specified, redirect output
     original_stdout = None
@@ -172,31 +302,7 @@ def list_items(
         sys.stdout = open(output_file, 'w')
     
     try:
-        # Filter items based on criteria
-        filtered_items = []
-        for item_key, item in spec_items.items():
-            # Filter by doctype
-            if doctype and item.doctype != doctype:
-                continue
-            
-            # Filter by status
-            if status and (not hasattr(item, 'status') or item.status != status):
-                continue
-            
-            # Filter by coverage
-            if coverage:
-                if coverage == "COVERED" and item.coverage_type != "COVERED":
-                    continue
-                elif coverage == "UNCOVERED" and item.coverage_type != "UNCOVERED":
-                    continue
-                elif coverage == "ORPHANED" and item.coverage_type != "ORPHANED":
-                    continue
-                elif coverage == "SHALLOW" and item.coverage_type != "SHALLOW":
-                    continue
-                elif coverage == "OUTDATED" and item.coverage_type != "OUTDATED":
-                    continue
-            
-            filtered_items.append(item)
+        filtered_items = [spec_items[item_key] for item_key in item_keys]
         
         # Display items
         if not filtered_items:
@@ -298,14 +404,28 @@ def list_items(
 
 @app.command()
 def trace_failures(
-    aspec_file: str = typer.Argument(..., help="Path to the aspec XML file"),
+    aspec_file: str = typer.Argument(..., help="Path to the aspec XML file, a directory of aspec files or a glob pattern"),
     output_file: Optional[str] = typer.Option(None, "--output", "-o", 
                                              help="Path to output file (if not specified, print to console)"),
     limit: Optional[int] = typer.Option(None, "--limit", "-l", 
                                       help="Limit the number of failures to analyze"),
     include_covered: bool = typer.Option(False, "--include-covered", "-a",
                                       help="Include all items including covered ones"),
-    format: str = typer.Option("text", "--format", "-f", help="Output format: text or json")
+    format: str = typer.Option("text", "--format", "-f", help="Output format: text, json or ndjson"),
+    compact: bool = typer.Option(False, "--compact",
+                               help="Write JSON without indentation"),
+    render_mode: str = typer.Option("auto", "--render-mode", "-r",
+                                  help="Render shared subtrees in full or once (dag); auto switches to dag for large chains"),
+    use_cache: bool = typer.Option(True, "--cache/--no-cache",
+                                 help="Reuse the cached model of an unchanged aspec file"),
+    cache_dir: Optional[str] = typer.Option(None, "--cache-dir",
+                                          help="Directory for cached models (default: ~/.cache/oft-trace)"),
+    cache_max_size: int = typer.Option(512, "--cache-max-size",
+                                     help="Maximum cache size in MB before the oldest entries are evicted"),
+    inputs: Optional[List[str]] = typer.Option(None, "--input", "-i",
+                                             help="Additional aspec file, directory or glob pattern (repeatable)"),
+    jobs: Optional[int] = typer.Option(None, "--jobs", "-j",
+                                     help="Number of processes for parsing several files (default: CPU count) and rendering failures (default: 1)")
 ):
     """
     Analyze and report on all broken chains in the aspec file with improved clarity.
@@ -313,30 +433,24 @@ def trace_failures(
     This command identifies items with coverage issues and analyzes the reasons 
     for the failures in detail.
     """
-    if not os.path.exists(aspec_file):
-        console.print(f"[bold red]Error:[/] Aspec file '{aspec_file}' not found.")
-        raise typer.Exit(code=1)
-    
-    # Load and parse the aspec file
-    console.print(f"Loading data from [cyan]{os.path.basename(aspec_file)}[/]...")
-    start_time = time.time()
+    from oft_trace.reporter import print_report_header, render_failure, write_json_report, write_ndjson_report
+    from oft_trace.batch import parallel_map
+    from oft_trace.visualizer import RENDER_MODES
+    from oft_trace.profiling import begin_stage
     
-    with Progress(
-        SpinnerColumn(),
-        TextColumn("[progress.description]{task.description}"),
-        BarColumn(),
-        TimeElapsedColumn(),
-        console=console
-    ) as progress:
-        task = progress.add_task("Parsing aspec file...", total=None)
-        spec_items, id_map, covering_map, covered_by_map, broken_chains = parse_aspec_file(aspec_file)
-        progress.update(task, completed=True)
+    aspec_files = resolve_aspec_inputs(aspec_file, inputs)
     
-    elapsed = time.time() - start_time
-    console.print(f"Loaded [green]{len(spec_items)}[/] items in [cyan]{elapsed:.2f}s[/]")
+    if render_mode not in RENDER_MODES:
+        console.print(f"[bold red]Error:[/] Render mode must be one of: {', '.join(RENDER_MODES)}")
+        raise typer.Exit(code=1)
     
-    # Create analyzer
-    analyzer = TraceAnalyzer(spec_items, id_map, covering_map, covered_by_map, broken_chains, aspec_file)
+    # Load and parse the aspec file, then find the broken chains and cycles
+    pipeline = load_aspec_with_progress(aspec_files, use_cache, cache_dir, cache_max_size, jobs)
+    broken_chains = pipeline.classify()
+    pipeline.cycles()
+    analyzer = pipeline.analyzer
+    spec_items = analyzer.spec_items
+    begin_stage('render')
     
     # Get all items or just broken chains
     if include_covered:
@@ -348,16 +462,22 @@ def trace_failures(
     if limit and limit < len(items_to_analyze):
         items_to_analyze = items_to_analyze[:limit]
     
-    # JSON format handling
-    if format.lower() == "json":
-        json_report = generate_json_report(analyzer, items_to_analyze, include_covered)
+    # JSON format handling, streamed one item record at a time
+    if format.lower() in ("json", "ndjson"):
+        stream = open(output_file, 'w') if output_file else sys.stdout
+        try:
+            if format.lower() == "ndjson":
+                write_ndjson_report(analyzer, stream, items_to_analyze, include_covered)
+            else:
+                write_json_report(analyzer, stream, items_to_analyze, include_covered, compact)
+                if not output_file:
+                    stream.write("\n")
+        finally:
+            if output_file:
+                stream.close()
         
         if output_file:
-            with open(output_file, 'w') as f:
-                json.dump(json_report, f, indent=2)
             console.print(f"[green]JSON report saved to {output_file}[/]")
-        else:
-            print(json.dumps(json_report, indent=2))
         return
     
     # Default text format output
@@ -399,15 +519,20 @@ def trace_failures(
                 console.print(f"[yellow]Showing first {limit} items[/]")
             console.print("=" * 80)
         
-        # Analyze each failure
-        for i, item_key in enumerate(items_to_analyze):
+        # Render the failures in worker processes and write them in order
+        def render(analyzer, task):
+            item_key, index = task
             if include_covered or analyzer.spec_items[item_key].coverage_type != "COVERED":
-                analyze_and_display_failure(analyzer, item_key, i+1, len(items_to_analyze), bool(output_file))
-                
-                if output_file:
-                    print("\n" + "-" * 80 + "\n")
-                else:
-                    console.print("\n" + "-" * 80 + "\n")
+                return render_failure(analyzer, item_key, index, len(items_to_analyze), bool(output_file), render_mode)
+            return ""
+        
+        # Forked workers must not inherit output that is still buffered
+        stream = sys.stdout if output_file else get_console().file
+        stream.flush()
+        tasks = [(item_key, i + 1) for i, item_key in enumerate(items_to_analyze)]
+        for text in parallel_map(render, analyzer, tasks, jobs):
+            stream.write(text)
+        stream.flush()
     
     finally:
         # Restore stdout if it was redirected
@@ -417,6 +542,721 @@ def trace_failures(
             console.print(f"[green]Analysis written to {output_file}[/]")
 
 
+@app.command()
+def batch(
+    aspec_file: str = typer.Argument(..., help="Path to the aspec XML file, a directory of aspec files or a glob pattern"),
+    queries_file: str = typer.Argument("-", help="File with one 'ID [version=V] [doctype=T] [direction=D]' per line, or - for stdin"),
+    format: str = typer.Option("ndjson", "--format", "-f", help="Output format: ndjson or text"),
+    output_file: Optional[str] = typer.Option(None, "--output", "-o",
+                                            help="Path to output file (if not specified, print to console)"),
+    output_dir: Optional[str] = typer.Option(None, "--output-dir",
+                                           help="Write one file per query into this directory instead of a stream"),
+    direction: str = typer.Option("both", "--direction", "-d",
+                                 help="Direction of links to trace: both, incoming, or outgoing"),
+    render_mode: str = typer.Option("auto", "--render-mode", "-r",
+                                  help="Render shared subtrees in full or once (dag); auto switches to dag for large chains"),
+    use_cache: bool = typer.Option(True, "--cache/--no-cache",
+                                 help="Reuse the cached model of an unchanged aspec file"),
+    cache_dir: Optional[str] = typer.Option(None, "--cache-dir",
+                                          help="Directory for cached models (default: ~/.cache/oft-trace)"),
+    cache_max_size: int = typer.Option(512, "--cache-max-size",
+                                     help="Maximum cache size in MB before the oldest entries are evicted"),
+    inputs: Optional[List[str]] = typer.Option(None, "--input", "-i",
+                                             help="Additional aspec file, directory or glob pattern (repeatable)"),
+    jobs: Optional[int] = typer.Option(None, "--jobs", "-j",
+                                     help="Number of processes for parsing several files (default: CPU count) and rendering results (default: 1)")
+):
+    """
+    Trace many specification items against one loaded model.
+    
+    Each line of the queries file names one item; lines starting with # are
+    ignored. Results are written in input order as NDJSON (one trace chain per
+    line) or as plain text trace chains, or as one file per query.
+    """
+    from functools import partial
+    from oft_trace.batch import BATCH_FORMATS, DIRECTIONS, parse_batch_queries, render_query, result_file_name, parallel_map
+    from oft_trace.visualizer import RENDER_MODES
+    from oft_trace.profiling import begin_stage
+    
+    if format not in BATCH_FORMATS:
+        console.print(f"[bold red]Error:[/] Format must be one of: {', '.join(BATCH_FORMATS)}")
+        raise typer.Exit(code=1)
+    
+    if direction not in DIRECTIONS:
+        console.print(f"[bold red]Error:[/] Direction must be one of: both, incoming, outgoing")
+        raise typer.Exit(code=1)
+    
+    if render_mode not in RENDER_MODES:
+        console.print(f"[bold red]Error:[/] Render mode must be one of: {', '.join(RENDER_MODES)}")
+        raise typer.Exit(code=1)
+    
+    # Keep stdout for the results when they are streamed there
+    if not output_file and not output_dir:
+        get_console().stderr = True
+    
+    try:
+        if queries_file == "-":
+            queries = parse_batch_queries(sys.stdin)
+        else:
+            with open(queries_file, 'r', encoding='utf-8') as f:
+                queries = parse_batch_queries(f)
+    except (OSError, ValueError) as e:
+        console.print(f"[bold red]Error:[/] Cannot read queries from {queries_file}: {e}")
+        raise typer.Exit(code=1)
+    
+    aspec_files = resolve_aspec_inputs(aspec_file, inputs)
+    pipeline = load_aspec_with_progress(aspec_files, use_cache, cache_dir, cache_max_size, jobs)
+    pipeline.cycles()
+    analyzer = pipeline.analyzer
+    
+    # One file per query holds indented JSON, the stream one record per line
+    render = partial(render_query, format=format, direction=direction, render_mode=render_mode,
+                     indent=2 if output_dir else None)
+    
+    start_time = time.time()
+    begin_stage('render').count(queries=len(queries))
+    results = parallel_map(render, analyzer, queries, jobs)
+    found = 0
+    
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+        suffix = '.json' if format == 'ndjson' else '.txt'
+        for query, (item_key, result) in zip(queries, results):
+            if item_key is None:
+                console.print(f"[yellow]Warning:[/] line {query.line}: Item {query.spec_id} not found")
+                continue
+            found += 1
+            with open(os.path.join(output_dir, result_file_name(query, item_key, suffix)), 'w', encoding='utf-8') as f:
+                f.write(result if format == 'text' else result + "\n")
+    else:
+        stream = open(output_file, 'w', encoding='utf-8') if output_file else sys.stdout
+        try:
+            for item_key, result in results:
+                found += item_key is not None
+                stream.write(result + "\n")
+        finally:
+            if output_file:
+                stream.close()
+    
+    elapsed = time.time() - start_time
+    console.print(f"Traced [green]{found}[/] of [cyan]{len(queries)}[/] queries in [cyan]{elapsed:.2f}s[/]")
+    if output_file or output_dir:
+        console.print(f"[green]Batch results written to {output_file or output_dir}[/]")
+
+
+@app.command()
+def what_if(
+    aspec_file: str = typer.Argument(..., help="Path to the aspec XML file, a directory of aspec files or a glob pattern"),
+    add_items: Optional[List[str]] = typer.Option(None, "--add-item",
+                                                help="Add a new item, given as DOCTYPE:ID~VERSION (repeatable)"),
+    add_links: Optional[List[str]] = typer.Option(None, "--add-link",
+                                                help="Let SOURCE cover TARGET, given as SOURCE:TARGET (repeatable)"),
+    remove_links: Optional[List[str]] = typer.Option(None, "--remove-link",
+                                                   help="Drop the link from SOURCE to TARGET, given as SOURCE:TARGET (repeatable)"),
+    bumps: Optional[List[str]] = typer.Option(None, "--bump",
+                                            help="Give an item the next version, so links to it become outdated (repeatable)"),
+    removes: Optional[List[str]] = typer.Option(None, "--remove", help="Remove an item (repeatable)"),
+    format: str = typer.Option("text", "--format", "-f", help="Output format: text or json"),
+    output_file: Optional[str] = typer.Option(None, "--output", "-o",
+                                            help="Path to output file (if not specified, print to console)"),
+    use_cache: bool = typer.Option(True, "--cache/--no-cache",
+                                 help="Reuse the cached model of an unchanged aspec file"),
+    cache_dir: Optional[str] = typer.Option(None, "--cache-dir",
+                                          help="Directory for cached models (default: ~/.cache/oft-trace)"),
+    cache_max_size: int = typer.Option(512, "--cache-max-size",
+                                     help="Maximum cache size in MB before the oldest entries are evicted"),
+    inputs: Optional[List[str]] = typer.Option(None, "--input", "-i",
+                                             help="Additional aspec file, directory or glob pattern (repeatable)"),
+    jobs: Optional[int] = typer.Option(None, "--jobs", "-j",
+                                     help="Number of processes for parsing several files (default: CPU count)")
+):
+    """
+    Show how coverage would change after hypothetical edits.
+    
+    Shallow and deep coverage are recomputed from the links of the model, and
+    each edit re-evaluates only the items above the ones it changes. Items are
+    given as ID~VERSION or as an ID. Edits are applied in this order: added
+    items, added links, removed links, version bumps, removed items. The
+    report files are not modified.
+    """
+    from oft_trace.coverage import CoverageEngine
+    from oft_trace.models import SpecItem
+    from oft_trace.profiling import begin_stage, profile_stage
+    
+    if format not in ("text", "json"):
+        console.print("[bold red]Error:[/] Format must be one of: text, json")
+        raise typer.Exit(code=1)
+    
+    # Keep stdout for the JSON report when it is printed there
+    if format == "json" and not output_file:
+        get_console().stderr = True
+    
+    aspec_files = resolve_aspec_inputs(aspec_file, inputs)
+    pipeline = load_aspec_with_progress(aspec_files, use_cache, cache_dir, cache_max_size, jobs)
+    spec_items = pipeline.analyzer.spec_items
+    
+    with profile_stage('coverage') as stage:
+        engine = CoverageEngine(spec_items)
+        stage.count(items=len(engine.nodes))
+    
+    def item_key(text):
+        if text in engine.nodes:
+            return text
+        keys = engine.by_id.get(text)
+        if not keys:
+            raise ValueError(f"Item {text} not found")
+        return keys[0]
+    
+    def link(text, hanging=False):
+        source, separator, target = text.partition(':')
+        if not separator:
+            raise ValueError(f"Expected SOURCE:TARGET, got '{text}'")
+        if hanging and target not in engine.nodes and '~' in target:
+            # A new link may point to a version that does not exist (yet)
+            return item_key(source), target
+        return item_key(source), item_key(target)
+    
+    edits = []
+    reevaluated = set()
+    start_time = time.time()
+    try:
+        with profile_stage('edits') as stage:
+            for text in add_items or ():
+                doctype, separator, key = text.partition(':')
+                spec_id, _, version = key.rpartition('~')
+                if not separator or not spec_id or not doctype:
+                    raise ValueError(f"Expected DOCTYPE:ID~VERSION, got '{text}'")
+                reevaluated |= engine.add_item(SpecItem(spec_id, version, doctype))
+                edits.append({"edit": "add_item", "item": key, "doctype": doctype})
+            for text in add_links or ():
+                source, target = link(text, hanging=True)
+                reevaluated |= engine.add_link(source, target)
+                edits.append({"edit": "add_link", "source": source, "target": target})
+            for text in remove_links or ():
+                source, target = link(text)
+                reevaluated |= engine.remove_link(source, target)
+                edits.append({"edit": "remove_link", "source": source, "target": target})
+            for text in bumps or ():
+                key = item_key(text)
+                new_key, keys = engine.bump_version(key)
+                reevaluated |= keys
+                edits.append({"edit": "bump_version", "item": key, "new_item": new_key})
+            for text in removes or ():
+                key = item_key(text)
+                reevaluated |= engine.remove_item(key)
+                edits.append({"edit": "remove_item", "item": key})
+            stage.count(edits=len(edits), reevaluated=len(reevaluated))
+    except (KeyError, ValueError) as e:
+        console.print(f"[bold red]Error:[/] {e.args[0] if e.args else e}")
+        raise typer.Exit(code=1)
+    elapsed = time.time() - start_time
+    
+    # Compare the coverage types of the changed items before and after writing the edits back
+    begin_stage('render')
+    renamed = {edit["new_item"]: edit["item"] for edit in edits if edit["edit"] == "bump_version"}
+    candidates = set(engine.changes()) | {key for key in reevaluated if key in engine.nodes}
+    before = {key: spec_items[renamed.get(key, key)].reported_coverage_type
+              for key in candidates if renamed.get(key, key) in spec_items}
+    removed = [edit["item"] for edit in edits if edit["edit"] == "remove_item"]
+    before.update((key, spec_items[key].reported_coverage_type) for key in removed if key in spec_items)
+    engine.apply(spec_items)
+    
+    changes = []
+    for key in sorted(set(before) | candidates, key=lambda key: (key not in spec_items, key)):
+        old_type = before.get(key)
+        new_type = spec_items[key].reported_coverage_type if key in spec_items else None
+        if old_type != new_type:
+            doctype = spec_items[key].doctype if key in spec_items else None
+            changes.append({"key": key, "doctype": doctype, "before": old_type, "after": new_type})
+    
+    if format == "json":
+        import json
+        report = {
+            "aspec_file": pipeline.aspec_file,
+            "edits": edits,
+            "reevaluated": len(reevaluated),
+            "changes": changes
+        }
+        stream = open(output_file, 'w', encoding='utf-8') if output_file else sys.stdout
+        try:
+            json.dump(report, stream, indent=2, ensure_ascii=False)
+            stream.write("\n")
+        finally:
+            if output_file:
+                stream.close()
+    else:
+        from rich.table import Table
+        from rich.console import Console
+        
+        table = Table(title=f"Coverage changes after {len(edits)} edits")
+        table.add_column("Item", style="cyan")
+        table.add_column("Doctype")
+        table.add_column("Before")
+        table.add_column("After")
+        for change in changes:
+            after_style = "green" if change["after"] == "COVERED" else "red"
+            table.add_row(change["key"], change["doctype"] or "", change["before"] or "(new)",
+                          f"[{after_style}]{change['after'] or '(removed)'}[/]")
+        
+        out = Console(file=open(output_file, 'w', encoding='utf-8')) if output_file else get_console()
+        try:
+            if changes:
+                out.print(table)
+            else:
+                out.print("No coverage changes")
+        finally:
+            if output_file:
+                out.file.close()
+    
+    console.print(f"Re-evaluated [cyan]{len(reevaluated)}[/] of [cyan]{len(engine.nodes)}[/] items "
+                  f"in [cyan]{elapsed * 1000:.1f} ms[/]; [green]{len(changes)}[/] coverage types changed")
+    if output_file:
+        console.print(f"[green]What-if report written to {output_file}[/]")
+
+
+@app.command()
+def diff(
+    baseline_file: str = typer.Argument(..., help="Path to the aspec file to compare against"),
+    current_file: str = typer.Argument(..., help="Path to the new aspec file"),
+    format: str = typer.Option("text", "--format", "-f", help="Output format: text or json"),
+    output_file: Optional[str] = typer.Option(None, "--output", "-o",
+                                            help="Path to output file (if not specified, print to console)"),
+    fail_on: str = typer.Option("broken", "--fail-on",
+                              help="Exit with code 3 on newly broken items (broken), on any reported change (changes) or never")
+):
+    """
+    Compare two aspec reports and show what broke, what was fixed and what changed.
+    
+    Spec objects are matched by a hash of their content, so only the ones that
+    differ are parsed and a report with a handful of changes is compared in
+    a few seconds. Items are broken when their reported coverage is not
+    COVERED; existing failures that did not change are not listed, so CI can
+    gate on new breakage only.
+    """
+    from oft_trace.diff import DIFF_SECTIONS, diff_reports
+    from oft_trace.profiling import begin_stage
+    
+    if format not in ("text", "json"):
+        console.print("[bold red]Error:[/] Format must be one of: text, json")
+        raise typer.Exit(code=1)
+    if fail_on not in ("broken", "changes", "never"):
+        console.print("[bold red]Error:[/] --fail-on must be one of: broken, changes, never")
+        raise typer.Exit(code=1)
+    for path in (baseline_file, current_file):
+        if not os.path.isfile(path):
+            console.print(f"[bold red]Error:[/] Aspec file '{path}' not found.")
+            raise typer.Exit(code=1)
+    
+    # Keep stdout for the JSON report when it is printed there
+    if format == "json" and not output_file:
+        get_console().stderr = True
+    
+    start_time = time.time()
+    try:
+        report = diff_reports(baseline_file, current_file)
+    except (OSError, SyntaxError) as e:
+        console.print(f"[bold red]Error comparing the reports:[/] {e}")
+        raise typer.Exit(code=1)
+    elapsed = time.time() - start_time
+    summary = report["summary"]
+    
+    begin_stage('render')
+    if format == "json":
+        import json
+        stream = open(output_file, 'w', encoding='utf-8') if output_file else sys.stdout
+        try:
+            json.dump(report, stream, indent=2, ensure_ascii=False)
+            stream.write("\n")
+        finally:
+            if output_file:
+                stream.close()
+    else:
+        from rich.table import Table
+        from rich.console import Console
+        
+        titles = {
+            "newly_broken": "Newly broken",
+            "fixed": "Fixed",
+            "changed_coverage": "Changed coverage",
+            "version_bumped": "Version bumped",
+            "added": "Added",
+            "removed": "Removed"
+        }
+        
+        def state_text(state, fallback):
+            if state is None:
+                return fallback
+            style = "green" if state["coverage_type"] == "COVERED" else "red"
+            return f"[{style}]{state['coverage_type']}[/]"
+        
+        out = Console(file=open(output_file, 'w', encoding='utf-8')) if output_file else get_console()
+        try:
+            out.print(f"[bold]Comparing[/] {baseline_file} [bold]->[/] {current_file}")
+            for section in DIFF_SECTIONS:
+                entries = report[section]
+                if not entries:
+                    continue
+                table = Table(title=f"{titles[section]} ({len(entries)})", title_justify="left")
+                table.add_column("Item", style="cyan")
+                table.add_column("Doctype")
+                table.add_column("Before")
+                table.add_column("After")
+                table.add_column("Failure reasons")
+                for entry in entries:
+                    before, after = entry["before"], entry["after"]
+                    keys = [state["key"] for state in (before, after) if state is not None]
+                    reasons = (after or before)["failure_reasons"]
+                    table.add_row(" -> ".join(dict.fromkeys(keys)), entry["doctype"],
+                                  state_text(before, "(new)"), state_text(after, "(removed)"), "\n".join(reasons))
+                out.print(table)
+            if not any(report[section] for section in DIFF_SECTIONS):
+                out.print("No coverage changes")
+        finally:
+            if output_file:
+                out.file.close()
+    
+    console.print(f"Compared [cyan]{summary['baseline_objects']}[/] and [cyan]{summary['current_objects']}[/] "
+                  f"spec objects ([cyan]{summary['unchanged_objects']}[/] unchanged) in [cyan]{elapsed:.2f}s[/]: "
+                  f"[red]{summary['newly_broken']}[/] newly broken, [green]{summary['fixed']}[/] fixed")
+    if output_file:
+        console.print(f"[green]Diff written to {output_file}[/]")
+    
+    failed = summary["newly_broken"] if fail_on == "broken" else (
+        sum(summary[section] for section in DIFF_SECTIONS) if fail_on == "changes" else 0)
+    if failed:
+        raise typer.Exit(code=GATE_FAILED_EXIT_CODE)
+
+
+@app.command()
+def stats(
+    aspec_file: str = typer.Argument(..., help="Path to the aspec XML file, a directory of aspec files or a glob pattern"),
+    format: str = typer.Option("text", "--format", "-f", help="Output format: text or json"),
+    output_file: Optional[str] = typer.Option(None, "--output", "-o",
+                                            help="Path to output file (if not specified, print to console)"),
+    min_coverage: Optional[List[str]] = typer.Option(None, "--min-coverage",
+                                                   help="Minimum covered percentage of all items, or of one doctype as DOCTYPE=PERCENT (repeatable)"),
+    max_broken: Optional[int] = typer.Option(None, "--max-broken",
+                                           help="Maximum number of broken chains"),
+    inputs: Optional[List[str]] = typer.Option(None, "--input", "-i",
+                                             help="Additional aspec file, directory or glob pattern (repeatable)"),
+    find_cycles: bool = typer.Option(True, "--cycles/--no-cycles",
+                                     help="Find circular dependencies, which keeps the coverage links of all items")
+):
+    """
+    Print the coverage summary of an aspec report and check coverage thresholds.
+    
+    The report is streamed and every spec object is counted and dropped, so
+    memory does not grow with the size of the descriptions. Finding circular
+    dependencies is what costs time and memory in proportion to the items:
+    their coverage links are kept and searched as a graph, so the counts
+    match the summary of trace. With --no-cycles only a small entry per item
+    key is kept to count repeated definitions once, and items in a cycle
+    keep their reported coverage type. Exits with code 3 when a threshold is
+    not met.
+    """
+    from oft_trace.stats import check_thresholds, count_coverage, parse_min_coverage
+    from oft_trace.reporter import json_summary_header, print_coverage_summary
+    from oft_trace.profiling import begin_stage
+    
+    aspec_files = resolve_aspec_inputs(aspec_file, inputs)
+    
+    if format not in ("text", "json"):
+        console.print("[bold red]Error:[/] Format must be one of: text, json")
+        raise typer.Exit(code=1)
+    try:
+        thresholds = [parse_min_coverage(value) for value in min_coverage or ()]
+    except ValueError as e:
+        console.print(f"[bold red]Error:[/] {e}")
+        raise typer.Exit(code=1)
+    
+    # Keep stdout for the JSON summary when it is printed there
+    if format == "json" and not output_file:
+        get_console().stderr = True
+    
+    start_time = time.time()
+    try:
+        counts = count_coverage(aspec_files, find_cycles=find_cycles)
+    except (OSError, SyntaxError) as e:
+        console.print(f"[bold red]Error reading the aspec file:[/] {e}")
+        raise typer.Exit(code=1)
+    elapsed = time.time() - start_time
+    console.print(f"Counted [green]{counts.total_items}[/] items in [cyan]{elapsed:.2f}s[/]")
+    if counts.duplicates:
+        console.print(f"[yellow]Warning:[/] {len(counts.duplicates)} duplicate items across input files, keeping the first definition")
+    
+    begin_stage('render')
+    if format == "json":
+        import json
+        stream = open(output_file, 'w', encoding='utf-8') if output_file else sys.stdout
+        try:
+            header = json_summary_header(aspec_files[0] if len(aspec_files) == 1 else aspec_file, counts.total_items,
+                                         counts.broken_chains, counts.counts, counts.by_doctype)
+            json.dump(header, stream, indent=2, ensure_ascii=False)
+            stream.write("\n")
+        finally:
+            if output_file:
+                stream.close()
+    elif counts.total_items == 0:
+        console.print("[yellow]No spec items found[/]")
+    else:
+        original_stdout = None
+        if output_file:
+            original_stdout = sys.stdout
+            sys.stdout = open(output_file, 'w', encoding='utf-8')
+        try:
+            print_coverage_summary(counts.total_items, counts.counts, counts.by_doctype, counts.cycles,
+                                   output_file=bool(output_file))
+        finally:
+            if original_stdout:
+                sys.stdout.close()
+                sys.stdout = original_stdout
+    if output_file:
+        console.print(f"[green]Summary written to {output_file}[/]")
+    
+    failures = check_thresholds(counts, thresholds, max_broken)
+    for failure in failures:
+        console.print(f"[bold red]Threshold not met:[/] {failure}")
+    if failures:
+        raise typer.Exit(code=GATE_FAILED_EXIT_CODE)
+
+
+@app.command()
+def export(
+    aspec_file: str = typer.Argument(..., help="Path to the aspec XML file, a directory of aspec files or a glob pattern"),
+    output_file: str = typer.Option(..., "--output", "-o", help="Path of the file to write"),
+    format: str = typer.Option("sqlite", "--format", "-f", help="Output format: sqlite or json"),
+    use_cache: bool = typer.Option(True, "--cache/--no-cache",
+                                 help="Reuse the cached model of an unchanged aspec file"),
+    cache_dir: Optional[str] = typer.Option(None, "--cache-dir",
+                                          help="Directory for cached models (default: ~/.cache/oft-trace)"),
+    cache_max_size: int = typer.Option(512, "--cache-max-size",
+                                     help="Maximum cache size in MB before the oldest entries are evicted"),
+    inputs: Optional[List[str]] = typer.Option(None, "--input", "-i",
+                                             help="Additional aspec file, directory or glob pattern (repeatable)"),
+    jobs: Optional[int] = typer.Option(None, "--jobs", "-j",
+                                     help="Number of processes for parsing several files (default: CPU count)")
+):
+    """
+    Export all items of an aspec report with their analysis for querying.
+    
+    The sqlite format writes a database with tables for items, covering
+    records, coverage links (edges), covered and uncovered types, failure
+    reasons and cycle members, indexed for queries by id, doctype, status,
+    coverage type and source file. The json format is the trace-failures
+    JSON report of all items.
+    """
+    from oft_trace.profiling import begin_stage
+    
+    aspec_files = resolve_aspec_inputs(aspec_file, inputs)
+    
+    if format not in ("sqlite", "json"):
+        console.print("[bold red]Error:[/] Format must be one of: sqlite, json")
+        raise typer.Exit(code=1)
+    
+    # Coverage types and failure reasons depend on cycle detection
+    pipeline = load_aspec_with_progress(aspec_files, use_cache, cache_dir, cache_max_size, jobs)
+    pipeline.classify()
+    pipeline.cycles()
+    analyzer = pipeline.analyzer
+    begin_stage('render')
+    
+    start_time = time.time()
+    if format == "sqlite":
+        import sqlite3
+        from oft_trace.export import export_sqlite
+        
+        try:
+            counts = export_sqlite(analyzer, output_file)
+        except (OSError, sqlite3.Error) as e:
+            console.print(f"[bold red]Error:[/] Cannot write {output_file}: {e}")
+            raise typer.Exit(code=1)
+        console.print(f"Exported [green]{counts['items']}[/] items, [cyan]{counts['edges']}[/] links and "
+                      f"[cyan]{counts['failure_reasons']}[/] failure reasons to [cyan]{output_file}[/] "
+                      f"in [cyan]{time.time() - start_time:.2f}s[/]")
+    else:
+        from oft_trace.reporter import write_json_report
+        
+        with open(output_file, 'w', encoding='utf-8') as stream:
+            write_json_report(analyzer, stream, list(analyzer.spec_items), include_all=True)
+        console.print(f"[green]JSON report saved to {output_file}[/]")
+
+
+@app.command()
+def serve(
+    aspec_file: str = typer.Argument(..., help="Path to the aspec XML file, a directory of aspec files or a glob pattern"),
+    socket_path: Optional[str] = typer.Option(None, "--socket", "-s",
+                                            help="Listen on this Unix socket instead of a TCP port"),
+    host: str = typer.Option("127.0.0.1", "--host", help="Address to listen on for HTTP"),
+    port: int = typer.Option(8765, "--port", "-p", help="TCP port to listen on for HTTP"),
+    poll_interval: float = typer.Option(1.0, "--poll-interval",
+                                      help="Seconds between checks for changed aspec files (0 disables reloading)"),
+    use_cache: bool = typer.Option(True, "--cache/--no-cache",
+                                 help="Reuse the cached model of an unchanged aspec file"),
+    cache_dir: Optional[str] = typer.Option(None, "--cache-dir",
+                                          help="Directory for cached models (default: ~/.cache/oft-trace)"),
+    cache_max_size: int = typer.Option(512, "--cache-max-size",
+                                     help="Maximum cache size in MB before the oldest entries are evicted"),
+    inputs: Optional[List[str]] = typer.Option(None, "--input", "-i",
+                                             help="Additional aspec file, directory or glob pattern (repeatable)"),
+    jobs: Optional[int] = typer.Option(None, "--jobs", "-j",
+                                     help="Number of processes for parsing several files (default: CPU count)")
+):
+    """
+    Keep the analyzed aspec model in memory and answer queries with JSON.
+    
+    Queries are GET requests to /trace, /items, /failures and /stats over HTTP
+    or a Unix socket; use the query command as a client. The model is reloaded
+    when the aspec files change; a single changed aspec file is updated in
+    place, parsing only the spec objects that changed. If an update fails
+    and the complete reload fails as well, queries answer 503 until the
+    files can be loaded again.
+    """
+    from oft_trace.pipeline import AnalysisPipeline
+    from oft_trace.server import QueryService, create_server
+    
+    aspec_files = resolve_aspec_inputs(aspec_file, inputs)
+    pipeline = load_aspec_with_progress(aspec_files, use_cache, cache_dir, cache_max_size, jobs, track_changes=True)
+    
+    def pipeline_factory(files):
+        return AnalysisPipeline(
+            files,
+            use_cache=use_cache,
+            cache_dir=cache_dir,
+            cache_max_size=cache_max_size * 1024 * 1024,
+            jobs=jobs,
+            track_changes=True
+        )
+    
+    service = QueryService([aspec_file, *(inputs or [])], pipeline_factory, poll_interval, pipeline)
+    try:
+        server = create_server(service, socket_path, host, port)
+    except OSError as e:
+        console.print(f"[bold red]Error:[/] Cannot listen: {e}")
+        raise typer.Exit(code=1)
+    
+    address = socket_path if socket_path else f"http://{host}:{server.server_address[1]}"
+    console.print(f"Serving [green]{len(service.model.analyzer.spec_items)}[/] items on [cyan]{address}[/] (Ctrl+C to stop)")
+    
+    service.start_watching()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.stop()
+        server.server_close()
+        if socket_path and os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+@app.command()
+def query(
+    endpoint: str = typer.Argument(..., help="Query to run: trace, items, failures or stats"),
+    params: Optional[List[str]] = typer.Argument(None, help="Query parameters as key=value, e.g. id=req-1 direction=outgoing"),
+    socket_path: Optional[str] = typer.Option(None, "--socket", "-s", help="Unix socket of the server"),
+    host: str = typer.Option("127.0.0.1", "--host", help="Address of the HTTP server"),
+    port: int = typer.Option(8765, "--port", "-p", help="TCP port of the HTTP server"),
+    compact: bool = typer.Option(False, "--compact", help="Write JSON without indentation")
+):
+    """
+    Send a query to a running oft-trace server and print the JSON response.
+    
+    Parameters: trace takes id, version, doctype and direction; items takes id,
+    doctype, status and coverage; failures takes limit and include_covered.
+    """
+    import json
+    from oft_trace.server import send_query
+    
+    query_params = {}
+    for param in params or []:
+        key, separator, value = param.partition("=")
+        if not separator:
+            console.print(f"[bold red]Error:[/] Query parameters must look like key=value, got '{param}'")
+            raise typer.Exit(code=1)
+        query_params[key] = value
+    
+    try:
+        status, payload = send_query(endpoint, query_params, socket_path, host, port)
+    except (OSError, ValueError) as e:
+        console.print(f"[bold red]Error:[/] Query failed: {e}")
+        raise typer.Exit(code=1)
+    
+    print(json.dumps(payload, indent=None if compact else 2))
+    if status != 200:
+        raise typer.Exit(code=1)
+
+
+@app.command()
+def index(
+    aspec_file: str = typer.Argument(..., help="Path to the aspec XML file to index")
+):
+    """
+    Write an offset index next to an aspec file for fast single-item traces.
+    
+    The index is built in one streaming pass and records where each spec
+    object is in the file and how it is linked. trace uses it for a single
+    item while the aspec file is unchanged, parsing only the objects its
+    chain shows; a changed file falls back to a full parse.
+    """
+    from xml.parsers.expat import ExpatError
+    from oft_trace.offsets import build_offset_index, index_path
+    
+    if not os.path.isfile(aspec_file):
+        console.print(f"[bold red]Error:[/] File not found: {aspec_file}")
+        raise typer.Exit(code=1)
+    
+    output_file = index_path(aspec_file)
+    start_time = time.time()
+    try:
+        counts = build_offset_index(aspec_file, output_file)
+    except (OSError, ValueError, SyntaxError, ExpatError) as e:
+        console.print(f"[bold red]Error:[/] Cannot index {aspec_file}: {e}")
+        raise typer.Exit(code=1)
+    
+    elapsed = time.time() - start_time
+    console.print(f"Indexed [green]{counts['items']}[/] items with [cyan]{counts['links']}[/] links and "
+                  f"[cyan]{counts['cycles']}[/] cycles into [cyan]{output_file}[/] in [cyan]{elapsed:.2f}s[/]")
+
+
+@app.command()
+def generate(
+    output_file: str = typer.Argument(..., help="Path of the aspec XML file to write"),
+    items: int = typer.Option(10000, "--items", "-n", help="Number of items, spread evenly over the doctypes"),
+    doctypes: str = typer.Option("feat,req,dsn,impl", "--doctypes",
+                               help="Comma-separated doctype layers, each covered by the next one"),
+    fan_out: int = typer.Option(2, "--fan-out", help="Maximum number of items each item covers"),
+    fan_in_skew: float = typer.Option(0.0, "--fan-in-skew",
+                                    help="Concentrate links on few items (0 spreads them evenly, 1 is Zipf-like)"),
+    cycles: int = typer.Option(0, "--cycles", help="Number of circular dependencies to add"),
+    mismatch_rate: float = typer.Option(0.02, "--mismatch-rate", help="Share of links that refer to the wrong version"),
+    duplicate_rate: float = typer.Option(0.01, "--duplicate-rate",
+                                       help="Share of items that get a second version with the same ID"),
+    uncovered_rate: float = typer.Option(0.05, "--uncovered-rate", help="Share of items that nothing covers"),
+    seed: int = typer.Option(0, "--seed", help="Random seed; the same options always give the same report")
+):
+    """
+    Write a synthetic aspec report for testing and benchmarking.
+
+    The report has the structure OpenFastTrace writes, with coverage statuses
+    derived from the generated links, so it needs no Java or OFT installation.
+    """
+    from oft_trace.synthetic import generate_aspec
+
+    start_time = time.time()
+    try:
+        counts = generate_aspec(output_file, items, [doctype.strip() for doctype in doctypes.split(",") if doctype.strip()],
+                                fan_out, fan_in_skew, cycles, mismatch_rate, duplicate_rate, uncovered_rate, seed)
+    except (OSError, ValueError) as e:
+        console.print(f"[bold red]Error:[/] Cannot generate report: {e}")
+        raise typer.Exit(code=1)
+
+    elapsed = time.time() - start_time
+    console.print(f"Wrote [green]{counts['items']}[/] items with [cyan]{counts['links']}[/] links to "
+                  f"[cyan]{output_file}[/] in [cyan]{elapsed:.2f}s[/]")
+    console.print(f"  {counts['mismatches']} version mismatches, {counts['cycles']} cycles, "
+                  f"{counts['duplicates']} duplicate IDs")
+
+
 @app.command()
 def docs(
     output_file: Optional[str] = typer.Option(None, "--output", "-o", help="Output file for documentation"),
@@ -0,0 +1,19 @@
+"""Shared rich console, created on first use."""
+
+_console = None
+
+def get_console():
+    """Return the console shared by all modules, creating it on first use."""
+    global _console
+    if _console is None:
+        from rich.console import Console
+        _console = Console()
+    return _console
+
+class _LazyConsole:
+    """Stand-in for the shared console that defers importing rich until it prints."""
+
+    def __getattr__(self, name):
+        return getattr(get_console(), name)
+
+console = _LazyConsole()
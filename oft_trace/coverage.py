@@ -0,0 +1,359 @@
+"""Coverage engine that recomputes OpenFastTrace coverage and answers what-if edits."""
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from oft_trace.models import SpecItem, Coverage, CoveringItem, CoveredItem, intern_text
+from oft_trace.tracer import COVERED, UNCOVERED, covering_status, propagate_deep_coverage
+
+# A covers reference: (id, version, doctype); the doctype may be None
+Reference = Tuple[str, str, Optional[str]]
+
+class CoverageNode:
+    """What the engine knows about one item."""
+
+    __slots__ = ('item', 'id', 'version', 'doctype', 'status', 'needs', 'covers')
+
+    def __init__(self, item: SpecItem, needs: Iterable[str] = ()):
+        self.item = item
+        self.id = item.id
+        self.version = item.version
+        self.doctype = item.doctype
+        self.status = item.status or "approved"
+        self.needs = tuple(needs)
+        self.covers = [(covered.id, covered.version or '1', covered.doctype) for covered in item.covers]
+
+    @property
+    def key(self) -> str:
+        return f"{self.id}~{self.version}"
+
+def item_needs(item: SpecItem) -> List[str]:
+    """Return the artifact types an item needs, from its covered and uncovered types."""
+    return [*(item.coverage.coveredTypes or ()), *(item.coverage.uncoveredTypes or ())]
+
+class CoverageEngine:
+    """Shallow and deep coverage of a model, kept up to date under edits.
+
+    The engine reads the items, the artifact types they need and their covers
+    references, and computes coverage with the rules of the markdown tracer:
+    an approved item is covered shallow when every needed type is covered by
+    an approved item through a link to its exact version, and covered deep
+    when all of those covering items are covered deep as well.
+
+    Links can be added and removed, versions bumped and items added or
+    removed. Each edit re-evaluates only the items whose links changed and
+    the items they cover, transitively; the coverage of everything below is
+    unaffected. changes() reports the coverage differences since the engine
+    was created, and apply() writes the edited model back into SpecItems.
+    """
+
+    def __init__(self, spec_items: Dict[str, SpecItem]):
+        self.nodes: Dict[str, CoverageNode] = {}
+        self.by_id: Dict[str, List[str]] = defaultdict(list)
+        self.referrers: Dict[str, Set[str]] = defaultdict(set)  # ID -> keys of items referencing it
+        self.incoming: Dict[str, List[Tuple[str, str]]] = defaultdict(list)  # key -> (source key, kind)
+        self.shallow: Dict[str, str] = {}
+        self.deep: Dict[str, str] = {}
+        self._order: Dict[str, int] = {}
+        self._before: Dict[str, Optional[Tuple[str, str]]] = {}
+        self._renamed: Dict[str, str] = {}  # new key -> original key of bumped items
+        self._dirty: Set[str] = set()
+        self._restructured = False  # Items were added, removed or renamed since apply()
+
+        for item in spec_items.values():
+            self._insert(CoverageNode(item, item_needs(item)))
+        # Sources are linked in item order, so the incoming links need no sorting
+        for key in self.nodes:
+            self._link(key, keep_order=False)
+        for key in self.nodes:
+            self.shallow[key] = self._shallow_status(key)
+        self.deep.update(self.shallow)
+        propagate_deep_coverage({key: self._coverers(key) for key in self.nodes}, self.shallow, self.deep)
+
+    # Link resolution
+
+    def _insert(self, node: CoverageNode):
+        key = node.key
+        self.nodes[key] = node
+        self.by_id[node.id].append(key)
+        self._order.setdefault(key, len(self._order))
+
+    def _resolve(self, reference: Reference) -> List[Tuple[str, bool]]:
+        """Return (target key, exact version) for the items a reference links to."""
+        spec_id, version, doctype = reference
+        key = f"{spec_id}~{version}"
+        node = self.nodes.get(key)
+        if node is not None and doctype in (None, node.doctype):
+            return [(key, True)]
+        return [(other, False) for other in self.by_id.get(spec_id, ())
+                if other != key and doctype in (None, self.nodes[other].doctype)]
+
+    def _link(self, source: str, keep_order: bool = True) -> Set[str]:
+        """Add the incoming links of a source's references; returns the targets."""
+        node = self.nodes[source]
+        targets = set()
+        for reference in node.covers:
+            self.referrers[reference[0]].add(source)
+            for target, exact in self._resolve(reference):
+                if exact:
+                    kind = "wanted" if node.doctype in self.nodes[target].needs else "unwanted"
+                else:
+                    kind = "wrong_version"
+                self.incoming[target].append((source, kind))
+                targets.add(target)
+        if keep_order:
+            for target in targets:
+                self.incoming[target].sort(key=lambda link: self._order[link[0]])
+        return targets
+
+    def _unlink(self, source: str) -> Set[str]:
+        """Remove the incoming links of a source's references; returns the targets."""
+        targets = set()
+        for reference in self.nodes[source].covers:
+            self.referrers[reference[0]].discard(source)
+            for target, _ in self._resolve(reference):
+                targets.add(target)
+        for target in targets:
+            self.incoming[target] = [link for link in self.incoming[target] if link[0] != source]
+        return targets
+
+    # Coverage rules
+
+    def _counts(self, source: str, kind: str) -> bool:
+        return kind == "wanted" and self.nodes[source].status == "approved"
+
+    def _coverers(self, key: str) -> List[str]:
+        """Items covering an item through links that count for its coverage."""
+        if self.nodes[key].status != "approved":
+            return []
+        return [source for source, kind in self.incoming.get(key, ()) if self._counts(source, kind)]
+
+    def _covered_types(self, key: str) -> Set[str]:
+        return {self.nodes[source].doctype for source in self._coverers(key)}
+
+    def _shallow_status(self, key: str) -> str:
+        node = self.nodes[key]
+        if node.status == "approved" and self._covered_types(key).issuperset(node.needs):
+            return COVERED
+        return UNCOVERED
+
+    def _counted_targets(self, source: str) -> Set[str]:
+        """Items whose coverage counts a link from the source."""
+        node = self.nodes[source]
+        if node.status != "approved":
+            return set()
+        return {target for reference in node.covers for target, exact in self._resolve(reference)
+                if exact and node.doctype in self.nodes[target].needs and self.nodes[target].status == "approved"}
+
+    # Edits
+
+    def status(self, key: str) -> Optional[Tuple[str, str]]:
+        """Return (shallow, deep) coverage of an item, or None if it does not exist."""
+        if key not in self.nodes:
+            return None
+        return self.shallow[key], self.deep[key]
+
+    def _remember(self, keys: Iterable[str]):
+        for key in keys:
+            if key not in self._before:
+                self._before[key] = self.status(key)
+
+    def _edit(self, sources: Iterable[str], change) -> Set[str]:
+        """Apply a change to the model, relinking the given sources around it.
+
+        The change returns the items it touched; sources it removes or renames
+        are not relinked afterwards. Returns the keys of the items that were
+        re-evaluated.
+        """
+        sources = [source for source in dict.fromkeys(sources) if source in self.nodes]
+        touched = set()
+        for source in sources:
+            touched |= self._unlink(source)
+        touched |= change() or set()
+        for source in sources:
+            if source in self.nodes:
+                touched |= self._link(source)
+        return self._update(touched)
+
+    def _update(self, touched: Set[str]) -> Set[str]:
+        """Re-evaluate the touched items and everything they cover, transitively."""
+        region = {key for key in touched if key in self.nodes}
+        pending = list(region)
+        while pending:
+            for target in self._counted_targets(pending.pop()):
+                if target not in region:
+                    region.add(target)
+                    pending.append(target)
+
+        self._remember(region)
+        previous_deep = {key: self.deep.get(key) for key in region}
+        for key in region:
+            self.shallow[key] = self._shallow_status(key)
+            self.deep[key] = self.shallow[key]
+        propagate_deep_coverage({key: self._coverers(key) for key in region}, self.shallow, self.deep)
+
+        # Links from items whose deep coverage changed show a new covering status
+        self._dirty |= region
+        for key in region:
+            if self.deep[key] != previous_deep[key]:
+                self._dirty |= {target for reference in self.nodes[key].covers
+                                for target, _ in self._resolve(reference)}
+        return region
+
+    def _key(self, key: str) -> str:
+        if key not in self.nodes:
+            raise KeyError(f"Unknown item: {key}")
+        return key
+
+    def add_link(self, source: str, target: str, doctype: Optional[str] = None) -> Set[str]:
+        """Let the source item cover target (an item key, which need not exist)."""
+        node = self.nodes[self._key(source)]
+        spec_id, _, version = target.rpartition('~')
+        if target in self.nodes:
+            doctype = doctype or self.nodes[target].doctype
+
+        def change():
+            node.covers.append((spec_id, version, doctype))
+            self._dirty.add(source)
+        return self._edit([source], change)
+
+    def remove_link(self, source: str, target: str) -> Set[str]:
+        """Drop the references of the source item to target."""
+        node = self.nodes[self._key(source)]
+
+        def change():
+            node.covers = [reference for reference in node.covers if f"{reference[0]}~{reference[1]}" != target]
+            self._dirty.add(source)
+        return self._edit([source], change)
+
+    def bump_version(self, key: str, version: Optional[str] = None) -> Tuple[str, Set[str]]:
+        """Give an item a new version, by default the next number.
+
+        Links to the old version now cover the wrong version. Returns the new
+        key and the re-evaluated items.
+        """
+        node = self.nodes[self._key(key)]
+        if version is None:
+            version = str(int(node.version) + 1) if node.version.isdigit() else node.version + ".1"
+        new_key = f"{node.id}~{version}"
+        if new_key in self.nodes:
+            raise ValueError(f"Item {new_key} already exists")
+
+        def change():
+            self._restructured = True
+            self._remember([key, new_key])
+            del self.nodes[key]
+            self.by_id[node.id].remove(key)
+            shallow, deep = self.shallow.pop(key), self.deep.pop(key)
+            links = self.incoming.pop(key, [])
+            node.version = version
+            self._insert(node)
+            self._order[new_key] = self._order[key]
+            self.shallow[new_key], self.deep[new_key] = shallow, deep
+            self.incoming[new_key] = links
+            self._renamed[new_key] = self._renamed.pop(key, key)
+            self._dirty.discard(key)
+            self._dirty.add(new_key)
+            return {new_key} | self._link(new_key)
+        return new_key, self._edit([*self.referrers.get(node.id, ()), key], change)
+
+    def add_item(self, item: SpecItem, needs: Iterable[str] = ()) -> Set[str]:
+        """Add an item, e.g. a new test, with the types it needs and its covers references."""
+        if item.key in self.nodes:
+            raise ValueError(f"Item {item.key} already exists")
+        node = CoverageNode(item, needs)
+
+        def change():
+            self._restructured = True
+            self._remember([node.key])
+            self._insert(node)
+            self.shallow[node.key] = self.deep[node.key] = UNCOVERED
+            self._dirty.add(node.key)
+            return {node.key} | self._link(node.key)
+        return self._edit(self.referrers.get(node.id, ()), change)
+
+    def remove_item(self, key: str) -> Set[str]:
+        """Remove an item; links to it become hanging references."""
+        node = self.nodes[self._key(key)]
+
+        def change():
+            self._restructured = True
+            self._remember([key])
+            del self.nodes[key]
+            self.by_id[node.id].remove(key)
+            del self.shallow[key], self.deep[key]
+            self.incoming.pop(key, None)
+            self._dirty.discard(key)
+            return set(self.by_id.get(node.id, ()))
+        return self._edit([key, *self.referrers.get(node.id, ())], change)
+
+    # Results
+
+    def changes(self) -> Dict[str, Tuple[Optional[Tuple[str, str]], Optional[Tuple[str, str]]]]:
+        """Return {key: (before, after)} for items whose (shallow, deep) coverage changed.
+
+        Added items have no before and removed items no after state. A bumped
+        item is reported under its new key, with the state of its old version
+        as before.
+        """
+        changes = {}
+        renamed = {old: new for new, old in self._renamed.items()}
+        for key, before in self._before.items():
+            if key in renamed or key in self._renamed:
+                continue
+            after = self.status(key)
+            if before != after:
+                changes[key] = (before, after)
+        for new_key, old_key in self._renamed.items():
+            before, after = self._before.get(old_key), self.status(new_key)
+            if new_key in self.nodes and before != after:
+                changes[new_key] = (before, after)
+        return changes
+
+    def mismatches(self) -> List[str]:
+        """Keys of the items whose computed coverage differs from the coverage they report."""
+        return [key for key, node in self.nodes.items()
+                if (node.item.coverage.shallowCoverageStatus, node.item.coverage.deepCoverageStatus)
+                != (self.shallow[key], self.deep[key])]
+
+    def coverage(self, key: str) -> Coverage:
+        """Return the coverage section of an item as OpenFastTrace would report it."""
+        node = self.nodes[key]
+        covered_types = self._covered_types(key)
+        covering_items = []
+        for source, kind in self.incoming.get(key, ()):
+            covering = self.nodes[source]
+            covering_items.append(CoveringItem(
+                id=covering.id, version=intern_text(covering.version), doctype=covering.doctype,
+                status=covering.status, ownCoverageStatus=self.shallow[source],
+                deepCoverageStatus=self.deep[source], coveringStatus=covering_status(kind, self.deep[source])))
+        return Coverage(
+            shallowCoverageStatus=self.shallow[key], deepCoverageStatus=self.deep[key],
+            coveringItems=covering_items,
+            coveredTypes=[need for need in node.needs if need in covered_types],
+            uncoveredTypes=[need for need in node.needs if need not in covered_types])
+
+    def apply(self, spec_items: Dict[str, SpecItem]):
+        """Write the edits into a model's spec_items, in place.
+
+        Edited items get their new covers and coverage, bumped items their new
+        version and key, and added and removed items are added and removed.
+        The relationship maps and analyzer built on the model are not updated.
+        """
+        for key in self._dirty:
+            if key not in self.nodes:
+                continue
+            node = self.nodes[key]
+            item = node.item
+            if item.key != key:
+                item.version = intern_text(node.version)
+                item.key = intern_text(key)
+            item.covers = [CoveredItem(id=spec_id, version=version, doctype=doctype)
+                           for spec_id, version, doctype in node.covers]
+            item.coverage = self.coverage(key)
+        self._dirty.clear()
+
+        # Rebuild the dictionary only when items were added, removed or renamed
+        if self._restructured:
+            self._restructured = False
+            spec_items.clear()
+            spec_items.update((key, self.nodes[key].item) for key in sorted(self.nodes, key=self._order.get))
@@ -0,0 +1,159 @@
+"""Comparison of two aspec reports by the content of their spec objects."""
+import hashlib
+from collections import defaultdict
+from typing import Dict, List, NamedTuple, Optional
+
+from oft_trace.analyzer import TraceAnalyzer
+from oft_trace.incremental import UnsupportedLayout, object_digest, scan_aspec_file
+from oft_trace.markdown import is_markdown_file
+from oft_trace.models import SpecItem
+from oft_trace.offsets import fragment_prefix, parse_fragment
+from oft_trace.profiling import profile_stage
+
+# Report sections in output order
+DIFF_SECTIONS = ('newly_broken', 'fixed', 'changed_coverage', 'version_bumped', 'added', 'removed')
+
+class ReportObjects(NamedTuple):
+    """The spec objects of one report, by content hash."""
+    aspec_file: str
+    count: int  # Spec objects in the report
+    objects: Dict[tuple, object]  # (digest, doctype) -> (start, end) of the element in the file, or a SpecItem
+    prefix: bytes  # XML declaration the elements need to be parsed on their own
+
+def hash_report(aspec_file: str) -> ReportObjects:
+    """Hash every spec object of a report without parsing it.
+
+    The file is read once in chunks and only the position of each element
+    in it is kept, so it is never held in memory as a whole. Markdown input and reports
+    the spec object scanner cannot split are loaded through the pipeline
+    instead, and their items are hashed.
+    """
+    if not is_markdown_file(aspec_file):
+        hashes = {}
+        count = 0
+        try:
+            encoding, objects = scan_aspec_file(aspec_file)
+            for offset, raw, doctype in objects:
+                hashes[object_digest(raw), doctype] = (offset, offset + len(raw))
+                count += 1
+        except UnsupportedLayout:
+            pass
+        else:
+            return ReportObjects(aspec_file, count, hashes, fragment_prefix(encoding))
+
+    from oft_trace.pipeline import AnalysisPipeline
+
+    spec_items = AnalysisPipeline(aspec_file, use_cache=False).parse()[0]
+    hashes = {(hashlib.blake2b(repr(item.__getstate__()).encode('utf-8'), digest_size=16).digest(), item.doctype): item
+              for item in spec_items.values()}
+    return ReportObjects(aspec_file, len(spec_items), hashes, b'')
+
+def load_objects(report: ReportObjects, hashes) -> Dict[str, SpecItem]:
+    """Parse the spec objects with the given (digest, doctype) hashes, in file order."""
+    items = [report.objects[key] for key in hashes if isinstance(report.objects[key], SpecItem)]
+    positions = sorted((report.objects[key], key[1]) for key in hashes if not isinstance(report.objects[key], SpecItem))
+    if positions:
+        with open(report.aspec_file, 'rb') as f:
+            for (start, end), doctype in positions:
+                f.seek(start)
+                items.append(parse_fragment(f.read(end - start), doctype, report.prefix))
+    return {item.key: item for item in items if item is not None}
+
+def _item_state(analyzer: TraceAnalyzer, item: Optional[SpecItem]) -> Optional[Dict]:
+    if item is None:
+        return None
+    coverage_type = item.reported_coverage_type
+    return {
+        "key": item.key,
+        "version": item.version,
+        "coverage_type": coverage_type,
+        "failure_reasons": analyzer.determine_failure_reasons(item.key) if coverage_type != "COVERED" else [],
+    }
+
+def diff_reports(baseline_file: str, current_file: str) -> Dict:
+    """Compare two reports and return the changes of their items, ready for JSON output.
+
+    Spec objects with the same content in both reports are matched by hash
+    and skipped; only the others are parsed. Those are matched by key, and
+    by ID for items whose version changed. An item is broken when the
+    coverage reported by OpenFastTrace is not COVERED, as for trace-failures,
+    and its failure reasons only depend on its own coverage data. The
+    sections are:
+
+    - newly_broken: broken items that were covered or did not exist before
+    - fixed: items that were broken and are covered now
+    - changed_coverage: items that are still broken, for other reasons
+    - version_bumped, added, removed: items by how their key changed
+
+    Each entry has the id and doctype of the item and its "before" and
+    "after" state, None where the item does not exist. A report is expected
+    to define each item once.
+    """
+    with profile_stage('hash') as stage:
+        baseline = hash_report(baseline_file)
+        current = hash_report(current_file)
+        unchanged = baseline.objects.keys() & current.objects.keys()
+        stage.count(objects=baseline.count + current.count, unchanged=len(unchanged))
+
+    with profile_stage('parse') as stage:
+        before = load_objects(baseline, baseline.objects.keys() - unchanged)
+        after = load_objects(current, current.objects.keys() - unchanged)
+        stage.count(items=len(before) + len(after))
+
+    with profile_stage('compare') as stage:
+        # An ID that lost one version and gained another had its version bumped
+        removed_by_id = defaultdict(list)
+        for key, item in before.items():
+            if key not in after:
+                removed_by_id[item.id].append(key)
+        pairs = []
+        for key, item in after.items():
+            if key in before:
+                pairs.append((before[key], item))
+            elif removed_by_id.get(item.id):
+                pairs.append((before[removed_by_id[item.id].pop()], item))
+            else:
+                pairs.append((None, item))
+        matched = {old.key for old, _ in pairs if old is not None}
+        pairs.extend((item, None) for key, item in before.items() if key not in matched)
+
+        before_analyzer = TraceAnalyzer(before, {}, {}, {})
+        after_analyzer = TraceAnalyzer(after, {}, {}, {})
+        sections = {section: [] for section in DIFF_SECTIONS}
+        for old, new in pairs:
+            entry = {
+                "id": (new or old).id,
+                "doctype": (new or old).doctype,
+                "before": _item_state(before_analyzer, old),
+                "after": _item_state(after_analyzer, new),
+            }
+            old_state, new_state = entry["before"], entry["after"]
+            was_broken = old_state is not None and old_state["coverage_type"] != "COVERED"
+            is_broken = new_state is not None and new_state["coverage_type"] != "COVERED"
+            if is_broken and not was_broken:
+                sections["newly_broken"].append(entry)
+            elif was_broken and new_state is not None and not is_broken:
+                sections["fixed"].append(entry)
+            elif was_broken and is_broken and (old_state["coverage_type"], old_state["failure_reasons"]) != (
+                    new_state["coverage_type"], new_state["failure_reasons"]):
+                sections["changed_coverage"].append(entry)
+
+            if old is None:
+                sections["added"].append(entry)
+            elif new is None:
+                sections["removed"].append(entry)
+            elif old.key != new.key:
+                sections["version_bumped"].append(entry)
+        stage.count(items=len(pairs))
+
+    return {
+        "baseline": baseline_file,
+        "current": current_file,
+        "summary": {
+            "baseline_objects": baseline.count,
+            "current_objects": current.count,
+            "unchanged_objects": len(unchanged),
+            **{section: len(entries) for section, entries in sections.items()},
+        },
+        **sections,
+    }
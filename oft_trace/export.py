@@ -0,0 +1,187 @@
+"""Export of an analyzed report into a SQLite database for ad-hoc queries."""
+import os
+import sqlite3
+from datetime import datetime
+from itertools import islice
+from typing import Dict, Iterable
+
+from oft_trace.profiling import profile_stage
+
+# Bump when the schema changes; stored as the user_version of the database
+EXPORT_FORMAT = 1
+DEFAULT_BATCH_SIZE = 10000
+
+SCHEMA = """
+CREATE TABLE meta (
+    name TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE items (
+    item_key TEXT PRIMARY KEY,
+    id TEXT NOT NULL,
+    version TEXT,
+    doctype TEXT,
+    title TEXT,
+    shortdesc TEXT,
+    description TEXT,
+    status TEXT,
+    sourcefile TEXT,
+    sourceline INTEGER,
+    shallow_coverage_status TEXT,
+    deep_coverage_status TEXT,
+    coverage_type TEXT NOT NULL,
+    in_circular_dependency INTEGER NOT NULL
+);
+-- Items covering an item, as reported by OpenFastTrace
+CREATE TABLE covering (
+    item_key TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    covering_key TEXT NOT NULL,
+    id TEXT,
+    version TEXT,
+    doctype TEXT,
+    status TEXT,
+    own_coverage_status TEXT,
+    deep_coverage_status TEXT,
+    covering_status TEXT
+);
+-- Coverage links from an item to the items it covers; the target may not be in the report
+CREATE TABLE edges (
+    source_key TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    target_key TEXT NOT NULL,
+    target_id TEXT,
+    target_version TEXT,
+    target_doctype TEXT
+);
+-- Doctypes an item is covered or not covered by
+CREATE TABLE coverage_types (
+    item_key TEXT NOT NULL,
+    kind TEXT NOT NULL CHECK (kind IN ('covered', 'uncovered')),
+    doctype TEXT NOT NULL
+);
+CREATE TABLE failure_reasons (
+    item_key TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    reason TEXT NOT NULL
+);
+-- Members of each circular dependency; keys of hanging references are included
+CREATE TABLE cycles (
+    cycle INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    item_key TEXT NOT NULL
+);
+"""
+
+# Created after the bulk insert, which is faster than maintaining them row by row
+INDEXES = """
+CREATE INDEX items_id ON items (id);
+CREATE INDEX items_doctype ON items (doctype);
+CREATE INDEX items_status ON items (status);
+CREATE INDEX items_coverage_type ON items (coverage_type);
+CREATE INDEX items_sourcefile ON items (sourcefile);
+CREATE INDEX covering_item_key ON covering (item_key);
+CREATE INDEX covering_covering_key ON covering (covering_key);
+CREATE INDEX edges_source_key ON edges (source_key);
+CREATE INDEX edges_target_key ON edges (target_key);
+CREATE INDEX coverage_types_item_key ON coverage_types (item_key);
+CREATE INDEX failure_reasons_item_key ON failure_reasons (item_key);
+CREATE INDEX cycles_item_key ON cycles (item_key);
+"""
+
+def _optional(text):
+    """Store empty text fields as NULL."""
+    return text if text else None
+
+def _item_key(record) -> str:
+    return f"{record.id}~{record.version or '1'}"
+
+def _insert(connection, table: str, columns: Iterable[str], rows, batch_size: int) -> int:
+    """Insert rows in transactions of batch_size rows each; returns the number of rows."""
+    columns = list(columns)
+    statement = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+    rows = iter(rows)
+    count = 0
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return count
+        with connection:
+            connection.executemany(statement, batch)
+        count += len(batch)
+
+def export_sqlite(analyzer, db_file: str, batch_size: int = DEFAULT_BATCH_SIZE) -> Dict[str, int]:
+    """Write the items of an analyzed report and their links into a new SQLite database.
+
+    The analyzer should have run cycle detection, so coverage types and
+    failure reasons match trace-failures. Failure reasons are stored for the
+    items that are not COVERED. The database is written next to db_file and
+    moved into place when complete, replacing an existing file. Returns the
+    number of rows per table.
+    """
+    spec_items = analyzer.spec_items
+    tmp_path = f"{db_file}.{os.getpid()}.tmp"
+    if os.path.exists(tmp_path):
+        os.unlink(tmp_path)
+
+    counts = {}
+    connection = sqlite3.connect(tmp_path)
+    try:
+        # The file is only visible once complete, so it needs no journal
+        connection.execute("PRAGMA journal_mode = OFF")
+        connection.execute("PRAGMA synchronous = OFF")
+        connection.executescript(SCHEMA)
+        connection.execute(f"PRAGMA user_version = {EXPORT_FORMAT}")
+
+        with profile_stage('export') as stage:
+            counts['meta'] = _insert(connection, 'meta', ('name', 'value'), [
+                ('aspec_file', os.path.abspath(analyzer.aspec_file) if analyzer.aspec_file else None),
+                ('exported_at', datetime.now().isoformat()),
+            ], batch_size)
+            counts['items'] = _insert(connection, 'items', (
+                'item_key', 'id', 'version', 'doctype', 'title', 'shortdesc', 'description', 'status',
+                'sourcefile', 'sourceline', 'shallow_coverage_status', 'deep_coverage_status', 'coverage_type',
+                'in_circular_dependency'), (
+                (key, item.id, item.version, item.doctype, _optional(item.title), _optional(item.shortdesc),
+                 _optional(item.description), _optional(item.status), _optional(item.sourcefile),
+                 _optional(item.sourceline), item.coverage.shallowCoverageStatus,
+                 item.coverage.deepCoverageStatus, item.coverage_type, int(item.in_circular_dependency))
+                for key, item in spec_items.items()), batch_size)
+            counts['covering'] = _insert(connection, 'covering', (
+                'item_key', 'position', 'covering_key', 'id', 'version', 'doctype', 'status',
+                'own_coverage_status', 'deep_coverage_status', 'covering_status'), (
+                (key, position, _item_key(covering), covering.id, covering.version, covering.doctype,
+                 covering.status, covering.ownCoverageStatus, covering.deepCoverageStatus, covering.coveringStatus)
+                for key, item in spec_items.items()
+                for position, covering in enumerate(item.coverage.coveringItems or ())), batch_size)
+            counts['edges'] = _insert(connection, 'edges', (
+                'source_key', 'position', 'target_key', 'target_id', 'target_version', 'target_doctype'), (
+                (key, position, _item_key(covered), covered.id, covered.version, covered.doctype)
+                for key, item in spec_items.items() for position, covered in enumerate(item.covers)), batch_size)
+            counts['coverage_types'] = _insert(connection, 'coverage_types', ('item_key', 'kind', 'doctype'), (
+                (key, kind, doctype)
+                for key, item in spec_items.items()
+                for kind, doctypes in (('covered', item.coverage.coveredTypes),
+                                       ('uncovered', item.coverage.uncoveredTypes))
+                for doctype in doctypes or ()), batch_size)
+            counts['failure_reasons'] = _insert(connection, 'failure_reasons', ('item_key', 'position', 'reason'), (
+                (key, position, reason)
+                for key, item in spec_items.items() if item.coverage_type != "COVERED"
+                for position, reason in enumerate(analyzer.determine_failure_reasons(key))), batch_size)
+            counts['cycles'] = _insert(connection, 'cycles', ('cycle', 'position', 'item_key'), (
+                (number, position, key)
+                for number, cycle in enumerate(analyzer.get_circular_dependencies(), 1)
+                for position, key in enumerate(cycle)), batch_size)
+            stage.count(items=counts['items'], rows=sum(counts.values()))
+
+        with profile_stage('indexes'):
+            connection.executescript(INDEXES)
+            connection.execute("ANALYZE")
+            connection.commit()
+    except BaseException:
+        connection.close()
+        os.unlink(tmp_path)
+        raise
+    connection.close()
+    os.replace(tmp_path, db_file)
+    return counts
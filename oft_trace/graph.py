@@ -0,0 +1,187 @@
+"""Integer-keyed graph core for trace relationships."""
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+def _build_csr(node_count: int, sources, targets) -> Tuple[array, array]:
+    """Build compressed sparse row arrays from parallel edge arrays.
+
+    Edges keep their original order within each source node.
+    """
+    offsets = array('l', bytes(array('l').itemsize * (node_count + 1)))
+    for source in sources:
+        offsets[source + 1] += 1
+    for node in range(node_count):
+        offsets[node + 1] += offsets[node]
+
+    adjacency = array('l', bytes(array('l').itemsize * len(targets)))
+    position = offsets[:-1]
+    for source, target in zip(sources, targets):
+        adjacency[position[source]] = target
+        position[source] += 1
+
+    return offsets, adjacency
+
+class TraceGraph:
+    """Trace relationships with dense integer node IDs and CSR adjacency.
+
+    Every item key gets an integer ID; items come first, followed by keys that
+    are only referenced by links (hanging references). Two link sets are kept,
+    each in compressed sparse row form:
+
+    - outgoing: what each node covers (from the <covering> section)
+    - incoming: what covers each node (from the <coverage> section)
+
+    String keys are only needed to enter and leave the graph; traversals work
+    on the integer arrays.
+    """
+
+    def __init__(self, keys: List[str], items: List, outgoing: Tuple[List[int], List[int]],
+                 incoming: Tuple[List[int], List[int]], index: Optional[Dict[str, int]] = None):
+        self.keys = keys
+        self.index = index if index is not None else {key: node for node, key in enumerate(keys)}
+        self.items = items  # SpecItem per node, None for hanging references
+        self.out_offsets, self.out_targets = _build_csr(len(keys), *outgoing)
+        self.in_offsets, self.in_sources = _build_csr(len(keys), *incoming)
+
+    @classmethod
+    def from_maps(cls, spec_items: Dict, covering_map: Dict[str, List[str]],
+                  covered_by_map: Dict[str, List[str]]) -> "TraceGraph":
+        """Build the graph from the item dictionary and relationship maps."""
+        keys = list(spec_items)
+        items = list(spec_items.values())
+        index = {key: node for node, key in enumerate(keys)}
+
+        def node_for(key):
+            node = index.get(key)
+            if node is None:
+                node = index[key] = len(keys)
+                keys.append(key)
+                items.append(None)
+            return node
+
+        def edges(relationship_map):
+            sources, targets = array('l'), array('l')
+            for key, linked_keys in relationship_map.items():
+                node = node_for(key)
+                for linked_key in linked_keys:
+                    sources.append(node)
+                    targets.append(node_for(linked_key))
+            return sources, targets
+
+        outgoing = edges(covering_map)
+        incoming = edges(covered_by_map)
+        return cls(keys, items, outgoing, incoming, index)
+
+    @classmethod
+    def from_adjacency(cls, adjacency: Dict[str, Iterable[str]]) -> "TraceGraph":
+        """Build a graph with outgoing links only from a key -> successor keys mapping."""
+        return cls.from_maps({}, adjacency, {})
+
+    @property
+    def node_count(self) -> int:
+        """Number of nodes, including hanging references."""
+        return len(self.keys)
+
+    @property
+    def edge_count(self) -> int:
+        """Number of outgoing (covers) links."""
+        return len(self.out_targets)
+
+    def node(self, key: str) -> Optional[int]:
+        """Return the integer ID of a key, or None if the key is unknown."""
+        return self.index.get(key)
+
+    def successors(self, node: int):
+        """Return the nodes that a node covers."""
+        return self.out_targets[self.out_offsets[node]:self.out_offsets[node + 1]]
+
+    def predecessors(self, node: int):
+        """Return the nodes that cover a node."""
+        return self.in_sources[self.in_offsets[node]:self.in_offsets[node + 1]]
+
+    def has_self_loop(self, node: int) -> bool:
+        """Check if a node covers itself."""
+        return node in self.successors(node)
+
+    def strongly_connected_components(self) -> List[List[int]]:
+        """Find the strongly connected components of the outgoing links.
+
+        This is an iterative version of Tarjan's algorithm over the CSR arrays,
+        so it runs in O(V+E) and is not bound by the recursion limit.
+        Components are returned in reverse topological order.
+        """
+        node_count = len(self.keys)
+        offsets, targets = self.out_offsets, self.out_targets
+        unvisited = -1
+        index = [unvisited] * node_count
+        lowlink = [0] * node_count
+        on_stack = [False] * node_count
+        stack = []
+        components = []
+        counter = 0
+
+        for root in range(node_count):
+            if index[root] != unvisited:
+                continue
+
+            index[root] = lowlink[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack[root] = True
+            # Each frame holds a node and the position of its next link to follow
+            work = [[root, offsets[root]]]
+
+            while work:
+                frame = work[-1]
+                node, position = frame
+                end = offsets[node + 1]
+
+                while position < end:
+                    successor = targets[position]
+                    position += 1
+                    if index[successor] == unvisited:
+                        break
+                    if on_stack[successor] and index[successor] < lowlink[node]:
+                        lowlink[node] = index[successor]
+                else:
+                    successor = None
+
+                if successor is not None and index[successor] == unvisited:
+                    # Descend into the successor and resume this node later
+                    frame[1] = position
+                    index[successor] = lowlink[successor] = counter
+                    counter += 1
+                    stack.append(successor)
+                    on_stack[successor] = True
+                    work.append([successor, offsets[successor]])
+                    continue
+
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    if lowlink[node] < lowlink[parent]:
+                        lowlink[parent] = lowlink[node]
+
+                if lowlink[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack[member] = False
+                        component.append(member)
+                        if member == node:
+                            break
+                    component.reverse()
+                    components.append(component)
+
+        return components
+
+    def find_cycles(self) -> List[List[int]]:
+        """Return the strongly connected components that contain a cycle.
+
+        A component is cyclic if it has more than one node or its only node
+        covers itself.
+        """
+        return [
+            component for component in self.strongly_connected_components()
+            if len(component) > 1 or self.has_self_loop(component[0])
+        ]
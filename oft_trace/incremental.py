@@ -0,0 +1,340 @@
+"""Incremental update of a parsed model from a changed aspec file."""
+import re
+import codecs
+import hashlib
+import itertools
+from collections import defaultdict
+from typing import BinaryIO, Dict, Iterator, List, NamedTuple, Optional, Sequence, Set, Tuple
+from xml.parsers import expat
+
+from oft_trace.models import SpecItem
+from oft_trace.offsets import fragment_prefix, parse_fragment, scan_spec_objects, xml_encoding
+from oft_trace.parser import covered_keys, covering_keys
+from oft_trace.profiling import profile_stage
+
+DIGEST_SIZE = 16
+CHUNK_SIZE = 1024 * 1024
+
+# Container and spec object tags, and the markup the scanner does not handle
+_TOKEN = re.compile(rb'<(/?)(specobjects?)(?=[\s/>])([^>]*)>|<!--|<!\[CDATA\[|<!DOCTYPE|<\?')
+_ATTRIBUTES = re.compile(rb'(?:\s+[\w:.-]+\s*=\s*(?:"[^"<]*"|\'[^\'<]*\'))*\s*/?')
+_DOCTYPE = re.compile(rb'\sdoctype\s*=\s*(?:"([^"]*)"|\'([^\']*)\')')
+_DECLARATION = re.compile(rb'<\?xml\s[^>]*\?>')
+_ENCODING = re.compile(rb'\sencoding\s*=\s*["\']([A-Za-z][\w.-]*)["\']')
+_ROOT = re.compile(rb'\s*<([^\s/>!?]+)')
+_NAMESPACE = re.compile(rb'\sxmlns[:=\s]')
+_SPACE = re.compile(rb'\s*')
+
+class UnsupportedLayout(ValueError):
+    """The aspec file cannot be split into spec objects by its raw bytes."""
+
+class ObjectHashes(NamedTuple):
+    """Content hashes of the spec objects of an aspec file, in file order."""
+    encoding: Optional[str]
+    digests: bytes  # DIGEST_SIZE bytes of the hash of each <specobject> element
+    keys: List[Optional[str]]  # Item key parsed from each spec object, None without an ID
+
+class SpecObject(NamedTuple):
+    """One <specobject> element as found by scan_aspec_file."""
+    offset: int  # Position of the element in the file
+    raw: bytes  # The element, from its start tag to its end tag
+    doctype: str  # doctype of its container
+
+class ModelChanges(NamedTuple):
+    """What update_model() changed in a model."""
+    added: List[str]
+    removed: List[str]
+    changed: List[str]  # Keys whose spec object content changed
+    previous: Dict[str, SpecItem]  # Former items of the changed and removed keys
+    previous_links: Dict[str, List[str]]  # Former outgoing links of the relinked keys
+    relinked: Set[str]  # Keys whose outgoing links changed
+    ids: Set[str]  # IDs whose items or order of versions changed
+    reordered: bool  # Whether the order of the items changed
+
+def scan_aspec_file(aspec_file: str, chunk_size: int = CHUNK_SIZE) -> Tuple[Optional[str], Iterator[SpecObject]]:
+    """Return the declared encoding and an iterator over the spec objects of an aspec file.
+
+    Like iter_spec_objects, only direct children of a doctype container below
+    the root element are spec objects. A fast scanner that only looks at the
+    tags of containers and spec objects splits files with plain markup. From
+    the first comment, CDATA section, DOCTYPE, processing instruction,
+    namespace or other markup it cannot judge on, the spec objects come from
+    offsets.scan_spec_objects, which reads the file with expat.
+
+    UnsupportedLayout is raised for encodings that are not ASCII compatible
+    right away, and for malformed XML while iterating. The file is read in
+    chunks of chunk_size bytes, so memory use does not grow with its size.
+    """
+    f = open(aspec_file, 'rb')
+    try:
+        encoding, objects = _scan_plain_objects(f, chunk_size)
+    except UnsupportedLayout:
+        f.seek(0)
+        # UTF-16 and UTF-32 files without a declaration start with a byte order mark
+        byte_order_mark = f.read(2) in (codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)
+        f.close()
+        encoding = xml_encoding(aspec_file)
+        _check_encoding('UTF-16' if byte_order_mark else encoding)
+        return encoding, _scan_xml_objects(aspec_file, chunk_size, 0)
+    except BaseException:
+        f.close()
+        raise
+    return encoding, _scan_with_fallback(f, objects, aspec_file, chunk_size)
+
+def _check_encoding(encoding: Optional[str]):
+    """Raise UnsupportedLayout unless text in the encoding can be split by its raw bytes."""
+    try:
+        if encoding and codecs.lookup(encoding).name.startswith(('utf-16', 'utf-32')):
+            raise UnsupportedLayout(f"{encoding} is not an ASCII compatible encoding")
+    except LookupError:
+        raise UnsupportedLayout(f"unknown encoding {encoding}") from None
+
+def _scan_with_fallback(f: BinaryIO, objects: Iterator[SpecObject], aspec_file: str,
+                        chunk_size: int) -> Iterator[SpecObject]:
+    """Yield the spec objects of the fast scanner, and the rest from expat once it gives up."""
+    found = 0
+    with f:
+        try:
+            for spec_object in objects:
+                yield spec_object
+                found += 1
+            return
+        except UnsupportedLayout:
+            pass
+    yield from _scan_xml_objects(aspec_file, chunk_size, found)
+
+def _scan_xml_objects(aspec_file: str, chunk_size: int, skip: int) -> Iterator[SpecObject]:
+    """Yield the spec objects expat finds in the file, after the first skip of them."""
+    try:
+        for offset, raw, doctype in itertools.islice(scan_spec_objects(aspec_file, chunk_size), skip, None):
+            yield SpecObject(offset, raw, doctype)
+    except expat.ExpatError as e:
+        raise UnsupportedLayout(f"malformed XML: {e}") from None
+
+def _scan_plain_objects(f: BinaryIO, chunk_size: int) -> Tuple[Optional[str], Iterator[SpecObject]]:
+    """Return the declared encoding and an iterator over the spec objects of a file with plain markup.
+
+    Raises UnsupportedLayout for markup the tags of containers and spec
+    objects are not enough for; errors in the prolog right away, the others
+    while iterating.
+    """
+    data = f.read(chunk_size)
+    # The prolog is complete with the end of the declaration and the name of the root element
+    while data.count(b'>') < 2:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+        data += chunk
+
+    position = len(codecs.BOM_UTF8) if data.startswith(codecs.BOM_UTF8) else 0
+    encoding = None
+    declaration = _DECLARATION.match(data, position)
+    if declaration:
+        match = _ENCODING.search(declaration.group())
+        encoding = match.group(1).decode('ascii') if match else None
+        position = declaration.end()
+    _check_encoding(encoding)
+
+    root = _ROOT.match(data, position)
+    if root is None or root.group(1) in (b'specobjects', b'specobject'):
+        raise UnsupportedLayout("the root element is not a report element")
+    return encoding, _scan_plain_tags(f, chunk_size, data, root.end(), encoding or 'utf-8')
+
+def _scan_plain_tags(f: BinaryIO, chunk_size: int, data: bytes, position: int,
+                     text_encoding: str) -> Iterator[SpecObject]:
+    """Yield the spec objects of the file after the start tag of the root element.
+
+    data holds the file from offset base on. Each pass scans the tags that end
+    before the last '>' read so far, which are complete, and then drops the
+    data that is no longer needed: everything before the open spec object, or
+    before the end of the last tag inside the open container, whose content
+    is checked when the next tag is found.
+    """
+    base = 0  # Offset of data in the file
+    doctype = None  # doctype of the open container, b'' when it has none
+    start = None  # Offset of the open spec object in data
+    last = 0  # End of the last tag inside the open container in data
+    searched = 0  # Offset in data up to which no namespace was found, minus the length of a match
+    doctypes = {}
+    eof = False
+    while not eof:
+        chunk = f.read(chunk_size)
+        eof = not chunk
+        data += chunk
+        end = len(data) if eof else max(data.rfind(b'>') + 1, position)
+
+        if b'xmlns' in data[searched:end] and _NAMESPACE.search(data, searched, end):
+            raise UnsupportedLayout("the document uses XML namespaces")
+        searched = max(end - len(b' xmlns='), searched)
+
+        for match in _TOKEN.finditer(data, position, end):
+            closing, name, attributes = match.groups()
+            if name is None:
+                raise UnsupportedLayout(f"unsupported markup at byte {base + match.start()}")
+            if not closing and not _ATTRIBUTES.fullmatch(attributes):
+                raise UnsupportedLayout(f"unsupported attributes at byte {base + match.start()}")
+            if start is not None and (name != b'specobject' or not closing):
+                raise UnsupportedLayout(f"nested <{name.decode()}> at byte {base + match.start()}")
+
+            if name == b'specobject':
+                if doctype is None or (closing and start is None):
+                    raise UnsupportedLayout(f"spec object outside of a container at byte {base + match.start()}")
+                if closing:
+                    if doctype:
+                        yield SpecObject(base + start, data[start:match.end()], doctypes[doctype])
+                    start = None
+                else:
+                    if not _SPACE.fullmatch(data, last, match.start()):
+                        raise UnsupportedLayout(f"unexpected content at byte {base + last}")
+                    if not attributes.endswith(b'/'):
+                        start = match.start()
+                    elif doctype:
+                        yield SpecObject(base + match.start(), match.group(), doctypes[doctype])
+                last = match.end()
+            elif closing:
+                if doctype is None:
+                    raise UnsupportedLayout(f"unbalanced </specobjects> at byte {base + match.start()}")
+                if not _SPACE.fullmatch(data, last, match.start()):
+                    raise UnsupportedLayout(f"unexpected content at byte {base + last}")
+                doctype = None
+            elif doctype is not None:
+                raise UnsupportedLayout(f"nested <specobjects> at byte {base + match.start()}")
+            elif not attributes.endswith(b'/'):
+                value = _DOCTYPE.search(attributes)
+                doctype = b'' if value is None else value.group(1) or value.group(2) or b''
+                if re.search(rb'[&\t\n\r]', doctype):
+                    raise UnsupportedLayout(f"unsupported doctype value at byte {base + match.start()}")
+                if doctype not in doctypes:
+                    doctypes[doctype] = doctype.decode(text_encoding)
+                last = match.end()
+
+        position = end
+        keep = min(start if start is not None else last if doctype is not None else position, searched)
+        data = data[keep:]
+        base += keep
+        position -= keep
+        last -= keep
+        searched -= keep
+        if start is not None:
+            start -= keep
+
+    if start is not None or doctype is not None:
+        raise UnsupportedLayout("unexpected end of file")
+
+def object_digest(raw: bytes) -> bytes:
+    """Return the content hash of the raw bytes of one spec object."""
+    return hashlib.blake2b(raw, digest_size=DIGEST_SIZE).digest()
+
+def hash_spec_objects(aspec_file: str, keys: Sequence[Optional[str]]) -> Optional[ObjectHashes]:
+    """Hash the spec objects of a parsed aspec file, given the key parsed from each of them.
+
+    Returns None when the file cannot be split into spec objects, or the
+    scanner finds a different number of them than the parser did.
+    """
+    try:
+        encoding, objects = scan_aspec_file(aspec_file)
+        digests = b''.join(object_digest(raw) for _, raw, _ in objects)
+    except UnsupportedLayout:
+        return None
+    if len(digests) != len(keys) * DIGEST_SIZE:
+        return None
+    return ObjectHashes(encoding, digests, list(keys))
+
+def update_model(model, hashes: ObjectHashes, aspec_file: str) -> Optional[Tuple[ModelChanges, ObjectHashes]]:
+    """Patch a parsed model in place to match a changed aspec file.
+
+    model is the (spec_items, id_map, covering_map, covered_by_map) tuple the
+    hashes were taken from. Spec objects whose content hash is unchanged keep
+    their SpecItem; only new and changed ones are parsed. The maps are
+    updated in place and end up exactly as a fresh parse would build them.
+
+    Returns the changes and the hashes of the new file, or None when the file
+    cannot be compared object by object; the model is left untouched then.
+    """
+    spec_items, id_map, covering_map, covered_by_map = model
+    # Only the last definition of a key is in the model and can be reused
+    last_positions = {key: position for position, key in enumerate(hashes.keys) if key is not None}
+    known = {hashes.digests[position * DIGEST_SIZE:(position + 1) * DIGEST_SIZE]: key
+             for key, position in last_positions.items()}
+
+    with profile_stage('scan') as stage:
+        digests = []
+        keys = []
+        new_items = {}
+        parsed = 0
+        try:
+            encoding, objects = scan_aspec_file(aspec_file)
+            if encoding != hashes.encoding:
+                return None
+            prefix = fragment_prefix(encoding)
+            for _, raw, doctype in objects:
+                digest = object_digest(raw)
+                key = known.get(digest)
+                # The doctype comes from the container, so it is not part of the hash
+                if key is not None and spec_items[key].doctype == doctype:
+                    item = spec_items[key]
+                else:
+                    item = parse_fragment(raw, doctype, prefix)
+                    key = item.key if item else None
+                    parsed += 1
+                digests.append(digest)
+                keys.append(key)
+                if item is not None:
+                    new_items[key] = item
+        except UnsupportedLayout:
+            return None
+        stage.count(objects=len(keys), parsed=parsed)
+
+    with profile_stage('diff') as stage:
+        added = [key for key in new_items if key not in spec_items]
+        removed = [key for key in spec_items if key not in new_items]
+        changed = [key for key, item in new_items.items() if key in spec_items and spec_items[key] is not item]
+        reordered = bool(added or removed) or any(old != new for old, new in zip(spec_items, new_items))
+
+        outgoing = {key: covered_keys(new_items[key]) for key in added + changed}
+        incoming = {key: covering_keys(new_items[key]) for key in added + changed}
+        relinked = {key for key in removed if covering_map.get(key)}
+        relinked.update(key for key, targets in outgoing.items() if targets != covering_map.get(key, []))
+        ids = {item.id for item in (new_items.get(key) or spec_items[key] for key in added + removed + changed)}
+        occurrences_changed = keys != hashes.keys
+        if occurrences_changed:
+            new_id_map = defaultdict(list)
+            for key in keys:
+                if key is not None:
+                    new_id_map[new_items[key].id].append(key)
+            ids.update(spec_id for spec_id in new_id_map.keys() | id_map.keys()
+                       if new_id_map.get(spec_id) != id_map.get(spec_id))
+        stage.count(changed=len(added) + len(removed) + len(changed))
+
+    changes = ModelChanges(
+        added=added, removed=removed, changed=changed,
+        previous={key: spec_items[key] for key in changed + removed},
+        previous_links={key: covering_map.get(key, []) for key in relinked},
+        relinked=relinked, ids=ids, reordered=reordered)
+
+    # Nothing above touched the model, so a failure leaves it as it was
+    if reordered:
+        spec_items.clear()
+        spec_items.update(new_items)
+    else:
+        for key in changed:
+            spec_items[key] = new_items[key]
+    if occurrences_changed:
+        id_map.clear()
+        id_map.update(new_id_map)
+    _patch_links(covering_map, spec_items, outgoing, reordered)
+    _patch_links(covered_by_map, spec_items, incoming, reordered)
+
+    return changes, ObjectHashes(encoding, b''.join(digests), keys)
+
+def _patch_links(links, spec_items, updated: Dict[str, List[str]], reordered: bool):
+    """Replace the link lists of updated keys, keeping the map in spec_items order."""
+    if not reordered and all(bool(targets) == bool(links.get(key)) for key, targets in updated.items()):
+        for key, targets in updated.items():
+            if targets:
+                links[key] = targets
+        return
+
+    entries = [(key, updated[key] if key in updated else links.get(key)) for key in spec_items]
+    links.clear()
+    links.update((key, targets) for key, targets in entries if targets)
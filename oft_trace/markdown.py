@@ -0,0 +1,143 @@
+"""Importer for specification items written in OpenFastTrace markdown."""
+import re
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+
+MARKDOWN_SUFFIXES = ('.md', '.markdown')
+# Item statuses OpenFastTrace reads from a "Status:" line; other values are plain text
+ITEM_STATUSES = ('approved', 'proposed', 'draft')
+
+# type~name~revision, e.g. req~login.form~2
+ID_PATTERN = r"([A-Za-z]+)~([A-Za-z][\w-]*(?:\.[A-Za-z][\w-]*)*)~(\d+)"
+ID_REFERENCE = re.compile(ID_PATTERN)
+ID_LINE = re.compile(r"^\s*(?:<a\s+id=\"[^\"]*\"\s*>\s*</a>\s*)?`?" + ID_PATTERN + r"`?\s*$")
+# `dsn --> impl, utest : req~name~1` defines dsn~name~1 covering the requirement
+FORWARD_LINE = re.compile(r"^\s*`?([A-Za-z]+)\s*-->\s*([A-Za-z]+(?:\s*,\s*[A-Za-z]+)*)\s*:\s*" + ID_PATTERN + r"`?\s*$")
+TITLE_LINE = re.compile(r"^#+\s*(.*)$")
+SECTION_LINE = re.compile(r"^(Needs|Covers|Depends|Tags|Rationale|Comment|Status):\s*(.*)$")
+LIST_LINE = re.compile(r"^\s*[*+-]\s+(.*)$")
+
+class ImportedItem(NamedTuple):
+    """A specification item as written in a markdown file, before tracing."""
+    doctype: str
+    name: str
+    revision: str
+    title: str = ""
+    description: str = ""
+    status: str = "approved"
+    needs: Tuple[str, ...] = ()
+    covers: Tuple[Tuple[str, str, str], ...] = ()  # (doctype, name, revision) references
+    sourcefile: str = ""
+    sourceline: str = ""
+
+def is_markdown_file(path: str) -> bool:
+    """Check if a path names a markdown file by its suffix."""
+    return path.lower().endswith(MARKDOWN_SUFFIXES)
+
+class _ItemBuilder:
+    """Collects the lines of the item being read."""
+
+    def __init__(self, doctype, name, revision, title, sourcefile, line_number):
+        self.fields = {"doctype": doctype, "name": name, "revision": revision, "title": title or "",
+                       "sourcefile": sourcefile, "sourceline": str(line_number)}
+        self.description = []
+        self.needs = []
+        self.covers = []
+        self.section = "description"
+
+    def build(self) -> ImportedItem:
+        return ImportedItem(description="\n".join(self.description).strip(), needs=tuple(self.needs),
+                            covers=tuple(self.covers), **self.fields)
+
+def parse_markdown_lines(lines: Iterable[str], sourcefile: str = "") -> List[ImportedItem]:
+    """Read the specification items from the lines of an OpenFastTrace markdown document.
+
+    An item starts at a line holding only its ID, optionally in backticks,
+    and takes the heading right above it as title. The text that follows is
+    the description, up to the sections "Needs:" (comma-separated artifact
+    types), "Covers:" (a list of item IDs, plain, in backticks or as links)
+    and "Status:". "Depends:", "Tags:", "Rationale:" and "Comment:" are
+    recognized so they end the description, but are not kept. The next
+    heading or ID ends the item.
+    """
+    items = []
+    current: Optional[_ItemBuilder] = None
+    title = None
+
+    def finish():
+        nonlocal current
+        if current is not None:
+            items.append(current.build())
+            current = None
+
+    for line_number, line in enumerate(lines, 1):
+        line = line.rstrip("\r\n")
+
+        match = ID_LINE.match(line)
+        if match:
+            finish()
+            current = _ItemBuilder(*match.groups(), title, sourcefile, line_number)
+            title = None
+            continue
+
+        match = FORWARD_LINE.match(line)
+        if match:
+            finish()
+            doctype, needs, covered_doctype, name, revision = match.groups()
+            current = _ItemBuilder(doctype, name, revision, title, sourcefile, line_number)
+            current.needs.extend(need.strip() for need in needs.split(","))
+            current.covers.append((covered_doctype, name, revision))
+            finish()
+            title = None
+            continue
+
+        match = TITLE_LINE.match(line)
+        if match:
+            finish()
+            title = match.group(1)
+            continue
+
+        if not line.strip():
+            if current is not None and current.section == "description":
+                current.description.append("")
+            continue
+
+        title = None
+        if current is None:
+            continue
+
+        match = SECTION_LINE.match(line)
+        if match:
+            section, value = match.group(1).lower(), match.group(2).strip()
+            if section == "status":
+                if value in ITEM_STATUSES:
+                    current.fields["status"] = value
+                    current.section = None
+                    continue
+            else:
+                current.section = section
+                if section == "needs":
+                    current.needs.extend(need.strip() for need in value.split(",") if need.strip())
+                continue
+
+        match = LIST_LINE.match(line)
+        if match and current.section in ("covers", "depends", "needs", "tags"):
+            if current.section == "covers":
+                reference = ID_REFERENCE.search(match.group(1))
+                if reference:
+                    current.covers.append(reference.groups())
+            elif current.section == "needs":
+                current.needs.extend(need.strip() for need in match.group(1).split(",") if need.strip())
+            continue
+
+        if current.section in ("rationale", "comment"):
+            continue
+        current.section = "description"
+        current.description.append(line)
+
+    finish()
+    return items
+
+def import_markdown_file(path: str) -> List[ImportedItem]:
+    """Read the specification items from a markdown file."""
+    with open(path, encoding="utf-8") as f:
+        return parse_markdown_lines(f, path)
@@ -1,30 +1,170 @@
 """Data models for specification items and their relationships."""
+import sys
+from collections.abc import Mapping
 from typing import Dict, List, Optional, Any, Set
 
+# Doctypes of items at the end of a trace chain that don't need coverage themselves
+LEAF_DOCTYPES = frozenset(['impl', 'implementation', 'code', 'test', 'testcase'])
+
+def intern_text(text: Optional[str]) -> Optional[str]:
+    """Intern a repeated string such as an ID, version, doctype or status value."""
+    return sys.intern(text) if text is not None else None
+
+def classify_coverage(doctype: str, covers: bool, covering_statuses, deep_status: Optional[str],
+                      shallow_status: Optional[str]) -> str:
+    """Classify the coverage OpenFastTrace reported for an item.
+    
+    covers tells whether the item covers other items and covering_statuses
+    holds the coveringStatus of each item covering it.
+    """
+    # Implementation items that cover other items don't need to be covered themselves
+    if covers and doctype.lower() in LEAF_DOCTYPES:
+        return "COVERED"
+    
+    if 'COVERING_WRONG_VERSION' in covering_statuses:
+        return "OUTDATED"
+    
+    if deep_status == 'UNCOVERED' and shallow_status == 'COVERED':
+        return "SHALLOW"
+    
+    # Orphaned: not covered by any other item (leaf items were handled above)
+    if not covering_statuses:
+        return "ORPHANED"
+    
+    status = deep_status if deep_status is not None else shallow_status
+    if status == "UNCOVERED":
+        return "UNCOVERED"
+    if status == "COVERED":
+        return "COVERED"
+    return "UNKNOWN"
+
+class Record(Mapping):
+    """Compact fixed-layout record with read-only dict-style access.
+    
+    Records map the aspec field names listed in ``fields`` onto slots. Fields
+    that are None are treated as missing, so a record behaves like the dict of
+    the fields that were present in the aspec file.
+    """
+    __slots__ = ()
+    fields = ()
+    
+    def __init__(self, **values):
+        for field in self.fields:
+            setattr(self, field, values.get(field))
+    
+    def __getitem__(self, key):
+        if key in self.fields:
+            value = getattr(self, key)
+            if value is not None:
+                return value
+        raise KeyError(key)
+    
+    def __iter__(self):
+        for field in self.fields:
+            if getattr(self, field) is not None:
+                yield field
+    
+    def __len__(self):
+        return sum(1 for _ in self)
+    
+    def __repr__(self):
+        return f"{type(self).__name__}({dict(self)!r})"
+    
+    def __getstate__(self):
+        return tuple(getattr(self, field) for field in self.fields)
+    
+    def __setstate__(self, state):
+        for field, value in zip(self.fields, state):
+            setattr(self, field, value)
+
+class CoveredItem(Record):
+    """Reference from an item to an item it covers."""
+    __slots__ = fields = ('id', 'version', 'doctype')
+
+class CoveringItem(Record):
+    """Entry for an item covering another one, with its covering status."""
+    __slots__ = fields = ('id', 'version', 'doctype', 'status',
+                          'ownCoverageStatus', 'deepCoverageStatus', 'coveringStatus')
+
+class Coverage(Record):
+    """Coverage information for an item as computed by OpenFastTrace."""
+    __slots__ = fields = ('shallowCoverageStatus', 'deepCoverageStatus', 'coveringItems',
+                          'coveredTypes', 'uncoveredTypes')
+
 class SpecItem:
     """Representation of a specification item from an aspec file."""
     
+    __slots__ = ('id', 'version', 'doctype', 'key', 'title', 'shortdesc', 'description', 'status',
+                 'sourcefile', 'sourceline', '_coverage', '_covers', '_in_circular_dependency',
+                 '_coverage_type')
+    # Slots saved when pickling; the memoized coverage type is recomputed on demand
+    _state_slots = __slots__[:-1]
+    
     def __init__(self, item_id: str, version: str, doctype: str):
-        self.id = item_id
-        self.version = version
-        self.doctype = doctype
-        self.key = f"{item_id}~{version}"
+        self.id = intern_text(item_id)
+        self.version = intern_text(version)
+        self.doctype = intern_text(doctype)
+        self.key = intern_text(f"{item_id}~{version}")
         self.title = ""
         self.shortdesc = ""
         self.description = ""
         self.status = ""
         self.sourcefile = ""
         self.sourceline = ""
-        self.coverage = {}
+        self.coverage = Coverage()
         self.covers = []
         self.in_circular_dependency = False
-        
+    
+    def __getstate__(self):
+        return tuple(getattr(self, slot) for slot in self._state_slots)
+    
+    def __setstate__(self, state):
+        for slot, value in zip(self._state_slots, state):
+            setattr(self, slot, value)
+        self._coverage_type = None
+    
+    # Assigning any input of the coverage classification drops the memoized result
+    
+    @property
+    def coverage(self) -> Coverage:
+        """Coverage information reported by OpenFastTrace."""
+        return self._coverage
+    
+    @coverage.setter
+    def coverage(self, value: Coverage):
+        self._coverage = value
+        self._coverage_type = None
+    
+    @property
+    def covers(self) -> List[CoveredItem]:
+        """Items that this item covers."""
+        return self._covers
+    
+    @covers.setter
+    def covers(self, value: List[CoveredItem]):
+        self._covers = value
+        self._coverage_type = None
+    
+    @property
+    def in_circular_dependency(self) -> bool:
+        """Whether this item is part of a circular dependency."""
+        return self._in_circular_dependency
+    
+    @in_circular_dependency.setter
+    def in_circular_dependency(self, value: bool):
+        self._in_circular_dependency = value
+        self._coverage_type = None
+    
+    def invalidate_coverage(self):
+        """Drop the memoized coverage type after coverage data was changed in place."""
+        self._coverage_type = None
+    
     @property
     def is_orphaned(self) -> bool:
         """Check if this item is orphaned (not covered by any other item)."""
-        if 'coveringItems' not in self.coverage or not self.coverage['coveringItems']:
+        if not self.coverage.coveringItems:
             # Check if this is an implementation type or a "leaf" type that doesn't need coverage
-            if self.doctype.lower() in ['impl', 'implementation', 'code', 'test', 'testcase']:
+            if self.doctype.lower() in LEAF_DOCTYPES:
                 # If this item covers something else, it's a valid leaf node 
                 return len(self.covers) == 0
             return True
@@ -33,71 +173,73 @@ class SpecItem:
     @property
     def is_outdated(self) -> bool:
         """Check if this item has version mismatch issues."""
-        if 'coveringItems' not in self.coverage:
-            return False
-        
-        for covering in self.coverage['coveringItems']:
-            if covering.get('coveringStatus') == 'COVERING_WRONG_VERSION':
+        for covering in self.coverage.coveringItems or ():
+            if covering.coveringStatus == 'COVERING_WRONG_VERSION':
                 return True
         return False
     
     @property
     def is_shallow_covered(self) -> bool:
         """Check if this item has only shallow coverage."""
-        if 'deepCoverageStatus' in self.coverage and self.coverage['deepCoverageStatus'] == 'UNCOVERED':
-            if 'shallowCoverageStatus' in self.coverage and self.coverage['shallowCoverageStatus'] == 'COVERED':
-                return True
-        return False
+        return (self.coverage.deepCoverageStatus == 'UNCOVERED' and
+                self.coverage.shallowCoverageStatus == 'COVERED')
     
     @property 
     def coverage_status(self) -> str:
         """Get the overall coverage status of this item."""
-        if 'deepCoverageStatus' in self.coverage:
-            return self.coverage['deepCoverageStatus']
-        if 'shallowCoverageStatus' in self.coverage:
-            return self.coverage['shallowCoverageStatus']
+        if self.coverage.deepCoverageStatus is not None:
+            return self.coverage.deepCoverageStatus
+        if self.coverage.shallowCoverageStatus is not None:
+            return self.coverage.shallowCoverageStatus
         return "UNKNOWN"
     
     @property
     def coverage_type(self) -> str:
-        """Get a descriptive type of coverage issue."""
+        """Get a descriptive type of coverage issue.
+        
+        The classification is computed once and kept until coverage, covers or
+        in_circular_dependency is assigned or invalidate_coverage() is called.
+        """
+        if self._coverage_type is None:
+            self._coverage_type = self._classify()
+        return self._coverage_type
+    
+    @property
+    def reported_coverage_type(self) -> str:
+        """Get the coverage type from the OFT coverage data alone, ignoring circular dependencies."""
+        if self._in_circular_dependency:
+            return self._classify_coverage()
+        return self.coverage_type
+    
+    def _classify(self) -> str:
+        """Classify the coverage of this item in a single pass over its coverage data."""
         # Handle special cases first
         
         # 1. Circular dependency
-        if self.in_circular_dependency:
+        if self._in_circular_dependency:
             return "CIRCULAR"
-            
-        # 2. Implementation items that cover other items don't need to be covered themselves
-        if self.doctype.lower() in ['impl', 'implementation', 'code', 'test', 'testcase'] and self.covers:
-            return "COVERED"
-            
-        # Regular flow for other items
-        if self.is_outdated:
-            return "OUTDATED"
-        if self.is_shallow_covered:
-            return "SHALLOW"
-        if self.is_orphaned:
-            return "ORPHANED"
-        if self.coverage_status == "UNCOVERED":
-            return "UNCOVERED"
-        if self.coverage_status == "COVERED":
-            return "COVERED"
-        return "UNKNOWN"
+        
+        return self._classify_coverage()
+    
+    def _classify_coverage(self) -> str:
+        """Classify the coverage data reported by OpenFastTrace."""
+        coverage = self._coverage
+        covering_items = coverage.coveringItems
+        covering_statuses = [covering.coveringStatus for covering in covering_items] if covering_items else ()
+        return classify_coverage(self.doctype, bool(self._covers), covering_statuses,
+                                 coverage.deepCoverageStatus, coverage.shallowCoverageStatus)
     
     def get_uncovered_types(self) -> List[str]:
         """Get list of uncovered artifact types."""
-        if 'uncoveredTypes' in self.coverage:
-            return self.coverage['uncoveredTypes']
+        if self.coverage.uncoveredTypes is not None:
+            return self.coverage.uncoveredTypes
         return []
     
     def get_version_mismatches(self) -> List[Dict[str, Any]]:
         """Get detailed information about version mismatches."""
         mismatches = []
-        if 'coveringItems' not in self.coverage:
-            return mismatches
-            
-        for covering in self.coverage['coveringItems']:
-            if covering.get('coveringStatus') == 'COVERING_WRONG_VERSION':
+        for covering in self.coverage.coveringItems or ():
+            if covering.coveringStatus == 'COVERING_WRONG_VERSION':
                 mismatches.append({
                     'id': covering['id'],
                     'current_version': covering.get('version', 'unknown'),
@@ -0,0 +1,363 @@
+"""Sidecar offset index for loading single trace chains from large aspec files."""
+import os
+import json
+import zlib
+import struct
+from collections import defaultdict
+from typing import Dict, List, NamedTuple, Optional, Set
+from xml.parsers import expat
+
+# Bump when the layout of the index file changes
+INDEX_FORMAT = 1
+INDEX_SUFFIX = ".idx"
+# The header is rewritten in place once the offsets of the sections are known
+HEADER_SIZE = 512
+_OFFSET = struct.Struct('<Q')
+
+class IndexRecord(NamedTuple):
+    """Where one spec object is in the aspec file, and how it is linked."""
+    key: str
+    doctype: str
+    offset: int
+    length: int
+    component: int  # Circular dependency the item is part of, or -1
+    outgoing: List[str]  # Keys of the items it covers
+    incoming: List[str]  # Keys of the items covering it
+
+def index_path(aspec_file: str) -> str:
+    """Return the path of the sidecar index of an aspec file."""
+    return aspec_file + INDEX_SUFFIX
+
+def _id_of(key: str) -> str:
+    return key.rsplit('~', 1)[0]
+
+def _bucket(spec_id: str, buckets: int) -> int:
+    return zlib.crc32(spec_id.encode('utf-8')) % buckets
+
+def scan_spec_objects(aspec_file: str, chunk_size: int = 1024 * 1024):
+    """Yield (offset, fragment, doctype) for every spec object in one pass over the file.
+
+    The fragment holds the raw bytes of the <specobject> element. Like
+    iter_spec_objects, only direct children of a doctype container below the
+    root element are spec objects. Malformed XML raises expat.ExpatError.
+    """
+    # Namespaced elements get a "uri name" tag, so like with ElementTree they are not spec objects
+    parser = expat.ParserCreate(namespace_separator=' ')
+    path = []  # doctype attribute of the open elements, from the root down
+    found = []
+    state = {'object': None}
+    buffer = bytearray()
+    buffer_start = 0  # File offset of buffer[0]
+
+    def start_element(tag, attributes):
+        if tag == 'specobject' and state['object'] is None and len(path) > 1 and path[-1] is not None:
+            state['object'] = (parser.CurrentByteIndex, path[-1], len(path))
+        path.append(attributes.get('doctype'))
+
+    def end_element(tag):
+        path.pop()
+        current = state['object']
+        if current is None or tag != 'specobject' or len(path) != current[2]:
+            return
+        offset, doctype, _ = current
+        end = buffer.index(b'>', parser.CurrentByteIndex - buffer_start) + 1
+        found.append((offset, bytes(buffer[offset - buffer_start:end]), doctype))
+        state['object'] = None
+
+    parser.StartElementHandler = start_element
+    parser.EndElementHandler = end_element
+
+    with open(aspec_file, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            buffer += chunk
+            parser.Parse(chunk, False)
+            yield from found
+            found.clear()
+
+            # Keep only the bytes of the spec object being read, or of a tag expat has not finished
+            if state['object']:
+                keep_from = state['object'][0]
+            else:
+                last_tag = buffer.rfind(b'<')
+                keep_from = buffer_start + (last_tag if last_tag >= 0 else len(buffer))
+            del buffer[:keep_from - buffer_start]
+            buffer_start = keep_from
+        parser.Parse(b'', True)
+        yield from found
+
+def fragment_prefix(encoding: Optional[str]) -> bytes:
+    """Return the XML declaration a fragment needs to be parsed on its own."""
+    if encoding is None or encoding.lower().replace('_', '-') in ('utf-8', 'utf8'):
+        return b''
+    return f'<?xml version="1.0" encoding="{encoding}"?>'.encode('ascii')
+
+def parse_fragment(fragment: bytes, doctype: str, prefix: bytes = b''):
+    """Parse the raw bytes of one <specobject> element into a SpecItem, or None without an ID."""
+    import xml.etree.ElementTree as ET
+    from oft_trace.parser import parse_spec_object
+
+    return parse_spec_object(ET.fromstring(prefix + fragment), doctype)
+
+def xml_encoding(aspec_file: str) -> Optional[str]:
+    """Return the encoding the XML declaration of a file names, or None without one."""
+    parser = expat.ParserCreate()
+    encoding = []
+    parser.XmlDeclHandler = lambda version, declared, standalone: encoding.append(declared)
+    with open(aspec_file, 'rb') as f:
+        try:
+            parser.Parse(f.readline(), False)
+        except expat.ExpatError:
+            pass
+    return encoding[0] if encoding else None
+
+def build_offset_index(aspec_file: str, index_file: Optional[str] = None) -> Dict[str, int]:
+    """Write the sidecar index of an aspec file in one streaming pass over it.
+
+    The index records the byte range of every spec object with the keys of
+    its outgoing and incoming links, a hash table from item IDs to records
+    and the members of every circular dependency. Returns the counts of
+    items, links and cycles.
+    """
+    from oft_trace.graph import TraceGraph
+    from oft_trace.parser import covered_keys, covering_keys
+    from oft_trace.profiling import profile_stage
+
+    index_file = index_file or index_path(aspec_file)
+    stat = os.stat(aspec_file)
+    encoding = xml_encoding(aspec_file)
+    prefix = fragment_prefix(encoding)
+
+    records = []
+    with profile_stage('scan') as stage:
+        for offset, fragment, doctype in scan_spec_objects(aspec_file):
+            item = parse_fragment(fragment, doctype, prefix)
+            if item is not None:
+                records.append(IndexRecord(item.key, item.doctype, offset, len(fragment), -1,
+                                           covered_keys(item), covering_keys(item)))
+        stage.count(items=len(records))
+
+    # Later definitions of a key replace earlier ones, as in the parsed model
+    with profile_stage('cycles') as stage:
+        last = {record.key: record for record in records}
+        graph = TraceGraph.from_maps(last, {key: record.outgoing for key, record in last.items()
+                                            if record.outgoing}, {})
+        cycles = graph.find_cycles()
+        component_of = {graph.keys[node]: number for number, cycle in enumerate(cycles) for node in cycle}
+        records = [record._replace(component=component_of.get(record.key, -1)) for record in records]
+        stage.count(cycles=len(cycles))
+
+    # Write to a temporary file first so readers never see a partial index
+    tmp_path = f"{index_file}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(b' ' * HEADER_SIZE)
+
+            positions = []
+            ids = defaultdict(list)
+            for record in records:
+                positions.append(f.tell())
+                ids[_id_of(record.key)].append(positions[-1])
+                f.write(json.dumps(list(record), ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n')
+
+            # Hash table from item IDs to the positions of their records, in file order
+            buckets = [[] for _ in range(max(1, len(ids)))]
+            for spec_id, id_positions in ids.items():
+                buckets[_bucket(spec_id, len(buckets))].append([spec_id, id_positions])
+            bucket_offsets = []
+            for bucket in buckets:
+                bucket_offsets.append(f.tell() if bucket else 0)
+                if bucket:
+                    f.write(json.dumps(bucket, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n')
+            bucket_table = f.tell()
+            f.write(b''.join(_OFFSET.pack(offset) for offset in bucket_offsets))
+
+            # Every record of every key in a cycle, so a cycle is always loaded completely
+            members = defaultdict(list)
+            for position, record in zip(positions, records):
+                if record.component >= 0:
+                    members[record.component].append(position)
+            component_offsets = []
+            for number in range(len(cycles)):
+                component_offsets.append(f.tell())
+                f.write(json.dumps(members[number]).encode('ascii') + b'\n')
+            component_table = f.tell()
+            f.write(b''.join(_OFFSET.pack(offset) for offset in component_offsets))
+
+            header = json.dumps({
+                "format": INDEX_FORMAT, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "encoding": encoding,
+                "buckets": len(buckets), "bucket_table": bucket_table,
+                "components": len(cycles), "component_table": component_table,
+            }).encode('utf-8')
+            if len(header) >= HEADER_SIZE:
+                raise ValueError("Index header is too large")
+            f.seek(0)
+            f.write(header.ljust(HEADER_SIZE - 1) + b'\n')
+        os.replace(tmp_path, index_file)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+    return {"items": len(records), "links": sum(len(record.outgoing) for record in last.values()),
+            "cycles": len(cycles)}
+
+class OffsetIndex:
+    """Read access to the sidecar index of an aspec file.
+
+    Use open_offset_index() to get an index only when it is up to date.
+    """
+
+    def __init__(self, aspec_file: str, index_file: str):
+        self.aspec_file = aspec_file
+        self._file = open(index_file, 'rb')
+        try:
+            self.header = json.loads(self._file.read(HEADER_SIZE))
+        except ValueError:
+            self.header = {}
+        self._records = {}  # ID -> records, in file order
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def is_current(self) -> bool:
+        """Check that the index was written for the aspec file as it is now."""
+        try:
+            stat = os.stat(self.aspec_file)
+        except OSError:
+            return False
+        header = self.header
+        return (header.get("format") == INDEX_FORMAT and header.get("size") == stat.st_size
+                and header.get("mtime_ns") == stat.st_mtime_ns)
+
+    def _read_line(self, offset: int):
+        self._file.seek(offset)
+        return json.loads(self._file.readline())
+
+    def _read_offset(self, table: int, position: int) -> int:
+        self._file.seek(table + position * _OFFSET.size)
+        return _OFFSET.unpack(self._file.read(_OFFSET.size))[0]
+
+    def _record_at(self, position: int) -> IndexRecord:
+        return IndexRecord(*self._read_line(position))
+
+    def records(self, spec_id: str) -> List[IndexRecord]:
+        """Return the records of all definitions of an item ID, in file order."""
+        records = self._records.get(spec_id)
+        if records is None:
+            records = []
+            bucket_offset = self._read_offset(self.header["bucket_table"], _bucket(spec_id, self.header["buckets"]))
+            if bucket_offset:
+                for bucket_id, positions in self._read_line(bucket_offset):
+                    if bucket_id == spec_id:
+                        records = [self._record_at(position) for position in positions]
+                        break
+            self._records[spec_id] = records
+        return records
+
+    def record(self, key: str) -> Optional[IndexRecord]:
+        """Return the record of an item key; the last one if the key is defined more than once."""
+        found = None
+        for record in self.records(_id_of(key)):
+            if record.key == key:
+                found = record
+        return found
+
+    def find(self, spec_id: str, doctype: Optional[str] = None, version: Optional[str] = None) -> Optional[str]:
+        """Find an item key by ID and optionally doctype and version, like TraceAnalyzer.get_item_by_id."""
+        definitions = {}
+        for record in self.records(spec_id):
+            definitions[record.key] = record
+        if version:
+            record = definitions.get(f"{spec_id}~{version}")
+            if record is not None and (doctype is None or record.doctype == doctype):
+                return record.key
+            return None
+        for key, record in definitions.items():
+            if doctype is None or record.doctype == doctype:
+                return key
+        return None
+
+    def trace_chain(self, item_key: str, direction: str = 'both') -> Set[str]:
+        """Return the keys of the items the trace chain of an item reaches.
+
+        Covered items are followed outgoing and covering items incoming, as
+        the trace chain is rendered. Keys of items not in the report are left
+        out.
+        """
+        chain = {item_key}
+        walks = []
+        if direction in ('both', 'outgoing'):
+            walks.append(lambda record: record.outgoing)
+        if direction in ('both', 'incoming'):
+            walks.append(lambda record: record.incoming)
+
+        for linked in walks:
+            visited = {item_key}
+            pending = [item_key]
+            while pending:
+                record = self.record(pending.pop())
+                for key in linked(record):
+                    if key not in visited and self.record(key) is not None:
+                        visited.add(key)
+                        pending.append(key)
+            chain |= visited
+        return chain
+
+    def load(self, keys) -> tuple:
+        """Parse the spec objects needed to show the given items.
+
+        Besides the items themselves, every other version of their IDs and
+        every member of a circular dependency they are part of is loaded, so
+        version mismatches and cycles come out as with the full model.
+        Returns (spec_items, id_map, covering_map, covered_by_map).
+        """
+        from oft_trace.parser import build_relationship_maps
+
+        spec_ids = {_id_of(key) for key in keys}
+        for key in keys:
+            record = self.record(key)
+            if record.component >= 0:
+                offset = self._read_offset(self.header["component_table"], record.component)
+                spec_ids.update(_id_of(self._record_at(position).key) for position in self._read_line(offset))
+
+        records = sorted((record for spec_id in spec_ids for record in self.records(spec_id)),
+                         key=lambda record: record.offset)
+        spec_items = {}
+        id_map = defaultdict(list)
+        covering_map = defaultdict(list)
+        covered_by_map = defaultdict(list)
+        prefix = fragment_prefix(self.header.get("encoding"))
+        with open(self.aspec_file, 'rb') as f:
+            for record in records:
+                f.seek(record.offset)
+                item = parse_fragment(f.read(record.length), record.doctype, prefix)
+                spec_items[item.key] = item
+                id_map[item.id].append(item.key)
+
+        build_relationship_maps(spec_items, covering_map, covered_by_map)
+        return spec_items, id_map, covering_map, covered_by_map
+
+    def load_trace_chain(self, spec_id: str, doctype: Optional[str] = None, version: Optional[str] = None,
+                         direction: str = 'both') -> tuple:
+        """Load the model for the trace chain of one item; the model is empty if the item is not found."""
+        item_key = self.find(spec_id, doctype, version)
+        keys = self.trace_chain(item_key, direction) if item_key else set()
+        return self.load(keys)
+
+def open_offset_index(aspec_file: str, index_file: Optional[str] = None) -> Optional[OffsetIndex]:
+    """Open the sidecar index of an aspec file, or return None if it is missing or out of date."""
+    index_file = index_file or index_path(aspec_file)
+    try:
+        index = OffsetIndex(aspec_file, index_file)
+    except OSError:
+        return None
+    if not index.is_current():
+        index.close()
+        return None
+    return index
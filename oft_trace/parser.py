@@ -5,52 +5,114 @@ import xml.etree.ElementTree as ET
 from collections import defaultdict
 from typing import Dict, List, Set, Tuple, Optional
 
-from rich.console import Console
-from rich.progress import Progress, SpinnerColumn, TextColumn, BarColumn, TimeElapsedColumn
-
-from oft_trace.models import SpecItem
+from oft_trace.models import SpecItem, Coverage, CoveringItem, CoveredItem, intern_text
 from oft_trace.analyzer import TraceAnalyzer  # Add this import
+from oft_trace.cache import DEFAULT_CACHE_MAX_SIZE
+from oft_trace.console import console
+from oft_trace.profiling import profile_stage
 
-console = Console()
+def parse_aspec_file(aspec_file: str, streaming: bool = True) -> Tuple[Dict[str, SpecItem], defaultdict, defaultdict, defaultdict, List[str]]:
+    """Parse and analyze an aspec XML file and return the items and relationship maps.
+    
+    By default the file is read incrementally so that only one <specobject>
+    element is held in memory at a time. Pass streaming=False to build the
+    full DOM instead.
+    """
+    from oft_trace.pipeline import AnalysisPipeline
+    
+    pipeline = AnalysisPipeline(aspec_file, use_cache=False, streaming=streaming)
+    return pipeline.run().as_tuple()
 
-def parse_aspec_file(aspec_file: str) -> Tuple[Dict[str, SpecItem], defaultdict, defaultdict, defaultdict, List[str]]:
-    """Parse an aspec XML file and return the items and relationship maps."""
+def parse_aspec_model(aspec_file: str, streaming: bool = True,
+                      object_keys: Optional[List[Optional[str]]] = None) -> Tuple[Dict[str, SpecItem], defaultdict, defaultdict, defaultdict]:
+    """Parse an aspec XML file into the items, ID map and relationship maps, without analysis.
+    
+    If object_keys is given, the key of every spec object in file order is
+    appended to it, or None for spec objects without an ID.
+    """
     spec_items = {}  # Dictionary of all items by id~version
     id_map = defaultdict(list)  # Map of ID to all versions
     covering_map = defaultdict(list)  # Map of what each item covers (outgoing)
     covered_by_map = defaultdict(list)  # Map of what covers each item (incoming)
-    broken_chains = []  # List of items with broken chains
 
     try:
-        tree = ET.parse(aspec_file)
-        root = tree.getroot()
-        
-        # Find all spec objects across all doctypes
-        for spec_objects in root.findall('.//*[@doctype]'):
-            doctype = spec_objects.get('doctype')
+        with profile_stage('xml') as stage:
+            spec_objects = iter_spec_objects(aspec_file) if streaming else find_spec_objects(aspec_file)
             
-            for spec_object in spec_objects.findall('./specobject'):
+            # Find all spec objects across all doctypes
+            for spec_object, doctype in spec_objects:
                 item = parse_spec_object(spec_object, doctype)
+                if object_keys is not None:
+                    object_keys.append(item.key if item else None)
                 if item:
-                    item_key = f"{item.id}~{item.version}"
+                    item_key = item.key
                     spec_items[item_key] = item
                     id_map[item.id].append(item_key)
+            stage.count(items=len(spec_items))
         
         # Build relationship maps
-        build_relationship_maps(spec_items, covering_map, covered_by_map)
-        
-        # Find broken chains
-        broken_chains = identify_broken_chains(spec_items)
-        
-        # Analyze the aspec file
-        analyzer = analyze_aspec(spec_items, id_map, covering_map, covered_by_map, broken_chains)
+        with profile_stage('links') as stage:
+            build_relationship_maps(spec_items, covering_map, covered_by_map)
+            stage.count(links=sum(len(targets) for targets in covering_map.values()))
         
-        return spec_items, id_map, covering_map, covered_by_map, broken_chains
+        return spec_items, id_map, covering_map, covered_by_map
     
     except Exception as e:
         console.print(f"[bold red]Error parsing aspec file:[/] {e}")
         sys.exit(1)
 
+def load_aspec_file(aspec_file: str, use_cache: bool = True, cache_dir: Optional[str] = None,
+                    cache_max_size: Optional[int] = DEFAULT_CACHE_MAX_SIZE):
+    """Load an aspec file, reusing a cached model when the file is unchanged.
+    
+    Returns the same tuple as parse_aspec_file. The cache is keyed by the size,
+    modification time and content hash of the file, so any change to the file
+    leads to a fresh parse.
+    """
+    from oft_trace.pipeline import AnalysisPipeline
+    
+    pipeline = AnalysisPipeline(aspec_file, use_cache, cache_dir, cache_max_size)
+    return pipeline.run().as_tuple()
+
+def find_spec_objects(aspec_file):
+    """Yield (spec_object, doctype) pairs from a fully parsed DOM."""
+    tree = ET.parse(aspec_file)
+    root = tree.getroot()
+    
+    for spec_objects in root.findall('.//*[@doctype]'):
+        doctype = spec_objects.get('doctype')
+        
+        for spec_object in spec_objects.findall('./specobject'):
+            yield spec_object, doctype
+
+def iter_spec_objects(aspec_file):
+    """Yield (spec_object, doctype) pairs while streaming through the file.
+    
+    Each <specobject> element is yielded once it has been read completely and
+    is cleared and detached from its parent afterwards, so memory use does not
+    grow with the size of the XML tree.
+    """
+    path = []  # Elements currently open, from the root down
+    
+    for event, elem in ET.iterparse(aspec_file, events=('start', 'end')):
+        if event == 'start':
+            path.append(elem)
+            continue
+        
+        path.pop()
+        if elem.tag != 'specobject':
+            continue
+        
+        # Match the DOM mode: only direct children of a doctype container
+        # below the root element are spec objects
+        parent = path[-1] if path else None
+        if parent is not None and len(path) > 1 and parent.get('doctype') is not None:
+            yield elem, parent.get('doctype')
+        
+        elem.clear()
+        if parent is not None:
+            parent.remove(elem)
+
 def parse_spec_object(spec_object, doctype) -> Optional[SpecItem]:
     """Parse a spec object element into a SpecItem object."""
     # Extract ID
@@ -66,21 +128,27 @@ def parse_spec_object(spec_object, doctype) -> Optional[SpecItem]:
     item = SpecItem(id_elem.text, version, doctype)
     
     # Extract title/description
-    for field in ['shortdesc', 'description', 'status', 'sourcefile', 'sourceline']:
+    for field in ['shortdesc', 'description']:
         elem = spec_object.find(f'./{field}')
         if elem is not None and elem.text:
             setattr(item, field, elem.text)
     
+    # Values shared by many items are interned to keep large models small
+    for field in ['status', 'sourcefile', 'sourceline']:
+        elem = spec_object.find(f'./{field}')
+        if elem is not None and elem.text:
+            setattr(item, field, intern_text(elem.text))
+    
     # Extract coverage status
     coverage_elem = spec_object.find('./coverage')
     if coverage_elem is not None:
-        item.coverage = {}
+        coverage = {}
         
         # Shallow and deep coverage status
         for status_type in ['shallowCoverageStatus', 'deepCoverageStatus']:
             status_elem = coverage_elem.find(f'./{status_type}')
             if status_elem is not None and status_elem.text:
-                item.coverage[status_type] = status_elem.text
+                coverage[status_type] = intern_text(status_elem.text)
         
         # Items that cover this item
         covering_items = []
@@ -93,28 +161,30 @@ def parse_spec_object(spec_object, doctype) -> Optional[SpecItem]:
                 for field in ['id', 'version', 'doctype', 'status']:
                     field_elem = covering_obj.find(f'./{field}')
                     if field_elem is not None and field_elem.text:
-                        covering_item[field] = field_elem.text
+                        covering_item[field] = intern_text(field_elem.text)
                 
                 # Extract coverage statuses
                 for status_type in ['ownCoverageStatus', 'deepCoverageStatus', 'coveringStatus']:
                     status_elem = covering_obj.find(f'./{status_type}')
                     if status_elem is not None and status_elem.text:
-                        covering_item[status_type] = status_elem.text
+                        covering_item[status_type] = intern_text(status_elem.text)
                 
-                covering_items.append(covering_item)
+                covering_items.append(CoveringItem(**covering_item))
         
-        item.coverage['coveringItems'] = covering_items
+        coverage['coveringItems'] = covering_items
         
         # Extract covered and uncovered types
         for types_field in ['coveredTypes', 'uncoveredTypes']:
             types = []
             types_elem = coverage_elem.find(f'./{types_field}')
             if types_elem is not None:
-                for type_elem in types_elem.findall(f'./*Type'):
-                    if type_elem.text:
-                        types.append(type_elem.text)
+                for type_elem in types_elem:
+                    if type_elem.tag.endswith('Type') and type_elem.text:
+                        types.append(intern_text(type_elem.text))
             
-            item.coverage[types_field] = types
+            coverage[types_field] = types
+        
+        item.coverage = Coverage(**coverage)
     
     # Extract items that this item covers
     covering_elem = spec_object.find('./covering')
@@ -126,32 +196,38 @@ def parse_spec_object(spec_object, doctype) -> Optional[SpecItem]:
             for field in ['id', 'version', 'doctype']:
                 field_elem = covered_type.find(f'./{field}')
                 if field_elem is not None and field_elem.text:
-                    covered_item[field] = field_elem.text
+                    covered_item[field] = intern_text(field_elem.text)
             
-            covered_items.append(covered_item)
+            covered_items.append(CoveredItem(**covered_item))
         
         item.covers = covered_items
     
     return item
 
+def covered_keys(item) -> List[str]:
+    """Return the keys of the items an item covers (its outgoing links)."""
+    return [intern_text(f"{covered.id}~{covered.version or '1'}") for covered in item.covers]
+
+def covering_keys(item) -> List[str]:
+    """Return the keys of the items that cover an item (its incoming links)."""
+    return [intern_text(f"{covering.id}~{covering.version or '1'}") for covering in item.coverage.coveringItems or ()]
+
 def build_relationship_maps(spec_items, covering_map, covered_by_map):
     """Build the maps for tracing relationships between items."""
     for item_key, item in spec_items.items():
         # Map what this item covers
-        for covered in item.covers:
-            covered_key = f"{covered['id']}~{covered.get('version', '1')}"
+        for covered_key in covered_keys(item):
             covering_map[item_key].append(covered_key)
         
         # Map what covers this item
-        for covering in item.coverage.get('coveringItems', []):
-            covering_key = f"{covering['id']}~{covering.get('version', '1')}"
+        for covering_key in covering_keys(item):
             covered_by_map[item_key].append(covering_key)
 
 def identify_broken_chains(spec_items):
     """Identify items with broken trace chains."""
     broken_chains = []
     for item_key, item in spec_items.items():
-        if item.coverage_type != "COVERED":
+        if item.reported_coverage_type != "COVERED":
             broken_chains.append(item_key)
     return broken_chains
 
@@ -161,7 +237,7 @@ def analyze_aspec(spec_items, id_map, covering_map, covered_by_map, broken_chain
     analyzer = TraceAnalyzer(spec_items, id_map, covering_map, covered_by_map, broken_chains)
     
     # Detect circular dependencies using all spec items
-    analyzer.detect_circular_dependencies(list(spec_items.values()))
+    analyzer.detect_circular_dependencies()
     
     # Return the analyzer for further processing
     return analyzer
\ No newline at end of file
@@ -0,0 +1,396 @@
+"""Staged analysis of one or more aspec or OpenFastTrace markdown files."""
+import os
+import glob
+from collections import defaultdict
+from typing import Collection, List, Optional, Sequence, Union
+
+from oft_trace.analyzer import TraceAnalyzer
+from oft_trace.cache import (DEFAULT_CACHE_MAX_SIZE, file_fingerprint, load_cached_model, previous_fingerprint,
+                             remember_fingerprint, store_cached_model)
+from oft_trace.markdown import import_markdown_file, is_markdown_file
+from oft_trace.profiling import detach, profile_stage
+
+ASPEC_SUFFIX = ".aspec"
+
+def find_aspec_files(paths: Sequence[str]) -> List[str]:
+    """Expand files, directories and glob patterns into a list of aspec files.
+
+    Directories are searched recursively for *.aspec files. Files are returned
+    in the given order, each pattern sorted, and every file only once.
+    """
+    found = []
+    seen = set()
+    for path in paths:
+        if os.path.isdir(path):
+            matches = sorted(glob.glob(os.path.join(glob.escape(path), "**", "*" + ASPEC_SUFFIX), recursive=True))
+        elif glob.has_magic(path):
+            matches = sorted(match for match in glob.glob(path, recursive=True) if os.path.isfile(match))
+        else:
+            matches = [path] if os.path.isfile(path) else []
+
+        for match in matches:
+            real_path = os.path.realpath(match)
+            if real_path not in seen:
+                seen.add(real_path)
+                found.append(match)
+
+    return found
+
+def merge_aspec_models(models, sources: Sequence[str]):
+    """Merge per-file (spec_items, id_map, covering_map, covered_by_map) models into one.
+
+    When an item key appears in more than one file, the first occurrence is
+    kept. Returns the merged model and a list of (item_key, kept_file,
+    duplicate_file) tuples for the dropped items.
+    """
+    spec_items = {}
+    id_map = defaultdict(list)
+    covering_map = defaultdict(list)
+    covered_by_map = defaultdict(list)
+    origin = {}
+    duplicates = []
+
+    for (file_items, _, file_covering_map, file_covered_by_map), source in zip(models, sources):
+        for item_key, item in file_items.items():
+            if item_key in spec_items:
+                duplicates.append((item_key, origin[item_key], source))
+                continue
+            spec_items[item_key] = item
+            origin[item_key] = source
+            id_map[item.id].append(item_key)
+            if item_key in file_covering_map:
+                covering_map[item_key] = file_covering_map[item_key]
+            if item_key in file_covered_by_map:
+                covered_by_map[item_key] = file_covered_by_map[item_key]
+
+    return (spec_items, id_map, covering_map, covered_by_map), duplicates
+
+def _parse_file(aspec_file: str, streaming: bool = True, hashes: bool = True):
+    """Parse one input file, importing the XML parser only when it is needed.
+
+    Returns the model and, with hashes, the content hashes of its spec
+    objects (see oft_trace.incremental). The hashes are None without hashes
+    or when the file cannot be updated incrementally. Markdown files yield
+    their imported items, which are traced together with the items of the
+    other markdown inputs once all files are read.
+    """
+    if is_markdown_file(aspec_file):
+        return import_markdown_file(aspec_file), None
+    from oft_trace.parser import parse_aspec_model
+
+    if not hashes:
+        return parse_aspec_model(aspec_file, streaming), None
+
+    from oft_trace.incremental import hash_spec_objects
+
+    object_keys = []
+    model = parse_aspec_model(aspec_file, streaming, object_keys)
+    with profile_stage('hashes'):
+        return model, hash_spec_objects(aspec_file, object_keys)
+
+def _load_cached_file(aspec_file: str, cache_dir: Optional[str]):
+    """Return (fingerprint, cached (model, hashes) or None) for one file."""
+    try:
+        fingerprint = file_fingerprint(aspec_file)
+    except OSError:
+        return None, None
+    return fingerprint, load_cached_model(fingerprint, cache_dir)
+
+def _update_cached_file(aspec_file: str, fingerprint, cache_dir: Optional[str], cache_max_size: Optional[int]):
+    """Update the last cached model of a changed file, or return None if there is none to update.
+
+    Only the spec objects that changed since the cached version are parsed.
+    """
+    previous = previous_fingerprint(aspec_file, cache_dir)
+    if fingerprint is None or previous is None or previous == fingerprint or is_markdown_file(aspec_file):
+        return None
+    cached = load_cached_model(previous, cache_dir)
+    if cached is None or cached[1] is None:
+        return None
+
+    from oft_trace.incremental import update_model
+
+    model, hashes = cached
+    with profile_stage('update') as stage:
+        updated = update_model(model, hashes, aspec_file)
+        if updated is None:
+            return None
+        changes, hashes = updated
+        stage.count(added=len(changes.added), removed=len(changes.removed), changed=len(changes.changed))
+    store_cached_model(fingerprint, (model, hashes), cache_dir, cache_max_size)
+    remember_fingerprint(aspec_file, fingerprint, cache_dir)
+    return model, hashes
+
+def _parse_and_cache_file(aspec_file: str, fingerprint, cache_dir: Optional[str],
+                          cache_max_size: Optional[int], streaming: bool = True, track_changes: bool = False):
+    """Parse one aspec file and store the model in the cache if it has a fingerprint.
+
+    Returns the model and the hashes of its spec objects, which are only
+    taken for a cached model or with track_changes.
+    """
+    parsed = _parse_file(aspec_file, streaming, hashes=fingerprint is not None or track_changes)
+    if fingerprint is not None:
+        store_cached_model(fingerprint, parsed, cache_dir, cache_max_size)
+        remember_fingerprint(aspec_file, fingerprint, cache_dir)
+    return parsed
+
+class AnalysisPipeline:
+    """Parse aspec files once and run the analysis stages on demand.
+
+    The stages are:
+
+    - parse: read the items and build the relationship maps (cached on disk
+      per file); several input files are merged into one model
+    - index: create the single TraceAnalyzer over the parsed model
+    - classify: find the broken chains
+    - cycles: flag the items that are part of a circular dependency
+    - rules: check coverage links against the trace rules
+
+    Each stage runs at most once, the first time it is requested, and pulls in
+    only the stages it depends on. Classification and cycle detection are
+    independent of each other, so a command only pays for what it shows.
+
+    Cached models keep the content hashes of their spec objects, so the model
+    of a changed file can be updated instead of parsed again. Without the
+    cache, the hashes are only taken with track_changes, for update().
+    """
+
+    STAGES = ('parse', 'index', 'classify', 'cycles', 'rules')
+
+    def __init__(self, aspec_file: Union[str, Sequence[str]], use_cache: bool = True, cache_dir: Optional[str] = None,
+                 cache_max_size: Optional[int] = DEFAULT_CACHE_MAX_SIZE, streaming: bool = True,
+                 jobs: Optional[int] = None, track_changes: bool = False):
+        if isinstance(aspec_file, str):
+            self.aspec_files = [aspec_file]
+        else:
+            self.aspec_files = list(aspec_file)
+            aspec_file = self.aspec_files[0] if len(self.aspec_files) == 1 else os.path.commonpath(
+                [os.path.abspath(path) for path in self.aspec_files])
+        self.aspec_file = aspec_file
+        self.use_cache = use_cache
+        self.cache_dir = cache_dir
+        self.cache_max_size = cache_max_size
+        self.streaming = streaming
+        self.jobs = jobs
+        self.track_changes = track_changes
+        self.duplicates = []  # (item_key, kept_file, duplicate_file) across input files
+        self.completed = []  # Stage names in the order they ran
+        self.object_hashes = [None] * len(self.aspec_files)  # Spec object hashes per file, see update()
+        self._cycles_fingerprint = None  # Cache key of the cycles of the parsed model, if cached
+        self._model = None
+        self._analyzer = None
+
+    def run(self, *stages: str) -> "AnalysisPipeline":
+        """Run the given stages, or all of them, and return the pipeline."""
+        for stage in stages or self.STAGES:
+            if stage not in self.STAGES:
+                raise ValueError(f"Unknown pipeline stage: {stage}")
+            getattr(self, stage)()
+        return self
+
+    def parse(self):
+        """Return (spec_items, id_map, covering_map, covered_by_map), parsing on first use."""
+        if self._model is None:
+            with profile_stage('parse') as stage:
+                models = self._load_models()
+                sources = self.aspec_files
+                markdown = [position for position, path in enumerate(self.aspec_files) if is_markdown_file(path)]
+                if markdown:
+                    models, sources = self._trace_markdown(models, markdown)
+                if len(models) == 1:
+                    self._model = models[0]
+                else:
+                    with profile_stage('merge'):
+                        self._model, self.duplicates = merge_aspec_models(models, sources)
+                spec_items, _, covering_map, _ = self._model
+                stage.count(files=len(self.aspec_files), items=len(spec_items),
+                            links=sum(len(targets) for targets in covering_map.values()))
+            self.completed.append('parse')
+        return self._model
+
+    def parse_trace_chain(self, spec_id: str, doctype: Optional[str] = None, version: Optional[str] = None,
+                          direction: str = 'both') -> bool:
+        """Load only the items shown by the trace chain of one item, through the offset index.
+
+        This needs a single aspec file with an up-to-date sidecar index (see
+        oft_trace.offsets); otherwise nothing is loaded and False is returned.
+        The model holds the chain, the other versions of its items and the
+        cycles they are part of, so the chain renders as with the full model.
+        """
+        if self._model is not None or len(self.aspec_files) != 1 or is_markdown_file(self.aspec_files[0]):
+            return False
+
+        from oft_trace.offsets import open_offset_index
+
+        index = open_offset_index(self.aspec_files[0])
+        if index is None:
+            return False
+        with index, profile_stage('parse') as stage:
+            with profile_stage('offsets'):
+                self._model = index.load_trace_chain(spec_id, doctype, version, direction)
+            spec_items, _, covering_map, _ = self._model
+            stage.count(files=1, items=len(spec_items), links=sum(len(targets) for targets in covering_map.values()))
+        self.completed.append('parse')
+        return True
+
+    def _load_models(self):
+        """Load the model of every input file from the cache, parsing the others.
+
+        A changed file whose previous version is still cached is updated from
+        that model instead of being parsed again. With more than one file to
+        parse, the files are parsed concurrently in a process pool and each
+        result is cached separately.
+        """
+        loaded = [None] * len(self.aspec_files)
+        fingerprints = [None] * len(self.aspec_files)
+        if self.use_cache:
+            with profile_stage('cache') as stage:
+                for position, aspec_file in enumerate(self.aspec_files):
+                    fingerprints[position], loaded[position] = _load_cached_file(aspec_file, self.cache_dir)
+                stage.count(hits=sum(cached is not None for cached in loaded))
+            if None not in fingerprints:
+                # The cycles of the merged model are cached next to the models of its files
+                self._cycles_fingerprint = ('cycles', tuple(fingerprints))
+            for position, cached in enumerate(loaded):
+                if cached is None:
+                    loaded[position] = _update_cached_file(self.aspec_files[position], fingerprints[position],
+                                                           self.cache_dir, self.cache_max_size)
+
+        pending = [position for position, cached in enumerate(loaded) if cached is None]
+        cache_dir = self.cache_dir if self.use_cache else None
+        jobs = min(len(pending), self.jobs or os.cpu_count() or 1)
+        if jobs <= 1:
+            for position in pending:
+                loaded[position] = _parse_and_cache_file(self.aspec_files[position], fingerprints[position], cache_dir,
+                                                         self.cache_max_size, self.streaming, self.track_changes)
+            return self._split_hashes(loaded)
+
+        from concurrent.futures import ProcessPoolExecutor
+        with profile_stage('workers') as stage, ProcessPoolExecutor(max_workers=jobs, initializer=detach) as executor:
+            stage.count(files=len(pending), processes=jobs)
+            futures = {
+                position: executor.submit(_parse_and_cache_file, self.aspec_files[position], fingerprints[position],
+                                          cache_dir, self.cache_max_size, self.streaming, self.track_changes)
+                for position in pending
+            }
+            for position, future in futures.items():
+                loaded[position] = future.result()
+
+        return self._split_hashes(loaded)
+
+    def _split_hashes(self, loaded):
+        """Keep the object hashes of the loaded (model, hashes) pairs and return the models."""
+        self.object_hashes = [hashes for _, hashes in loaded]
+        return [model for model, _ in loaded]
+
+    def update(self):
+        """Update the model and the analysis in place after the aspec file changed.
+
+        Only the spec objects whose content changed are parsed, and only the
+        analysis they affect is redone (see TraceAnalyzer.apply_changes).
+        Returns the ModelChanges, or None if the pipeline has to be rebuilt
+        instead: for several input files, markdown input, an aspec file that
+        cannot be split into spec objects (see UnsupportedLayout), before the model was parsed, or
+        for a model parsed without the cache and without track_changes.
+        Nothing is changed in that case. The updated model is not cached.
+        """
+        if self._model is None or len(self.aspec_files) != 1 or self.object_hashes[0] is None:
+            return None
+
+        from oft_trace.incremental import update_model
+
+        with profile_stage('update') as stage:
+            updated = update_model(self._model, self.object_hashes[0], self.aspec_files[0])
+            if updated is None:
+                return None
+            changes, self.object_hashes[0] = updated
+            self._cycles_fingerprint = None
+            stage.count(added=len(changes.added), removed=len(changes.removed), changed=len(changes.changed))
+            if self._analyzer is not None:
+                self._analyzer.apply_changes(changes, flag_cycles='cycles' in self.completed)
+        return changes
+
+    def _trace_markdown(self, models, markdown: List[int]):
+        """Trace the items of all markdown inputs as one document.
+
+        Links between markdown files are resolved like links within a file.
+        The traced model takes the place of the first markdown file; returns
+        the models and their source files.
+        """
+        from oft_trace.tracer import trace_items
+
+        with profile_stage('trace') as stage:
+            model = trace_items(item for position in markdown for item in models[position])
+            stage.count(items=len(model[0]))
+        kept = [position for position in range(len(models)) if position == markdown[0] or position not in markdown]
+        return ([model if position == markdown[0] else models[position] for position in kept],
+                [self.aspec_files[position] for position in kept])
+
+    def index(self) -> TraceAnalyzer:
+        """Return the analyzer over the parsed model, creating it on first use."""
+        if self._analyzer is None:
+            spec_items, id_map, covering_map, covered_by_map = self.parse()
+            with profile_stage('index'):
+                self._analyzer = TraceAnalyzer(spec_items, id_map, covering_map, covered_by_map,
+                                               aspec_file=self.aspec_file)
+            self.completed.append('index')
+        return self._analyzer
+
+    @property
+    def analyzer(self) -> TraceAnalyzer:
+        """The analyzer shared by all stages."""
+        return self.index()
+
+    def classify(self) -> List[str]:
+        """Return the keys of the items with broken chains."""
+        analyzer = self.index()
+        if 'classify' not in self.completed:
+            with profile_stage('classify') as stage:
+                stage.count(broken=len(analyzer.broken_chains))
+            self.completed.append('classify')
+        return analyzer.broken_chains
+
+    def cycles(self, item_keys: Optional[Collection[str]] = None) -> List[List[str]]:
+        """Flag the items in circular dependencies and return the cycles.
+        
+        The cycles of a model loaded through the cache are cached under the
+        fingerprints of its files. With item_keys, only the cycles reachable
+        from these items are searched unless the full result is cached; the
+        items they show are flagged correctly, but the stage stays pending.
+        """
+        analyzer = self.index()
+        if 'cycles' in self.completed:
+            return analyzer.get_circular_dependencies()
+        
+        with profile_stage('cycles') as stage:
+            cycles = None
+            if self._cycles_fingerprint is not None:
+                cycles = load_cached_model(self._cycles_fingerprint, self.cache_dir)
+                stage.count(hits=int(cycles is not None))
+            if cycles is not None:
+                analyzer.set_circular_dependencies(cycles)
+            elif item_keys is not None and len(item_keys) < len(analyzer.spec_items):
+                cycles = analyzer.mark_reachable_circular_dependencies(item_keys)
+                stage.count(cycles=len(cycles), items=sum(len(cycle) for cycle in cycles))
+                return cycles
+            else:
+                cycles = analyzer.mark_circular_dependencies()
+                if self._cycles_fingerprint is not None:
+                    store_cached_model(self._cycles_fingerprint, cycles, self.cache_dir, self.cache_max_size)
+            stage.count(cycles=len(cycles), items=sum(len(cycle) for cycle in cycles))
+        self.completed.append('cycles')
+        return cycles
+
+    def rules(self):
+        """Check all items against the coverage rules."""
+        analyzer = self.index()
+        if 'rules' not in self.completed:
+            with profile_stage('rules') as stage:
+                analyzer.check_unwanted_coverage()
+                stage.count(items=len(analyzer.spec_items))
+            self.completed.append('rules')
+
+    def as_tuple(self):
+        """Return the model in the (spec_items, id_map, covering_map, covered_by_map, broken_chains) form."""
+        spec_items, id_map, covering_map, covered_by_map = self.parse()
+        return spec_items, id_map, covering_map, covered_by_map, self.classify()
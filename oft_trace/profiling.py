@@ -0,0 +1,232 @@
+"""Per-stage wall time, CPU time, counts and memory of a command."""
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Optional
+
+class StageRecord:
+    """Accumulated measurements of one stage, over all the times it ran."""
+
+    __slots__ = ('path', 'calls', 'wall', 'cpu', 'peak_memory', 'memory_delta', 'counts')
+
+    def __init__(self, path):
+        self.path = path
+        self.calls = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.peak_memory = 0
+        self.memory_delta = 0
+        self.counts = {}
+
+    @property
+    def name(self):
+        return self.path[-1]
+
+    @property
+    def depth(self):
+        return len(self.path) - 1
+
+    def count(self, **counts):
+        """Add to the named counters of the stage, such as items or links."""
+        for key, value in counts.items():
+            self.counts[key] = self.counts.get(key, 0) + value
+
+    def as_dict(self) -> Dict:
+        return {
+            "stage": "/".join(self.path),
+            "depth": self.depth,
+            "calls": self.calls,
+            "wall": round(self.wall, 6),
+            "cpu": round(self.cpu, 6),
+            "peak_memory": self.peak_memory,
+            "memory_delta": self.memory_delta,
+            "counts": dict(self.counts)
+        }
+
+class _NullStage:
+    """Stage handed out while no profiler is active."""
+
+    def count(self, **counts):
+        pass
+
+_NULL_STAGE = _NullStage()
+
+class Profiler:
+    """Measure the stages of one command.
+
+    Stages nest: a stage started while another one is open is recorded as its
+    child. Peak memory is the most memory traced by tracemalloc above the level
+    at the start of the stage, so it covers the Python heap of this process
+    only, not worker processes.
+    """
+
+    def __init__(self, command: Optional[str] = None, trace_memory: bool = True):
+        self.command = command
+        self.trace_memory = trace_memory
+        self.records: Dict[tuple, StageRecord] = {}  # In the order the stages first ran
+        self._stack = []  # [record, wall start, cpu start, memory at start, peak so far] per open stage
+        self._started_tracing = False
+        self.started_at = None
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.peak_memory = 0
+        self.max_rss = None
+
+    def start(self):
+        """Start measuring the command as a whole."""
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        self.started_at = datetime.now().isoformat()
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+        return self
+
+    def begin(self, name: str) -> StageRecord:
+        """Open a stage below the innermost open one and return its record."""
+        path = (self._stack[-1][0].path if self._stack else ()) + (name,)
+        record = self.records.get(path)
+        if record is None:
+            record = self.records[path] = StageRecord(path)
+
+        memory = 0
+        if tracemalloc.is_tracing():
+            memory, peak = tracemalloc.get_traced_memory()
+            # Keep the peak of the enclosing stage before measuring this one from scratch
+            self.peak_memory = max(self.peak_memory, peak)
+            if self._stack:
+                self._stack[-1][4] = max(self._stack[-1][4], peak)
+            tracemalloc.reset_peak()
+        self._stack.append([record, time.perf_counter(), time.process_time(), memory, memory])
+        return record
+
+    def end(self):
+        """Close the innermost open stage."""
+        record, wall_start, cpu_start, memory_start, peak = self._stack.pop()
+        record.calls += 1
+        record.wall += time.perf_counter() - wall_start
+        record.cpu += time.process_time() - cpu_start
+
+        if tracemalloc.is_tracing():
+            memory, traced_peak = tracemalloc.get_traced_memory()
+            peak = max(peak, traced_peak)
+            record.peak_memory = max(record.peak_memory, peak - memory_start)
+            record.memory_delta += memory - memory_start
+            if self._stack:
+                self._stack[-1][4] = max(self._stack[-1][4], peak)
+
+    @contextmanager
+    def stage(self, name: str):
+        """Measure the body of a with block as a stage."""
+        record = self.begin(name)
+        try:
+            yield record
+        finally:
+            self.end()
+
+    def finish(self):
+        """Close all open stages and stop measuring the command."""
+        while self._stack:
+            self.end()
+        self.wall = time.perf_counter() - self._wall_start
+        self.cpu = time.process_time() - self._cpu_start
+
+        if tracemalloc.is_tracing():
+            self.peak_memory = max(self.peak_memory, tracemalloc.get_traced_memory()[1])
+            if self._started_tracing:
+                tracemalloc.stop()
+
+        try:
+            import resource
+        except ImportError:
+            return
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        self.max_rss = max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+    def as_dict(self) -> Dict:
+        return {
+            "command": self.command,
+            "argv": sys.argv[1:],
+            "started_at": self.started_at,
+            "pid": os.getpid(),
+            "memory_traced": self.trace_memory,
+            "total": {
+                "wall": round(self.wall, 6),
+                "cpu": round(self.cpu, 6),
+                "peak_memory": self.peak_memory,
+                "max_rss": self.max_rss
+            },
+            "stages": [record.as_dict() for record in self.records.values()]
+        }
+
+    def write_json(self, path: str):
+        """Write the profile as JSON."""
+        import json
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.as_dict(), f, indent=2)
+            f.write("\n")
+
+    def print_table(self, console):
+        """Print the stage breakdown as a table."""
+        from rich import box
+        from rich.table import Table
+
+        def megabytes(value):
+            return f"{value / (1024 * 1024):.1f}" if self.trace_memory else "-"
+
+        caption = f"Peak RSS {self.max_rss / (1024 * 1024):.1f} MB" if self.max_rss else None
+        table = Table(title=f"Profile of {self.command or 'oft-trace'}", caption=caption, box=box.SIMPLE_HEAD)
+        table.add_column("Stage", no_wrap=True)
+        table.add_column("Wall s", justify="right")
+        table.add_column("CPU s", justify="right")
+        table.add_column("Peak MB", justify="right")
+        table.add_column("Kept MB", justify="right")
+        table.add_column("Counts")
+
+        for record in self.records.values():
+            name = "  " * record.depth + record.name
+            if record.calls > 1:
+                name += f" x{record.calls}"
+            counts = "\n".join(f"{key}={value}" for key, value in record.counts.items())
+            table.add_row(name, f"{record.wall:.3f}", f"{record.cpu:.3f}", megabytes(record.peak_memory),
+                          megabytes(record.memory_delta), counts)
+
+        table.add_section()
+        table.add_row("total", f"{self.wall:.3f}", f"{self.cpu:.3f}", megabytes(self.peak_memory), "", "")
+        console.print(table)
+
+# The profiler of the running command, if profiling is enabled
+_active: Optional[Profiler] = None
+
+def activate(profiler: Optional[Profiler]):
+    """Make the profiler receive all stages, or disable profiling with None."""
+    global _active
+    _active = profiler
+
+def active_profiler() -> Optional[Profiler]:
+    return _active
+
+def detach():
+    """Stop profiling in a worker process that inherited the profiler of its parent."""
+    activate(None)
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+@contextmanager
+def profile_stage(name: str):
+    """Measure the body of a with block as a stage of the active profiler, if any."""
+    if _active is None:
+        yield _NULL_STAGE
+        return
+    with _active.stage(name) as record:
+        yield record
+
+def begin_stage(name: str):
+    """Open a stage that stays open until the profile is finished, for the rest of a command."""
+    if _active is None:
+        return _NULL_STAGE
+    return _active.begin(name)
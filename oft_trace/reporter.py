@@ -1,15 +1,16 @@
 """Report generation for aspec trace analysis."""
 from typing import Dict, List, Optional
 from datetime import datetime
+from contextlib import redirect_stdout
+import io
 import os
+import json
 
-from rich.console import Console
 from rich.table import Table
 from rich.panel import Panel
 
-from oft_trace.visualizer import create_rich_tree, create_ascii_chain
-
-console = Console()
+from oft_trace.console import console
+from oft_trace.visualizer import create_rich_tree, create_ascii_chain, choose_render_mode
 
 def print_report_header(aspec_file, output_file=False):
     """Print the report header with file information."""
@@ -25,19 +26,21 @@ def print_report_header(aspec_file, output_file=False):
 
 def display_coverage_summary(analyzer, output_file=False):
     """Display an overview of all items in the report with improved categorization."""
-    # Calculate stats
-    total_items = len(analyzer.spec_items)
     categories = analyzer.categorize_items_by_coverage()
     
-    covered_items = len(categories["COVERED"])
-    orphaned_items = len(categories["ORPHANED"])
-    shallow_items = len(categories["SHALLOW"])
-    outdated_items = len(categories["OUTDATED"])
-    uncovered_items = len(categories["UNCOVERED"])
-    unknown_items = len(categories["UNKNOWN"])
-    
-    # Group by doctype
-    by_doctype = analyzer.count_coverage_by_doctype()
+    # Each circular dependency is reported once, however many items it spans
+    print_coverage_summary(len(analyzer.spec_items),
+                           {coverage_type: len(items) for coverage_type, items in categories.items()},
+                           analyzer.count_coverage_by_doctype(), analyzer.get_circular_dependencies(), output_file)
+
+def print_coverage_summary(total_items, counts, by_doctype, cycles=(), output_file=False):
+    """Print the coverage summary from the item counts per coverage type and per doctype."""
+    covered_items = counts["COVERED"]
+    orphaned_items = counts["ORPHANED"]
+    shallow_items = counts["SHALLOW"]
+    outdated_items = counts["OUTDATED"]
+    uncovered_items = counts["UNCOVERED"]
+    unknown_items = counts["UNKNOWN"]
     
     # Print summary
     if output_file:
@@ -60,6 +63,12 @@ def display_coverage_summary(analyzer, output_file=False):
             coverage_pct = stats["covered"] / stats["total"] * 100 if stats["total"] > 0 else 0
             print(f"{doctype:<15} {stats['total']:<8} {stats['covered']:<8} {stats['orphaned']:<10} "
                   f"{stats['shallow']:<8} {stats['outdated']:<8} {stats['uncovered']:<10} {coverage_pct:.1f}%")
+        
+        if cycles:
+            print("\nCIRCULAR DEPENDENCIES:")
+            print("-" * 100)
+            for i, cycle in enumerate(cycles, 1):
+                print(f"⟲ Cycle {i} ({len(cycle)} items): {', '.join(cycle)}")
     else:
         console.print("\n[bold]COVERAGE SUMMARY[/]")
         console.print(f"Total Items: {total_items}")
@@ -96,11 +105,16 @@ def display_coverage_summary(analyzer, output_file=False):
         
         console.print(table)
         
-        if uncovered_items + orphaned_items + shallow_items + outdated_items > 0:
+        if cycles:
+            console.print("\n[bold]CIRCULAR DEPENDENCIES[/]")
+            for i, cycle in enumerate(cycles, 1):
+                console.print(f"[yellow]⟲ Cycle {i}[/] ({len(cycle)} items): [cyan]{', '.join(cycle)}[/]")
+        
+        if uncovered_items + orphaned_items + shallow_items + outdated_items + len(cycles) > 0:
             console.print("\n[bold yellow]There are issues in the trace report.[/]")
             console.print("Use [cyan]trace-failures[/] command to analyze broken chains.")
 
-def analyze_and_display_failure(analyzer, item_key, index, total, output_file=False):
+def analyze_and_display_failure(analyzer, item_key, index, total, output_file=False, render_mode='auto'):
     """Analyze and display a single broken chain with improved details."""
     item = analyzer.spec_items.get(item_key)
     if not item:
@@ -148,65 +162,206 @@ def analyze_and_display_failure(analyzer, item_key, index, total, output_file=Fa
         for reason in failure_reasons:
             console.print(f"- {reason}")
     
-    # Show visual representation
+    # Show visual representation, expanding shared subtrees once in DAG mode
+    mode = choose_render_mode(analyzer, item_key, 'both', render_mode)
+    rendered = set() if mode == 'dag' else None
     if output_file:
         print("\nTrace chain visualization:")
-        create_ascii_chain(analyzer, item_key, direction='both')
+        if rendered is not None:
+            print("Shared subtrees are shown once; later occurrences refer back to them.")
+        create_ascii_chain(analyzer, item_key, direction='both', rendered=rendered)
     else:
         console.print("\n[bold]Trace chain visualization:[/]")
-        tree = create_rich_tree(analyzer, item_key, direction='both')
+        if rendered is not None:
+            console.print("[dim]Shared subtrees are shown once; later occurrences refer back to them.[/]")
+        tree = create_rich_tree(analyzer, item_key, direction='both', rendered=rendered)
         console.print(tree)
 
+def render_failure(analyzer, item_key, index, total, output_file=False, render_mode='auto'):
+    """Return what analyze_and_display_failure prints for an item, followed by the section separator.
+    
+    The text is plain for an output file, and otherwise exactly what the
+    shared console would write, styles included, so the sections can be
+    rendered in worker processes and written in order.
+    """
+    if output_file:
+        output = io.StringIO()
+        with redirect_stdout(output):
+            analyze_and_display_failure(analyzer, item_key, index, total, True, render_mode)
+            print("\n" + "-" * 80 + "\n")
+        return output.getvalue()
+    
+    with console.capture() as capture:
+        analyze_and_display_failure(analyzer, item_key, index, total, False, render_mode)
+        console.print("\n" + "-" * 80 + "\n")
+    return capture.get()
+
 def generate_json_report(analyzer, items_to_analyze=None, include_all=False):
     """Generate a JSON-serializable report structure."""
-    report = {
+    report = json_report_header(analyzer)
+    report["items"] = list(iter_json_report_items(analyzer, items_to_analyze, include_all))
+    return report
+
+def json_report_header(analyzer):
+    """Build the report fields that precede the item list."""
+    categories = analyzer.categorize_items_by_coverage()
+    return json_summary_header(analyzer.aspec_file, len(analyzer.spec_items), len(analyzer.broken_chains),
+                               {category: len(items) for category, items in categories.items()},
+                               analyzer.count_coverage_by_doctype())
+
+def json_summary_header(aspec_file, total_items, broken_chains, counts, by_doctype):
+    """Build the report header from the item counts per coverage type and per doctype."""
+    header = {
         "timestamp": datetime.now().isoformat(),
-        "aspec_file": os.path.abspath(analyzer.aspec_file) if analyzer.aspec_file else None,
+        "aspec_file": os.path.abspath(aspec_file) if aspec_file else None,
         "summary": {
-            "total_items": len(analyzer.spec_items),
-            "broken_chains": len(analyzer.broken_chains),
+            "total_items": total_items,
+            "broken_chains": broken_chains,
             "coverage_by_type": {}
-        },
-        "items": []
+        }
     }
     
     # Add coverage summary by type
-    categories = analyzer.categorize_items_by_coverage()
-    for category, items in categories.items():
-        report["summary"][category.lower()] = len(items)
+    for category, count in counts.items():
+        header["summary"][category.lower()] = count
     
     # Add special case for circular dependencies 
-    circular_items = [k for k, v in analyzer.spec_items.items() if hasattr(v, 'in_circular_dependency') and v.in_circular_dependency]
-    report["summary"]["circular"] = len(circular_items)
+    header["summary"]["circular"] = counts["CIRCULAR"]
     
     # Add coverage by doctype
-    doctype_stats = analyzer.count_coverage_by_doctype()
-    for doctype, stats in doctype_stats.items():
-        report["summary"]["coverage_by_type"][doctype] = stats
-    
-    # Add item details if requested
-    if items_to_analyze:
-        for item_key in items_to_analyze:
-            if include_all or analyzer.spec_items[item_key].coverage_type != "COVERED":
-                item = analyzer.spec_items[item_key]
-                item_data = {
-                    "id": item.id,
-                    "key": item_key,
-                    "version": item.version,
-                    "doctype": item.doctype,
-                    "title": getattr(item, "shortdesc", ""),
-                    "source": {
-                        "file": item.sourcefile,
-                        "line": item.sourceline
-                    },
-                    "coverage_type": item.coverage_type,
-                    "in_circular_dependency": getattr(item, "in_circular_dependency", False),
-                    "failure_reasons": analyzer.determine_failure_reasons(item_key) if item.coverage_type != "COVERED" else [],
-                    "covers": item.covers,
-                    "covered_by": [
-                        covering for covering in item.coverage.get('coveringItems', [])
-                    ]
-                }
-                report["items"].append(item_data)
-    
-    return report
\ No newline at end of file
+    for doctype, stats in by_doctype.items():
+        header["summary"]["coverage_by_type"][doctype] = stats
+    
+    return header
+
+def iter_json_report_items(analyzer, items_to_analyze=None, include_all=False):
+    """Yield the report record of each item to analyze, one at a time."""
+    for item_key in items_to_analyze or ():
+        item = analyzer.spec_items[item_key]
+        coverage_type = item.coverage_type
+        if include_all or coverage_type != "COVERED":
+            yield {
+                "id": item.id,
+                "key": item_key,
+                "version": item.version,
+                "doctype": item.doctype,
+                "title": getattr(item, "shortdesc", ""),
+                "source": {
+                    "file": item.sourcefile,
+                    "line": item.sourceline
+                },
+                "coverage_type": coverage_type,
+                "in_circular_dependency": item.in_circular_dependency,
+                "failure_reasons": analyzer.determine_failure_reasons(item_key) if coverage_type != "COVERED" else [],
+                "covers": [dict(covered) for covered in item.covers],
+                "covered_by": [
+                    dict(covering) for covering in item.coverage.get('coveringItems', [])
+                ]
+            }
+
+def write_json_report(analyzer, stream, items_to_analyze=None, include_all=False, compact=False):
+    """Write the JSON report to a text stream while the item records are produced.
+    
+    The output matches json.dump(generate_json_report(...), indent=2), or the
+    whitespace-free form when compact is set, but only one item record is held
+    in memory at a time. Returns the number of item records written.
+    """
+    indent = None if compact else 2
+    separators = (',', ':') if compact else (',', ': ')
+    
+    def newline(level):
+        return "" if compact else "\n" + "  " * level
+    
+    def dumps(value, level):
+        # Nested values start one indentation level deeper than json.dumps puts them
+        return json.dumps(value, indent=indent, separators=separators).replace("\n", newline(level))
+    
+    stream.write("{")
+    for key, value in json_report_header(analyzer).items():
+        stream.write(f"{newline(1)}{json.dumps(key)}{separators[1]}{dumps(value, 1)},")
+    stream.write(f'{newline(1)}"items"{separators[1]}[')
+    
+    count = 0
+    for item_data in iter_json_report_items(analyzer, items_to_analyze, include_all):
+        if count:
+            stream.write(",")
+        stream.write(newline(2) + dumps(item_data, 2))
+        count += 1
+    if count:
+        stream.write(newline(1))
+    stream.write("]" + newline(0) + "}")
+    return count
+
+def write_ndjson_report(analyzer, stream, items_to_analyze=None, include_all=False):
+    """Write the report as newline-delimited JSON.
+    
+    The first line holds the timestamp, aspec file and summary; every further
+    line is one item record.
+    """
+    stream.write(json.dumps(json_report_header(analyzer), separators=(',', ':')) + "\n")
+    count = 0
+    for item_data in iter_json_report_items(analyzer, items_to_analyze, include_all):
+        stream.write(json.dumps(item_data, separators=(',', ':')) + "\n")
+        count += 1
+    return count
+
+def json_item_summary(item):
+    """Build a short JSON-serializable description of an item."""
+    return {
+        "key": item.key,
+        "id": item.id,
+        "version": item.version,
+        "doctype": item.doctype,
+        "status": item.status,
+        "title": getattr(item, "shortdesc", ""),
+        "coverage_type": item.coverage_type,
+        "source": {
+            "file": item.sourcefile,
+            "line": item.sourceline
+        }
+    }
+
+def json_trace_chain(analyzer, item_key, direction='both'):
+    """Build a JSON-serializable trace chain that lists every reachable item and link once.
+    
+    Links always point from the covering item to the covered item. Items that
+    are referenced but missing from the report map to None.
+    """
+    graph = analyzer.graph
+    root = graph.node(item_key)
+    chain = {"root": item_key, "direction": direction, "items": {}, "links": []}
+    if root is None:
+        return chain
+    
+    walks = []
+    if direction in ('both', 'outgoing'):
+        walks.append((graph.successors, False))
+    if direction in ('both', 'incoming'):
+        walks.append((graph.predecessors, True))
+    
+    reached = {root}
+    links = {}
+    for neighbors, incoming in walks:
+        seen = {root}
+        queue = [root]
+        for node in queue:
+            for other in neighbors(node):
+                link = (other, node) if incoming else (node, other)
+                links.setdefault(link, None)
+                if other not in seen:
+                    seen.add(other)
+                    queue.append(other)
+        reached |= seen
+    
+    for node in sorted(reached):
+        item = graph.items[node]
+        chain["items"][graph.keys[node]] = json_item_summary(item) if item is not None else None
+    for source, target in links:
+        source_key, target_key = graph.keys[source], graph.keys[target]
+        chain["links"].append({
+            "source": source_key,
+            "target": target_key,
+            "version_mismatch": analyzer.is_version_mismatch(source_key, target_key)
+        })
+    
+    return chain
@@ -0,0 +1,284 @@
+"""Resident query server that keeps analyzed aspec models in memory."""
+import os
+import json
+import stat
+import socket
+import threading
+import socketserver
+import http.client
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urlencode, urlparse, parse_qs
+
+from oft_trace.pipeline import AnalysisPipeline, find_aspec_files
+from oft_trace.reporter import json_report_header, iter_json_report_items, json_item_summary, json_trace_chain
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+QUERY_ENDPOINTS = ('trace', 'items', 'failures', 'stats')
+
+def files_signature(paths: Sequence[str]) -> Tuple:
+    """Return the (file, size, mtime_ns) signature of all aspec files the paths expand to."""
+    signature = []
+    for aspec_file in find_aspec_files(paths):
+        try:
+            file_stat = os.stat(aspec_file)
+        except OSError:
+            continue
+        signature.append((aspec_file, file_stat.st_size, file_stat.st_mtime_ns))
+    return tuple(signature)
+
+class LoadedModel:
+    """An analyzed model and the lock that serializes the queries on it."""
+
+    def __init__(self, pipeline: AnalysisPipeline, signature: Tuple):
+        self.pipeline = pipeline
+        self.analyzer = pipeline.analyzer
+        self.signature = signature
+        self.loaded_at = datetime.now().isoformat()
+        self.lock = threading.Lock()
+        self.update_error = None
+
+        # Run everything queries rely on now, so that queries only read
+        pipeline.run('classify', 'cycles')
+        self.analyzer.prepare()
+
+    def update(self, signature: Tuple) -> bool:
+        """Patch the model in place after its single input file changed.
+
+        Returns False if the pipeline cannot be updated and the model has to
+        be reloaded instead. Queries wait for the update to finish. If the
+        update raises, the model may be partly patched and is marked invalid.
+        """
+        paths = [path for path, _, _ in signature]
+        if self.update_error is not None or paths != [path for path, _, _ in self.signature]:
+            return False
+        with self.lock:
+            try:
+                if self.pipeline.update() is None:
+                    return False
+                self.analyzer.prepare()
+            except Exception as e:
+                self.update_error = str(e) or type(e).__name__
+                raise
+            self.signature = signature
+            self.loaded_at = datetime.now().isoformat()
+        return True
+
+class QueryService:
+    """Hold the current model, reload it when the input files change and answer queries.
+
+    When a single aspec file changed, only its changed spec objects are
+    parsed and the model is patched under its lock. Otherwise a reload builds
+    a complete new model next to the current one and swaps it in, so queries
+    never see a half-loaded model.
+    """
+
+    def __init__(self, paths: Sequence[str], pipeline_factory: Callable[[List[str]], AnalysisPipeline],
+                 poll_interval: float = 1.0, pipeline: Optional[AnalysisPipeline] = None):
+        self.paths = list(paths)
+        self.pipeline_factory = pipeline_factory
+        self.poll_interval = poll_interval
+        self.reloads = 0
+        self.last_reload_error = None
+        self._failed_signature = None
+        self._stop = threading.Event()
+        self._watcher = None
+
+        signature = files_signature(self.paths)
+        if pipeline is None:
+            pipeline = pipeline_factory([aspec_file for aspec_file, _, _ in signature])
+        self.model = LoadedModel(pipeline, signature)
+
+    def reload_if_changed(self) -> bool:
+        """Reload the model if the input files changed since it was loaded."""
+        signature = files_signature(self.paths)
+        if signature == self.model.signature or signature == self._failed_signature or not signature:
+            return False
+
+        update_error = None
+        try:
+            if self.model.update(signature):
+                self.reloads += 1
+                self.last_reload_error = None
+                return True
+        except Exception as e:
+            # Fall back to a complete reload, which also replaces a partly patched model
+            update_error = f"Incremental update failed: {str(e) or type(e).__name__}"
+
+        try:
+            model = LoadedModel(self.pipeline_factory([aspec_file for aspec_file, _, _ in signature]), signature)
+        except (Exception, SystemExit) as e:
+            # Keep serving the previous model until the files change again
+            self._failed_signature = signature
+            self.last_reload_error = str(e) or type(e).__name__
+            if update_error:
+                self.last_reload_error = f"{update_error}; {self.last_reload_error}"
+            return False
+
+        self.model = model
+        self.reloads += 1
+        # A failed update is reported even though the complete reload worked
+        self.last_reload_error = update_error
+        return True
+
+    def start_watching(self):
+        """Poll the input files in a background thread."""
+        if self._watcher is None and self.poll_interval > 0:
+            self._watcher = threading.Thread(target=self._watch, name="oft-trace-watcher", daemon=True)
+            self._watcher.start()
+
+    def stop(self):
+        """Stop watching the input files."""
+        self._stop.set()
+
+    def _watch(self):
+        """Check the input files every poll_interval seconds until stopped."""
+        while not self._stop.wait(self.poll_interval):
+            self.reload_if_changed()
+
+    def query(self, endpoint: str, params: Dict[str, str]) -> Tuple[int, Dict]:
+        """Answer a query and return the HTTP status and the JSON payload."""
+        if endpoint not in QUERY_ENDPOINTS:
+            return 404, {"error": f"Unknown query '{endpoint}'. Use one of: {', '.join(QUERY_ENDPOINTS)}"}
+
+        model = self.model
+        with model.lock:
+            if model.update_error is not None:
+                # A partly patched model must not answer until a reload replaces it
+                return 503, {"error": f"Model unavailable: {self.last_reload_error}"}
+            return getattr(self, f"_query_{endpoint}")(model, params)
+
+    def _query_trace(self, model, params):
+        """Return the trace chain of one item."""
+        spec_id = params.get('id')
+        if not spec_id:
+            return 400, {"error": "Missing parameter 'id'"}
+        direction = params.get('direction', 'both')
+        if direction not in ('both', 'incoming', 'outgoing'):
+            return 400, {"error": "Direction must be one of: both, incoming, outgoing"}
+
+        item_key = model.analyzer.get_item_by_id(spec_id, params.get('doctype'), params.get('version'))
+        if not item_key:
+            return 404, {"error": f"Item {spec_id} not found"}
+        return 200, json_trace_chain(model.analyzer, item_key, direction)
+
+    def _query_items(self, model, params):
+        """Return the items matching the filters."""
+        analyzer = model.analyzer
+        item_keys = analyzer.find_items(params.get('id'), params.get('doctype'), params.get('status'),
+                                        params.get('coverage'))
+        return 200, {
+            "count": len(item_keys),
+            "items": [json_item_summary(analyzer.spec_items[item_key]) for item_key in item_keys]
+        }
+
+    def _query_failures(self, model, params):
+        """Return the report records of the items with broken chains."""
+        analyzer = model.analyzer
+        include_covered = params.get('include_covered', '').lower() in ('1', 'true', 'yes')
+        item_keys = list(analyzer.spec_items) if include_covered else analyzer.broken_chains
+        try:
+            limit = int(params['limit']) if params.get('limit') else None
+        except ValueError:
+            return 400, {"error": "Parameter 'limit' must be an integer"}
+        if limit is not None:
+            item_keys = item_keys[:limit]
+
+        items = list(iter_json_report_items(analyzer, item_keys, include_covered))
+        return 200, {"count": len(items), "items": items}
+
+    def _query_stats(self, model, params):
+        """Return the report summary and the state of the server."""
+        stats = json_report_header(model.analyzer)
+        stats["files"] = list(model.pipeline.aspec_files)
+        stats["loaded_at"] = model.loaded_at
+        stats["reloads"] = self.reloads
+        stats["last_reload_error"] = self.last_reload_error
+        stats["duplicates"] = len(model.pipeline.duplicates)
+        return 200, stats
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """Answer GET /<query>?<parameters> requests with JSON."""
+
+    server_version = "oft-trace"
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            status, payload = self.server.service.query(url.path.strip('/'), params)
+        except Exception as e:
+            status, payload = 500, {"error": str(e) or type(e).__name__}
+
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # Unix socket peers have no address
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        pass  # Keep the server console quiet
+
+class UnixQueryServer(socketserver.ThreadingUnixStreamServer):
+    """Threaded HTTP server on a Unix socket."""
+
+    daemon_threads = True
+    request_queue_size = 128
+
+class TCPQueryServer(ThreadingHTTPServer):
+    """Threaded HTTP server on a TCP port."""
+
+    daemon_threads = True
+    request_queue_size = 128
+
+def create_server(service: QueryService, socket_path: Optional[str] = None,
+                  host: str = DEFAULT_HOST, port: int = DEFAULT_PORT):
+    """Create a threaded HTTP server for the service on a Unix socket or a TCP port."""
+    if socket_path:
+        # Replace a stale socket from an earlier run, but never a regular file
+        if os.path.exists(socket_path):
+            if not stat.S_ISSOCK(os.stat(socket_path).st_mode):
+                raise OSError(f"{socket_path} exists and is not a socket")
+            os.unlink(socket_path)
+        server = UnixQueryServer(socket_path, QueryHandler)
+    else:
+        server = TCPQueryServer((host, port), QueryHandler)
+    server.service = service
+    return server
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP connection over a Unix socket."""
+
+    def __init__(self, socket_path: str, timeout: Optional[float] = None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+def send_query(endpoint: str, params: Optional[Dict[str, str]] = None, socket_path: Optional[str] = None,
+               host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, timeout: Optional[float] = 30.0) -> Tuple[int, Dict]:
+    """Send a query to a running server and return the HTTP status and the JSON payload."""
+    if socket_path:
+        connection = UnixHTTPConnection(socket_path, timeout)
+    else:
+        connection = http.client.HTTPConnection(host, port, timeout=timeout)
+
+    try:
+        path = f"/{endpoint}"
+        if params:
+            path += "?" + urlencode(params)
+        connection.request("GET", path)
+        response = connection.getresponse()
+        return response.status, json.loads(response.read().decode('utf-8'))
+    finally:
+        connection.close()
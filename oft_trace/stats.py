@@ -0,0 +1,229 @@
+"""Coverage counts of aspec files, streamed without building the model."""
+from array import array
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from oft_trace.analyzer import COVERAGE_TYPES, DOCTYPE_COUNTERS, new_doctype_stats
+from oft_trace.graph import TraceGraph
+from oft_trace.markdown import is_markdown_file
+from oft_trace.models import classify_coverage
+from oft_trace.profiling import profile_stage
+
+class CoverageCounts(NamedTuple):
+    """Item counts of a report, as shown by the coverage summary."""
+    total_items: int
+    broken_chains: int
+    counts: Dict[str, int]  # Items per coverage type
+    by_doctype: Dict[str, Dict[str, int]]  # Per-doctype counters, see count_coverage_by_doctype
+    duplicates: List[Tuple[str, str, str]]  # (item_key, kept_file, duplicate_file) across input files
+    cycles: List[List[str]]  # Item keys of each circular dependency, as get_circular_dependencies
+
+def _text(elem) -> Optional[str]:
+    return elem.text or None if elem is not None else None
+
+class _CoverageLinks:
+    """Outgoing coverage links of streamed spec objects, kept as integer arrays.
+
+    Keys get a number when they are first seen. The links of every spec
+    object are recorded as one definition; the definition of each key that
+    the parsed model keeps is chosen with keep().
+    """
+
+    def __init__(self):
+        self.nodes: Dict[str, int] = {}
+        self.offsets = array('l', [0])  # Start of the links of each definition in targets
+        self.targets = array('l')
+        self.kept = array('l')  # Kept definition per node, -1 for keys without one
+
+    def node(self, key: str) -> int:
+        node = self.nodes.get(key)
+        if node is None:
+            node = self.nodes[key] = len(self.kept)
+            self.kept.append(-1)
+        return node
+
+    def add(self, covered_keys: Iterable[str]) -> int:
+        """Record the links of one spec object and return its definition number."""
+        self.targets.extend(self.node(key) for key in covered_keys)
+        self.offsets.append(len(self.targets))
+        return len(self.offsets) - 2
+
+    def keep(self, key: str, definition: int):
+        self.kept[self.node(key)] = definition
+
+    def graph(self, item_keys: Iterable[str]) -> TraceGraph:
+        """Build the graph of the kept links, numbered as TraceGraph.from_maps numbers the parsed model."""
+        keys = list(item_keys)
+        index = {key: node for node, key in enumerate(keys)}
+        names = list(self.nodes)
+        sources, targets = array('l'), array('l')
+        for source in range(len(keys)):
+            definition = self.kept[self.nodes[keys[source]]]
+            for target in self.targets[self.offsets[definition]:self.offsets[definition + 1]]:
+                key = names[target]
+                node = index.get(key)
+                if node is None:
+                    node = index[key] = len(keys)
+                    keys.append(key)
+                sources.append(source)
+                targets.append(node)
+        return TraceGraph(keys, [None] * len(keys), (sources, targets), (array('l'), array('l')), index)
+
+def classify_spec_object(spec_object, doctype: str) -> Optional[Tuple[str, str]]:
+    """Return the key and reported coverage type of a spec object element, or None without an ID.
+
+    Only the elements the classification needs are read, so no SpecItem is
+    built. The result matches the reported_coverage_type of the parsed item.
+    """
+    spec_id = _text(spec_object.find('id'))
+    if spec_id is None:
+        return None
+    version = _text(spec_object.find('version')) or '0'
+
+    deep_status = shallow_status = None
+    covering_statuses = ()
+    coverage = spec_object.find('coverage')
+    if coverage is not None:
+        deep_status = _text(coverage.find('deepCoverageStatus'))
+        shallow_status = _text(coverage.find('shallowCoverageStatus'))
+        covering_objects = coverage.find('coveringSpecObjects')
+        if covering_objects is not None:
+            covering_statuses = [_text(covering.find('coveringStatus'))
+                                 for covering in covering_objects.findall('coveringSpecObject')]
+    covering = spec_object.find('covering')
+    covers = covering is not None and covering.find('coveredType') is not None
+
+    return f"{spec_id}~{version}", classify_coverage(doctype, covers, covering_statuses, deep_status, shallow_status)
+
+def _covered_keys(spec_object) -> List[str]:
+    """Return the keys of the items a spec object element covers, as covered_keys does for the parsed item."""
+    covering = spec_object.find('covering')
+    if covering is None:
+        return []
+    return [f"{_text(covered.find('id'))}~{_text(covered.find('version')) or '1'}"
+            for covered in covering.findall('coveredType')]
+
+def _stream_classes(aspec_files: Sequence[str], keep_links: bool = True):
+    """Return {key: (doctype, coverage type, file position)}, the coverage links and the duplicates across files.
+
+    The links are None unless keep_links is set.
+    """
+    from oft_trace.parser import iter_spec_objects
+
+    classes = {}
+    links = _CoverageLinks() if keep_links else None
+    duplicates = []
+    shared = {}  # One tuple per combination of values instead of one per item
+    for position, aspec_file in enumerate(aspec_files):
+        # Later definitions of a key replace earlier ones within a file, as in the parsed model
+        file_classes = {}
+        for spec_object, doctype in iter_spec_objects(aspec_file):
+            result = classify_spec_object(spec_object, doctype)
+            if result is not None:
+                key = result[0]
+                value = (doctype, result[1], position)
+                file_classes[key] = shared.setdefault(value, value)
+                if links is not None:
+                    definition = links.add(_covered_keys(spec_object))
+                    # The first file that defines a key wins
+                    if key not in classes:
+                        links.keep(key, definition)
+
+        # The first file that defines a key wins, as in merge_aspec_models
+        if not classes:
+            classes = file_classes
+            continue
+        for key, value in file_classes.items():
+            kept = classes.setdefault(key, value)
+            if kept is not value:
+                duplicates.append((key, aspec_files[kept[2]], aspec_file))
+    return classes, links, duplicates
+
+def count_coverage(aspec_files: Sequence[str], find_cycles: bool = True) -> CoverageCounts:
+    """Count the items of aspec files by coverage type and doctype in one streaming pass.
+
+    Each spec object is classified from its XML element and dropped, so only
+    a small entry per item key and its links as integers are kept, to
+    resolve repeated definitions the way the parsed model does and to find
+    the circular dependencies. Items in a cycle count as CIRCULAR, as in the
+    summary of trace; broken chains follow the reported coverage. Markdown
+    input has to be traced first and is loaded through the pipeline.
+
+    Without find_cycles no links are kept and no graph is built: cycles is
+    empty and items in a cycle keep their reported coverage type.
+    """
+    with profile_stage('stream') as stage:
+        if any(is_markdown_file(path) for path in aspec_files):
+            from oft_trace.pipeline import AnalysisPipeline
+
+            pipeline = AnalysisPipeline(list(aspec_files), use_cache=False)
+            spec_items = pipeline.parse()[0]
+            classes = {key: (item.doctype, item.reported_coverage_type) for key, item in spec_items.items()}
+            links = None
+            duplicates = pipeline.duplicates
+        else:
+            classes, links, duplicates = _stream_classes(aspec_files, keep_links=find_cycles)
+        stage.count(files=len(aspec_files), items=len(classes))
+
+    cycles, circular = [], set()
+    if find_cycles:
+        with profile_stage('cycles') as stage:
+            if links is None:
+                cycles = pipeline.cycles()
+            else:
+                graph = links.graph(classes)
+                cycles = [[graph.keys[node] for node in cycle] for cycle in graph.find_cycles()]
+            circular = {key for cycle in cycles for key in cycle}
+            stage.count(cycles=len(cycles), items=len(circular & classes.keys()))
+
+    with profile_stage('count'):
+        counts = dict.fromkeys(COVERAGE_TYPES, 0)
+        by_doctype = {}
+        broken_chains = 0
+        for key, (doctype, coverage_type, *_) in classes.items():
+            if coverage_type != "COVERED":
+                broken_chains += 1
+            if key in circular:
+                coverage_type = "CIRCULAR"
+            counts[coverage_type] += 1
+            stats = by_doctype.get(doctype)
+            if stats is None:
+                stats = by_doctype[doctype] = new_doctype_stats()
+            stats["total"] += 1
+            if coverage_type in DOCTYPE_COUNTERS:
+                stats[DOCTYPE_COUNTERS[coverage_type]] += 1
+
+    return CoverageCounts(len(classes), broken_chains, counts, by_doctype, duplicates, cycles)
+
+def parse_min_coverage(value: str) -> Tuple[Optional[str], float]:
+    """Parse a [DOCTYPE=]PERCENT threshold into (doctype or None for all items, percent)."""
+    doctype, _, percent = value.rpartition('=')
+    try:
+        minimum = float(percent)
+    except ValueError:
+        raise ValueError(f"invalid coverage threshold '{value}', expected [DOCTYPE=]PERCENT") from None
+    if not 0 <= minimum <= 100:
+        raise ValueError(f"coverage threshold '{value}' is not between 0 and 100")
+    return doctype or None, minimum
+
+def check_thresholds(stats: CoverageCounts, min_coverage: Sequence[Tuple[Optional[str], float]] = (),
+                     max_broken: Optional[int] = None) -> List[str]:
+    """Return a message for every threshold the counts fail; empty when the gate passes.
+
+    A per-doctype threshold fails for a doctype without items in the report.
+    """
+    failures = []
+    for doctype, minimum in min_coverage:
+        if doctype is None:
+            label, covered, total = "All items", stats.counts["COVERED"], stats.total_items
+        elif doctype in stats.by_doctype:
+            label, covered, total = doctype, stats.by_doctype[doctype]["covered"], stats.by_doctype[doctype]["total"]
+        else:
+            failures.append(f"{doctype}: no items of this doctype, expected at least {minimum:g}% covered")
+            continue
+        percent = covered / total * 100 if total else 0
+        if percent < minimum:
+            failures.append(f"{label}: {percent:.2f}% covered, expected at least {minimum:g}%")
+
+    if max_broken is not None and stats.broken_chains > max_broken:
+        failures.append(f"{stats.broken_chains} broken chains, expected at most {max_broken}")
+    return failures
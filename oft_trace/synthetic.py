@@ -0,0 +1,188 @@
+"""Generator for synthetic aspec reports of any size."""
+import random
+from bisect import bisect
+from itertools import accumulate
+from typing import Dict, Optional, Sequence, TextIO, Union
+from xml.sax.saxutils import escape
+
+DEFAULT_DOCTYPES = ('feat', 'req', 'dsn', 'impl')
+# Doctypes that live in source code rather than in specification documents
+CODE_DOCTYPES = ('impl', 'utest', 'itest')
+
+def _source_location(rnd: random.Random, doctype: str, number: int):
+    """Return a plausible (file, line) for an item."""
+    if doctype in CODE_DOCTYPES:
+        return f"src/module_{number % 97}/{doctype}_{number % 13}.c", rnd.randrange(1, 2000)
+    return f"doc/{doctype}/spec_{number % 53}.md", rnd.randrange(1, 800)
+
+def _covering_status(target_version: int, referenced_version: int, wanted: bool) -> str:
+    """Return the coveringStatus OpenFastTrace reports for a link."""
+    if not wanted:
+        return "UNWANTED"
+    return "COVERING" if referenced_version == target_version else "COVERING_WRONG_VERSION"
+
+def generate_aspec(output: Union[str, TextIO], items: int = 10000, doctypes: Sequence[str] = DEFAULT_DOCTYPES,
+                   fan_out: int = 2, fan_in_skew: float = 0.0, cycles: int = 0, mismatch_rate: float = 0.02,
+                   duplicate_rate: float = 0.01, uncovered_rate: float = 0.05, seed: int = 0) -> Dict[str, int]:
+    """Write a synthetic aspec report with the shape of an OpenFastTrace trace.
+
+    Items are spread evenly over the doctype layers. Every item is covered by
+    an item of the layer below, except for a share of uncovered_rate, and
+    each item covers up to fan_out - 1 further items of the layer above. With
+    fan_in_skew > 0 these further links follow a Zipf-like distribution, so a
+    few items collect a large fan-in. A share of mismatch_rate of the links refers to the wrong
+    version, duplicate_rate of the items get a second, newer version with the
+    same ID, and cycles adds that many back links from an item to one that
+    covers it. Coverage statuses are derived from the links the way
+    OpenFastTrace would report them.
+
+    The output is a path or a text stream and is written item by item. The
+    same arguments always produce the same report. Returns counts of what
+    was written.
+    """
+    if len(doctypes) < 1 or items < 1:
+        raise ValueError("A report needs at least one doctype and one item")
+    rnd = random.Random(seed)
+    layers = len(doctypes)
+
+    # Items as (layer, number) in layer order; the first layers get the remainder
+    layer_sizes = [items // layers + (1 if layer < items % layers else 0) for layer in range(layers)]
+    layer_start = [0, *accumulate(layer_sizes)][:-1]
+    layer_of = [layer for layer, size in enumerate(layer_sizes) for _ in range(size)]
+    versions = [1 if rnd.random() < 0.8 else rnd.randint(2, 4) for _ in range(items)]
+
+    # Outgoing links as (target, referenced version, wanted)
+    covers = [[] for _ in range(items)]
+    covered_by = [[] for _ in range(items)]
+    mismatches = 0
+    for layer in range(1, layers):
+        size_above, size = layer_sizes[layer - 1], layer_sizes[layer]
+        if not size_above or not size:
+            continue
+        first_above, first = layer_start[layer - 1], layer_start[layer]
+        links = {source: set() for source in range(first, first + size)}
+
+        # Every item above is covered once, except for the share left uncovered
+        for target in range(first_above, first_above + size_above):
+            if rnd.random() >= uncovered_rate:
+                links[first + rnd.randrange(size)].add(target)
+
+        # Further links up to fan_out per item, with targets drawn by popularity
+        cum_weights = list(accumulate(1.0 / (rank + 1) ** fan_in_skew for rank in range(size_above)))
+        for targets in links.values():
+            for _ in range(rnd.randint(0, max(1, fan_out) - 1)):
+                targets.add(first_above + bisect(cum_weights, rnd.random() * cum_weights[-1]))
+
+        for source, targets in links.items():
+            for target in sorted(targets):
+                version = versions[target]
+                if rnd.random() < mismatch_rate:
+                    version = version + 1 if version == 1 or rnd.random() < 0.5 else version - 1
+                    mismatches += 1
+                covers[source].append((target, version, True))
+                covered_by[target].append((source, version, True))
+
+    # Back links from a covered item to one of its covering items close a cycle
+    cycle_count = 0
+    candidates = [target for target in range(items) if covered_by[target]]
+    for target in rnd.sample(candidates, min(cycles, len(candidates))):
+        source = covered_by[target][0][0]
+        covers[target].append((source, versions[source], False))
+        covered_by[source].append((target, versions[source], False))
+        cycle_count += 1
+
+    # Coverage statuses, from the lowest layer up so deep coverage is known for covering items
+    shallow = [True] * items
+    deep = [True] * items
+    for item in reversed(range(items)):
+        if layer_of[item] == layers - 1:
+            continue  # Nothing needs to cover the lowest layer
+        good = [source for source, version, wanted in covered_by[item] if wanted and version == versions[item]]
+        shallow[item] = bool(good)
+        deep[item] = shallow[item] and all(deep[source] for source in good)
+
+    def item_id(item):
+        layer = layer_of[item]
+        return f"{doctypes[layer]}-{item - layer_start[layer]}"
+
+    def status_text(covered):
+        return "COVERED" if covered else "UNCOVERED"
+
+    stream = open(output, 'w', encoding='utf-8') if isinstance(output, str) else output
+    written = 0
+    duplicates = 0
+    links = 0
+    try:
+        stream.write('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<specdocument>\n')
+        for layer, doctype in enumerate(doctypes):
+            stream.write(f'  <specobjects doctype="{escape(doctype)}">\n')
+            needs = doctypes[layer + 1] if layer + 1 < layers else None
+            for item in range(layer_start[layer], layer_start[layer] + layer_sizes[layer]):
+                number = item - layer_start[layer]
+                stream.write(_spec_object(
+                    rnd, item_id(item), versions[item], doctype, number, needs,
+                    [(item_id(target), version, doctypes[layer_of[target]]) for target, version, _ in covers[item]],
+                    [(item_id(source), versions[source], doctypes[layer_of[source]], status_text(shallow[source]),
+                      status_text(deep[source]), _covering_status(versions[item], version, wanted))
+                     for source, version, wanted in covered_by[item]],
+                    status_text(shallow[item]), status_text(deep[item])))
+                written += 1
+                links += len(covers[item])
+
+                # A newer version of the item whose links have not been updated yet
+                if needs and rnd.random() < duplicate_rate:
+                    stream.write(_spec_object(rnd, item_id(item), versions[item] + 1, doctype, number, needs,
+                                              [], [], "UNCOVERED", "UNCOVERED"))
+                    written += 1
+                    duplicates += 1
+            stream.write('  </specobjects>\n')
+        stream.write('</specdocument>\n')
+    finally:
+        if isinstance(output, str):
+            stream.close()
+
+    return {"items": written, "links": links, "mismatches": mismatches, "cycles": cycle_count,
+            "duplicates": duplicates}
+
+def _spec_object(rnd: random.Random, spec_id: str, version: int, doctype: str, number: int, needs: Optional[str],
+                 covered, covering, shallow: str, deep: str) -> str:
+    """Return the XML of one specobject."""
+    source_file, source_line = _source_location(rnd, doctype, number)
+    title = f"{doctype.capitalize()} {number}"
+    parts = [
+        "    <specobject>\n",
+        f"      <id>{escape(spec_id)}</id>\n",
+        "      <status>approved</status>\n",
+        f"      <version>{version}</version>\n",
+        f"      <shortdesc>{escape(title)}</shortdesc>\n",
+        f"      <sourcefile>{source_file}</sourcefile>\n",
+        f"      <sourceline>{source_line}</sourceline>\n",
+        f"      <description>The system shall provide {escape(title.lower())}.</description>\n",
+    ]
+    if needs:
+        parts.append(f"      <needscoverage>\n        <needsobj>{escape(needs)}</needsobj>\n      </needscoverage>\n")
+    if covered:
+        parts.append("      <covering>\n")
+        for covered_id, covered_version, covered_doctype in covered:
+            parts.append(f"        <coveredType>\n          <id>{escape(covered_id)}</id>\n"
+                         f"          <version>{covered_version}</version>\n"
+                         f"          <doctype>{escape(covered_doctype)}</doctype>\n        </coveredType>\n")
+        parts.append("      </covering>\n")
+
+    parts.append(f"      <coverage>\n        <shallowCoverageStatus>{shallow}</shallowCoverageStatus>\n"
+                 f"        <deepCoverageStatus>{deep}</deepCoverageStatus>\n        <coveringSpecObjects>\n")
+    for covering_id, covering_version, covering_doctype, own, covering_deep, covering_status in covering:
+        parts.append(f"          <coveringSpecObject>\n            <id>{escape(covering_id)}</id>\n"
+                     f"            <version>{covering_version}</version>\n"
+                     f"            <doctype>{escape(covering_doctype)}</doctype>\n"
+                     "            <status>approved</status>\n"
+                     f"            <ownCoverageStatus>{own}</ownCoverageStatus>\n"
+                     f"            <deepCoverageStatus>{covering_deep}</deepCoverageStatus>\n"
+                     f"            <coveringStatus>{covering_status}</coveringStatus>\n"
+                     "          </coveringSpecObject>\n")
+    parts.append("        </coveringSpecObjects>\n")
+    if needs:
+        kind = "coveredTypes" if shallow == "COVERED" else "uncoveredTypes"
+        parts.append(f"        <{kind}>\n          <{kind[:-1]}>{escape(needs)}</{kind[:-1]}>\n        </{kind}>\n")
+    parts.append("      </coverage>\n    </specobject>\n")
+    return "".join(parts)
@@ -0,0 +1,164 @@
+"""Tracing of imported specification items the way OpenFastTrace does it."""
+from collections import defaultdict
+from typing import Dict, Iterable, List, Tuple
+
+from oft_trace.graph import TraceGraph
+from oft_trace.markdown import ImportedItem
+from oft_trace.models import SpecItem, Coverage, CoveringItem, CoveredItem, intern_text
+from oft_trace.parser import build_relationship_maps
+
+COVERED = "COVERED"
+UNCOVERED = "UNCOVERED"
+CYCLE = "CYCLE"
+# Deep coverage statuses from best to worst
+_SEVERITY = {COVERED: 0, UNCOVERED: 1, CYCLE: 2}
+
+def worst_status(first: str, second: str) -> str:
+    """Return the worse of two coverage statuses."""
+    return first if _SEVERITY[first] >= _SEVERITY[second] else second
+
+def resolve_links(items: List[ImportedItem]) -> Dict[int, List[Tuple[int, str]]]:
+    """Resolve the covers references of the items into incoming links.
+
+    Returns a map from the position of a covered item to (position of the
+    covering item, link kind) pairs, in item order. The kind is one of:
+
+    - "wanted": the reference matches the item and it needs the covering doctype
+    - "unwanted": the reference matches, but the covering doctype is not needed
+    - "wrong_version": only another revision of the referenced item exists
+
+    References to item IDs defined more than once are ambiguous and, like
+    references to unknown items, do not create a link.
+    """
+    positions_by_id = defaultdict(list)
+    revisions_by_name = defaultdict(list)
+    for position, item in enumerate(items):
+        positions = positions_by_id[(item.doctype, item.name, item.revision)]
+        if not positions:
+            revisions_by_name[(item.doctype, item.name)].append(item.revision)
+        positions.append(position)
+
+    incoming = defaultdict(list)
+    for source, item in enumerate(items):
+        for reference in item.covers:
+            targets = positions_by_id.get(reference)
+            if targets:
+                if len(targets) == 1:
+                    target = targets[0]
+                    kind = "wanted" if item.doctype in items[target].needs else "unwanted"
+                    incoming[target].append((source, kind))
+                continue
+
+            for revision in revisions_by_name.get(reference[:2], ()):
+                targets = positions_by_id[(*reference[:2], revision)]
+                if len(targets) == 1:
+                    incoming[targets[0]].append((source, "wrong_version"))
+
+    return incoming
+
+def compute_coverage(items: List[ImportedItem], incoming: Dict[int, List[Tuple[int, str]]]):
+    """Compute shallow and deep coverage of every item.
+
+    An item is covered shallow when it is approved and every artifact type it
+    needs is covered by an approved item through a wanted link. Deep coverage
+    additionally requires all of those covering items to be covered deep; it
+    is computed bottom-up over the strongly connected components of the
+    coverage links, and items in or above a coverage cycle get CYCLE.
+
+    Returns the lists (shallow, deep, covered_types) indexed by position.
+    """
+    coverers = {}
+    covered_types = [set() for _ in items]
+    for target, links in incoming.items():
+        if items[target].status != "approved":
+            continue
+        sources = [source for source, kind in links if kind == "wanted" and items[source].status == "approved"]
+        if sources:
+            coverers[target] = sources
+            covered_types[target].update(items[source].doctype for source in sources)
+
+    shallow = [
+        COVERED if item.status == "approved" and covered_types[position].issuperset(item.needs) else UNCOVERED
+        for position, item in enumerate(items)
+    ]
+
+    deep = list(shallow)
+    propagate_deep_coverage(coverers, shallow, deep)
+    return shallow, deep, covered_types
+
+def propagate_deep_coverage(coverers, shallow, deep):
+    """Compute the deep coverage of the items in coverers bottom-up.
+
+    coverers maps each item to recompute to the items that cover it through
+    links that count for coverage. shallow and deep are indexed by item;
+    deep is updated in place, and the deep coverage of covering items that
+    are not recomputed is read from it as is. Items in a coverage cycle, and
+    items covered through one, get CYCLE.
+    """
+    graph = TraceGraph.from_adjacency(
+        {item: [source for source in sources if source in coverers] for item, sources in coverers.items()})
+
+    # Components come sinks first, so covering items are settled before the items they cover
+    for component in graph.strongly_connected_components():
+        if len(component) > 1 or graph.has_self_loop(component[0]):
+            for node in component:
+                deep[graph.keys[node]] = CYCLE
+            continue
+        item = graph.keys[component[0]]
+        status = shallow[item]
+        for source in coverers[item]:
+            status = worst_status(status, deep[source])
+        deep[item] = status
+
+def covering_status(kind: str, deep_status: str) -> str:
+    """Return the coveringStatus of a link as OpenFastTrace reports it in aspec files."""
+    if kind == "unwanted":
+        return "UNWANTED"
+    if kind == "wrong_version":
+        return "COVERING_WRONG_VERSION"
+    return "COVERING" if deep_status == COVERED else "UNCOVERED"
+
+def trace_items(items: Iterable[ImportedItem]):
+    """Trace imported items and return (spec_items, id_map, covering_map, covered_by_map).
+
+    The result has the same form as a parsed aspec file, with the coverage
+    sections filled in as OpenFastTrace would have written them.
+    """
+    items = list(items)
+    incoming = resolve_links(items)
+    shallow, deep, covered_types = compute_coverage(items, incoming)
+
+    spec_items = {}
+    id_map = defaultdict(list)
+    covering_map = defaultdict(list)
+    covered_by_map = defaultdict(list)
+    for position, imported in enumerate(items):
+        item = SpecItem(imported.name, imported.revision, imported.doctype)
+        item.shortdesc = imported.title
+        item.description = imported.description
+        item.status = intern_text(imported.status)
+        item.sourcefile = intern_text(imported.sourcefile)
+        item.sourceline = imported.sourceline
+        item.covers = [CoveredItem(id=intern_text(name), version=intern_text(revision), doctype=intern_text(doctype))
+                       for doctype, name, revision in imported.covers]
+
+        covering_items = []
+        for source, kind in incoming.get(position, ()):
+            covering = items[source]
+            covering_items.append(CoveringItem(
+                id=intern_text(covering.name), version=intern_text(covering.revision),
+                doctype=intern_text(covering.doctype), status=intern_text(covering.status),
+                ownCoverageStatus=shallow[source], deepCoverageStatus=deep[source],
+                coveringStatus=covering_status(kind, deep[source])))
+
+        item.coverage = Coverage(
+            shallowCoverageStatus=shallow[position], deepCoverageStatus=deep[position],
+            coveringItems=covering_items,
+            coveredTypes=[intern_text(need) for need in imported.needs if need in covered_types[position]],
+            uncoveredTypes=[intern_text(need) for need in imported.needs if need not in covered_types[position]])
+
+        spec_items[item.key] = item
+        id_map[item.id].append(item.key)
+
+    build_relationship_maps(spec_items, covering_map, covered_by_map)
+    return spec_items, id_map, covering_map, covered_by_map
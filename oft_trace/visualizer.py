@@ -1,16 +1,89 @@
 """Visualization utilities for trace chains."""
 from typing import Dict, Set, Optional, Any
-from rich.console import Console
 from rich.tree import Tree
 from rich.panel import Panel
 
-console = Console()
+from oft_trace.console import console
 
-def create_rich_tree(analyzer, item_key, visited=None, direction='both'):
-    """Create a rich tree representation of the trace chain with improved visualization."""
+# Rendering modes for trace chains
+RENDER_MODES = ('auto', 'full', 'dag')
+# In auto mode, chains whose full tree would exceed this many nodes are rendered as a DAG
+DAG_RENDER_THRESHOLD = 500
+
+def _count_tree_nodes(graph, root, neighbors):
+    """Count the nodes of the fully expanded tree below root along one direction.
+
+    Returns (tree nodes, expanded items, links between expanded items). Shared
+    subtrees are counted once per occurrence without being expanded again, and
+    links back into the current path count as a single cycle marker, so the
+    count is exact for acyclic chains and runs in linear time.
+    """
+    sizes = {}
+    on_path = {root}
+    totals = {root: 1}
+    links = 0
+    stack = [(root, iter(neighbors(root)))]
+
+    while stack:
+        node, children = stack[-1]
+        for child in children:
+            links += 1
+            if child in sizes:
+                totals[node] += sizes[child]
+            elif child in on_path or graph.items[child] is None:
+                totals[node] += 1
+            else:
+                on_path.add(child)
+                totals[child] = 1
+                stack.append((child, iter(neighbors(child))))
+                break
+        else:
+            stack.pop()
+            on_path.discard(node)
+            sizes[node] = totals.pop(node)
+            if stack:
+                totals[stack[-1][0]] += sizes[node]
+
+    return sizes[root], len(sizes), links
+
+def estimate_trace_size(analyzer, item_key, direction='both') -> Dict[str, int]:
+    """Estimate how many nodes a trace chain renders as a full tree and as a DAG."""
+    graph = analyzer.graph
+    root = graph.node(item_key)
+    if root is None or graph.items[root] is None:
+        return {'full': 1, 'dag': 1}
+
+    full, dag = 1, 1
+    if direction in ('both', 'outgoing'):
+        tree_nodes, _, links = _count_tree_nodes(graph, root, graph.successors)
+        full += tree_nodes - 1
+        dag += links
+    if direction in ('both', 'incoming'):
+        tree_nodes, _, links = _count_tree_nodes(graph, root, graph.predecessors)
+        full += tree_nodes - 1
+        dag += links
+
+    return {'full': full, 'dag': dag}
+
+def choose_render_mode(analyzer, item_key, direction='both', render_mode='auto', threshold=DAG_RENDER_THRESHOLD) -> str:
+    """Resolve a render mode to 'full' or 'dag' for one trace chain."""
+    if render_mode != 'auto':
+        return render_mode
+    estimate = estimate_trace_size(analyzer, item_key, direction)
+    return 'dag' if estimate['full'] > threshold else 'full'
+
+def create_rich_tree(analyzer, item_key, visited=None, direction='both', rendered=None):
+    """Create a rich tree representation of the trace chain with improved visualization.
+    
+    Pass an empty set as rendered to draw the chain as a DAG: every item's
+    subtree is expanded once and later occurrences refer back to it.
+    """
     if visited is None:
         visited = set()
     
+    if rendered is not None and (item_key, direction) in rendered and item_key not in visited:
+        return Tree(f"[dim]↑ see {item_key} above[/]")
+    
     item = analyzer.spec_items.get(item_key)
     if not item:
         return Tree(f"[bold red]NOT FOUND: {item_key}[/]")
@@ -63,6 +136,13 @@ def create_rich_tree(analyzer, item_key, visited=None, direction='both'):
     
     visited.add(item_key)
     
+    # In DAG mode the path set is shared and unwound on return instead of copied
+    if rendered is not None:
+        rendered.add((item_key, direction))
+        child_visited = lambda: visited
+    else:
+        child_visited = visited.copy
+    
     # Add covered items (outgoing)
     if direction in ['both', 'outgoing'] and item_key in analyzer.covering_map and analyzer.covering_map[item_key]:
         covers_branch = tree.add("[blue]Covers:[/]")
@@ -90,10 +170,10 @@ def create_rich_tree(analyzer, item_key, visited=None, direction='both'):
                             )
                         else:
                             version_branch = covers_branch.add("[bold red]♻️ VERSION MISMATCH![/]")
-                        sub_tree = create_rich_tree(analyzer, covered_key, visited.copy(), 'outgoing')
+                        sub_tree = create_rich_tree(analyzer, covered_key, child_visited(), 'outgoing', rendered)
                         version_branch.add(sub_tree)
                     else:
-                        sub_tree = create_rich_tree(analyzer, covered_key, visited.copy(), 'outgoing')
+                        sub_tree = create_rich_tree(analyzer, covered_key, child_visited(), 'outgoing', rendered)
                         covers_branch.add(sub_tree)
                 else:
                     label = f"[red]⨯ NOT FOUND: {covered_key}[/]"
@@ -128,10 +208,10 @@ def create_rich_tree(analyzer, item_key, visited=None, direction='both'):
                             )
                         else:
                             version_branch = covered_by_branch.add("[bold red]♻️ VERSION MISMATCH![/]")
-                        sub_tree = create_rich_tree(analyzer, covering_key, visited.copy(), 'incoming')
+                        sub_tree = create_rich_tree(analyzer, covering_key, child_visited(), 'incoming', rendered)
                         version_branch.add(sub_tree)
                     else:
-                        sub_tree = create_rich_tree(analyzer, covering_key, visited.copy(), 'incoming')
+                        sub_tree = create_rich_tree(analyzer, covering_key, child_visited(), 'incoming', rendered)
                         covered_by_branch.add(sub_tree)
                 else:
                     label = f"[red]⨯ NOT FOUND: {covering_key}[/]"
@@ -143,10 +223,16 @@ def create_rich_tree(analyzer, item_key, visited=None, direction='both'):
                             label = f"[bold red]♻️ VERSION MISMATCH![/] " + label
                     covered_by_branch.add(label)
     
+    if rendered is not None:
+        visited.discard(item_key)
+    
     return tree
 
-def create_ascii_chain(analyzer, item_key, depth=0, prefix="", is_last=True, visited=None, direction='both'):
-    """Create an ASCII art representation of the trace chain with improved visualization."""
+def create_ascii_chain(analyzer, item_key, depth=0, prefix="", is_last=True, visited=None, direction='both', rendered=None):
+    """Create an ASCII art representation of the trace chain with improved visualization.
+    
+    Pass an empty set as rendered to draw the chain as a DAG (see create_rich_tree).
+    """
     if visited is None:
         visited = set()
     
@@ -154,13 +240,24 @@ def create_ascii_chain(analyzer, item_key, depth=0, prefix="", is_last=True, vis
         print(f"{prefix}{'└── ' if is_last else '├── '}⟲ CYCLE: {item_key}")
         return
     
-    visited.add(item_key)
+    if rendered is not None and (item_key, direction) in rendered:
+        print(f"{prefix}{'└── ' if is_last else '├── '}↑ see {item_key} above")
+        return
     
     item = analyzer.spec_items.get(item_key)
     if not item:
         print(f"{prefix}{'└── ' if is_last else '├── '}⨯ NOT FOUND: {item_key}")
         return
     
+    visited.add(item_key)
+    
+    # In DAG mode the path set is shared and unwound on return instead of copied
+    if rendered is not None:
+        rendered.add((item_key, direction))
+        child_visited = lambda: visited
+    else:
+        child_visited = visited.copy
+    
     # Determine the status indicator
     coverage_type = item.coverage_type
     
@@ -213,7 +310,7 @@ def create_ascii_chain(analyzer, item_key, depth=0, prefix="", is_last=True, vis
                         print(f"{new_prefix}{'└── ' if is_last_child else '├── '}♻️ VERSION MISMATCH!")
                 
                 create_ascii_chain(analyzer, covered_key, depth + 1, new_prefix, is_last_child, 
-                                visited.copy(), 'outgoing')
+                                child_visited(), 'outgoing', rendered)
     
     # Display incoming links (what covers this item)
     if direction in ['both', 'incoming'] and item_key in analyzer.covered_by_map and analyzer.covered_by_map[item_key]:
@@ -236,4 +333,7 @@ def create_ascii_chain(analyzer, item_key, depth=0, prefix="", is_last=True, vis
                         print(f"{new_prefix}{'└── ' if is_last_child else '├── '}♻️ VERSION MISMATCH!")
                 
                 create_ascii_chain(analyzer, covering_key, depth + 1, new_prefix, is_last_child, 
-                                visited.copy(), 'incoming')
\ No newline at end of file
+                                child_visited(), 'incoming', rendered)
+    
+    if rendered is not None:
+        visited.discard(item_key)
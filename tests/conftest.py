@@ -4,4 +4,12 @@ import sys
 import pytest
 
 # Add parent directory to path to allow importing the package
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
\ No newline at end of file
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+SAMPLE_ASPEC = os.path.join(os.path.dirname(__file__), 'data', 'sample.aspec')
+
+
+@pytest.fixture
+def sample_aspec():
+    """Path of a small hand-written aspec report with a duplicate ID, cycles and version mismatches."""
+    return SAMPLE_ASPEC
@@ -0,0 +1,276 @@
+"""Tests for the trace analyzer against straightforward reference implementations."""
+
+import random
+
+from oft_trace.analyzer import COVERAGE_TYPES, DOCTYPE_COUNTERS, find_cycles, new_doctype_stats
+from oft_trace.models import Coverage, CoveredItem
+from oft_trace.pipeline import AnalysisPipeline
+from oft_trace.synthetic import generate_aspec
+
+
+def synthetic_pipeline(tmp_path, **options):
+    """Return an uncached pipeline over a synthetic report."""
+    aspec_file = str(tmp_path / "synthetic.aspec")
+    generate_aspec(aspec_file, **options)
+    return AnalysisPipeline(aspec_file, use_cache=False)
+
+
+def reference_cycle_members(graph):
+    """Return the nodes on a cycle, found with the path-copying DFS the analyzer used before."""
+    circular_items = set()
+
+    def visit(node, path, visited):
+        visited.add(node)
+        path.append(node)
+        for neighbor in graph.get(node, []):
+            if neighbor in path:
+                circular_items.update(path[path.index(neighbor):])
+            elif neighbor not in visited:
+                visit(neighbor, path[:], visited)
+        path.pop()
+
+    for node in graph:
+        if node not in circular_items:
+            visit(node, [], set())
+    return circular_items
+
+
+def reachable(graph, start):
+    """Return the nodes reachable from start in one or more steps."""
+    seen = set()
+    pending = list(graph.get(start, []))
+    while pending:
+        node = pending.pop()
+        if node not in seen:
+            seen.add(node)
+            pending.extend(graph.get(node, []))
+    return seen
+
+
+def test_cycles_match_reference_detector():
+    """Cyclic components hold the nodes the old detector found, grouped by mutual reachability."""
+    rnd = random.Random(5)
+    for _ in range(30):
+        nodes = [f"n{number}~1" for number in range(rnd.randint(1, 40))]
+        graph = {node: [rnd.choice(nodes) for _ in range(rnd.randint(0, 3))] for node in nodes}
+        # Hanging references have no outgoing links
+        graph[nodes[0]].append("missing~1")
+
+        cycles = find_cycles(graph)
+        members = [node for cycle in cycles for node in cycle]
+        assert len(members) == len(set(members))
+        assert set(members) == reference_cycle_members(graph)
+        reach = {node: reachable(graph, node) for node in members}
+        for cycle in cycles:
+            for node in cycle:
+                assert {other for other in members if other in reach[node] and node in reach[other]} == set(cycle)
+
+
+def test_cycles_are_flagged_as_circular(tmp_path):
+    """Marking the cycles of a report flags their items as CIRCULAR instead of failing."""
+    pipeline = synthetic_pipeline(tmp_path, items=400, fan_out=3, cycles=4, seed=3)
+    analyzer = pipeline.analyzer
+    cycles = pipeline.cycles()
+    assert cycles
+
+    graph = {key: list(targets) for key, targets in analyzer.covering_map.items()}
+    expected = reference_cycle_members(graph)
+    assert {key for cycle in cycles for key in cycle} == expected
+    assert {key for key, item in analyzer.spec_items.items() if item.in_circular_dependency} == expected
+    assert set(analyzer.categorize_items_by_coverage()["CIRCULAR"]) == expected
+    assert all(analyzer.spec_items[key].coverage_type == "CIRCULAR" for key in expected)
+
+    # The item list form used by older callers, with SpecItem objects or dicts
+    pipeline = synthetic_pipeline(tmp_path, items=400, fan_out=3, cycles=4, seed=3)
+    analyzer = pipeline.analyzer
+    analyzer.detect_circular_dependencies(list(analyzer.spec_items.values()))
+    assert {key for key, item in analyzer.spec_items.items() if item.in_circular_dependency} == expected
+    items = [{'id': item.id, 'version': item.version, 'covers': [dict(covered) for covered in item.covers]}
+             for item in analyzer.spec_items.values()]
+    analyzer.mark_circular_dependencies(items)
+    assert {f"{item['id']}~{item['version']}" for item in items if item.get('in_circular_dependency')} == expected
+
+
+def reference_get_item_by_id(spec_items, spec_id, doctype=None):
+    """Find the first item with an ID by scanning all keys, as the analyzer did before its indexes."""
+    for key, item in spec_items.items():
+        if key.startswith(f"{spec_id}~") and (doctype is None or item.doctype == doctype):
+            return key
+    return None
+
+
+def test_lazy_indexes_match_linear_scans(tmp_path):
+    """Lookups built from the indexes on first use answer like scans over all items."""
+    pipeline = synthetic_pipeline(tmp_path, items=300, duplicate_rate=0.1, uncovered_rate=0.2, seed=8)
+    analyzer = pipeline.analyzer
+    spec_items = analyzer.spec_items
+    item = next(iter(spec_items.values()))
+    assert analyzer.get_item_by_id(item.id, version=item.version) == item.key
+    assert analyzer._indexes is None
+
+    for spec_id in {item.id for item in spec_items.values()} | {"missing"}:
+        for doctype in (None, "req", "dsn"):
+            assert analyzer.get_item_by_id(spec_id, doctype) == reference_get_item_by_id(spec_items, spec_id, doctype)
+    assert analyzer._indexes is not None
+
+    filters = {
+        'spec_id': [None, item.id, "missing"],
+        'doctype': [None, "req", "impl"],
+        'status': [None, "approved", "draft"],
+        'coverage_type': [None, "COVERED", "ORPHANED", "UNCOVERED"],
+    }
+    for spec_id in filters['spec_id']:
+        for doctype in filters['doctype']:
+            for status in filters['status']:
+                for coverage_type in filters['coverage_type']:
+                    expected = [key for key, candidate in spec_items.items()
+                                if (spec_id is None or candidate.id == spec_id)
+                                and (doctype is None or candidate.doctype == doctype)
+                                and (status is None or candidate.status == status)
+                                and (coverage_type is None or candidate.coverage_type == coverage_type)]
+                    assert analyzer.find_items(spec_id, doctype, status, coverage_type) == expected
+
+    # Items added later are found once the indexes are dropped
+    spec_items["new-1~1"] = type(item)("new-1", "1", "req")
+    assert analyzer.get_item_by_id("new-1") is None
+    analyzer.reset_indexes()
+    assert analyzer._indexes is None
+    assert analyzer.get_item_by_id("new-1", "req") == "new-1~1"
+    assert analyzer.find_items(coverage_type="ORPHANED")[-1] == "new-1~1"
+
+
+def reference_version_mismatch(analyzer, source_key, target_key):
+    """Return (is_mismatch, details) with the pairwise loops the analyzer used before its table."""
+    spec_items, id_map, covering_map = analyzer.spec_items, analyzer.id_map, analyzer.covering_map
+    if source_key not in spec_items or target_key not in spec_items:
+        return False, None
+    source = spec_items[source_key]
+    target = spec_items[target_key]
+
+    for covering in source.coverage.get('coveringItems', []):
+        if covering['id'] == target.id and covering.get('coveringStatus') == 'COVERING_WRONG_VERSION':
+            return True, {'current': {'id': target.id, 'version': target.version},
+                          'expected': {'id': target.id, 'version': covering.get('version', 'unknown')}}
+
+    is_mismatch = False
+    expected_version = None
+    for source_variant in id_map[source_key.split('~')[0]]:
+        for target_variant in id_map[target_key.split('~')[0]]:
+            if source_variant != source_key or target_variant != target_key:
+                if source_variant in covering_map and target_variant in covering_map[source_variant]:
+                    is_mismatch = True
+                    expected_version = target_variant.split('~')[1]
+    if expected_version:
+        return is_mismatch, {'current': {'id': target.id, 'version': target.version},
+                             'expected': {'id': target.id, 'version': expected_version}}
+    return is_mismatch, None
+
+
+def test_version_mismatches_match_pairwise_check(tmp_path):
+    """The precomputed mismatch table answers like the pairwise check over all versions of both IDs."""
+    pipeline = synthetic_pipeline(tmp_path, items=400, fan_out=3, mismatch_rate=0.2, duplicate_rate=0.15, seed=9)
+    analyzer = pipeline.analyzer
+    links = {(source, target) for source, targets in analyzer.covering_map.items() for target in targets}
+    links |= {(source, target) for target, sources in analyzer.covered_by_map.items() for source in sources}
+    pairs = set(links)
+    # Pairs outside the relationship maps, between versions of linked IDs, and unknown keys
+    pairs |= {(source, variant) for source, target in list(pairs)
+              for variant in analyzer.id_map.get(target.split('~')[0], ())}
+    pairs |= {("missing~1", target) for _, target in list(pairs)[:5]}
+
+    mismatches = 0
+    for source, target in sorted(pairs):
+        expected = reference_version_mismatch(analyzer, source, target)
+        assert analyzer.is_version_mismatch(source, target) == expected[0]
+        assert analyzer.get_version_mismatch_details(source, target) == expected[1]
+        mismatches += expected[0]
+    assert mismatches > 20
+    # Probing pairs outside the relationship maps does not grow the table
+    assert set(analyzer._version_mismatches) == links
+
+
+def reference_coverage_type(item):
+    """Classify an item with the separate checks the model used before memoizing the result."""
+    coverage = item.coverage
+    if item.in_circular_dependency:
+        return "CIRCULAR"
+    if item.doctype.lower() in ['impl', 'implementation', 'code', 'test', 'testcase'] and item.covers:
+        return "COVERED"
+    if any(covering.get('coveringStatus') == 'COVERING_WRONG_VERSION'
+           for covering in coverage.get('coveringItems', [])):
+        return "OUTDATED"
+    if coverage.get('deepCoverageStatus') == 'UNCOVERED' and coverage.get('shallowCoverageStatus') == 'COVERED':
+        return "SHALLOW"
+    if not coverage.get('coveringItems'):
+        return "ORPHANED"
+    status = coverage.get('deepCoverageStatus', coverage.get('shallowCoverageStatus', "UNKNOWN"))
+    return status if status in ("UNCOVERED", "COVERED") else "UNKNOWN"
+
+
+def test_memoized_classification_matches_reference(tmp_path):
+    """Memoized coverage types, categories and doctype counts follow every change to an item."""
+    pipeline = synthetic_pipeline(tmp_path, items=400, doctypes=('feat', 'req', 'dsn', 'impl', 'utest'), fan_out=3,
+                                  cycles=3, mismatch_rate=0.1, uncovered_rate=0.2, seed=10)
+    analyzer = pipeline.analyzer
+
+    def check():
+        categories = {coverage_type: [] for coverage_type in COVERAGE_TYPES}
+        by_doctype = {}
+        for key, item in analyzer.spec_items.items():
+            coverage_type = reference_coverage_type(item)
+            assert item.coverage_type == coverage_type
+            categories[coverage_type].append(key)
+            stats = by_doctype.setdefault(item.doctype, new_doctype_stats())
+            stats["total"] += 1
+            if coverage_type in DOCTYPE_COUNTERS:
+                stats[DOCTYPE_COUNTERS[coverage_type]] += 1
+        assert analyzer.categorize_items_by_coverage() == categories
+        assert analyzer.count_coverage_by_doctype() == by_doctype
+        return categories
+
+    categories = check()
+    assert len([keys for keys in categories.values() if keys]) >= 4
+    pipeline.cycles()
+    assert check()["CIRCULAR"]
+
+    rnd = random.Random(10)
+    items = list(analyzer.spec_items.values())
+    for item in rnd.sample(items, 20):
+        item.in_circular_dependency = not item.in_circular_dependency
+    for item in rnd.sample(items, 20):
+        item.covers = [] if item.covers else [CoveredItem(id="req-0", version="1", doctype="req")]
+    for item in rnd.sample(items, 20):
+        item.coverage = Coverage(shallowCoverageStatus="COVERED", deepCoverageStatus="UNCOVERED",
+                                 coveringItems=item.coverage.coveringItems)
+    for item in rnd.sample(items, 20):
+        # In-place edits need an explicit invalidation
+        for covering in item.coverage.coveringItems:
+            covering.coveringStatus = "COVERING_WRONG_VERSION"
+        item.invalidate_coverage()
+    analyzer.reset_indexes()
+    check()
+
+
+def test_cycles_of_listed_items(tmp_path):
+    """Searching only the cycles reachable from some items flags those items like the full search."""
+    full = synthetic_pipeline(tmp_path, items=400, fan_out=3, cycles=5, seed=15)
+    full.cycles()
+    flagged = {key for key, item in full.analyzer.spec_items.items() if item.in_circular_dependency}
+
+    for doctype in ("feat", "req", "impl"):
+        pipeline = synthetic_pipeline(tmp_path, items=400, fan_out=3, cycles=5, seed=15)
+        item_keys = pipeline.analyzer.find_items(doctype=doctype)
+        pipeline.cycles(item_keys)
+        assert 'cycles' not in pipeline.completed
+        assert {key for key in item_keys if pipeline.analyzer.spec_items[key].in_circular_dependency} == \
+            flagged.intersection(item_keys)
+
+    # A trace chain shows the coverage types of its items only
+    analyzer = full.analyzer
+    item_key = next(key for key in flagged if analyzer.spec_items[key].doctype == "req")
+    for direction in ('both', 'incoming', 'outgoing'):
+        pipeline = synthetic_pipeline(tmp_path, items=400, fan_out=3, cycles=5, seed=15)
+        chain = pipeline.analyzer.trace_chain_keys(item_key, direction)
+        pipeline.cycles(chain)
+        assert all(pipeline.analyzer.spec_items[key].coverage_type == analyzer.spec_items[key].coverage_type
+                   for key in chain if key in analyzer.spec_items)
@@ -0,0 +1,93 @@
+"""Tests for batch trace queries."""
+
+import json
+import multiprocessing
+import os
+
+import pytest
+
+from oft_trace.batch import (BatchQuery, parallel_map, parse_batch_queries, render_query, resolve_query,
+                             result_file_name)
+from oft_trace.pipeline import AnalysisPipeline
+from oft_trace.reporter import json_trace_chain
+from oft_trace.synthetic import generate_aspec
+
+
+def test_parse_batch_queries():
+    """Query lines carry an ID and optional filters; blank and comment lines are skipped."""
+    lines = [
+        "# Items to check\n",
+        "req-1\n",
+        "\n",
+        "  dsn-2  version=3 doctype=dsn direction=incoming  \n",
+        "impl-4 direction=outgoing\n",
+        "   # indented comment\n",
+        "feat-1~2 doctype=feat\n",
+    ]
+    assert parse_batch_queries(lines) == [
+        BatchQuery("req-1", line=2),
+        BatchQuery("dsn-2", version="3", doctype="dsn", direction="incoming", line=4),
+        BatchQuery("impl-4", direction="outgoing", line=5),
+        BatchQuery("feat-1~2", doctype="feat", line=7),
+    ]
+    assert parse_batch_queries([]) == []
+
+
+@pytest.mark.parametrize("line, message", [
+    ("req-1 version", "line 2: expected version, doctype, direction as key=value, got 'version'"),
+    ("req-1 status=draft", "line 2: expected version, doctype, direction as key=value, got 'status=draft'"),
+    ("req-1 direction=up", "line 2: direction must be one of: both, incoming, outgoing"),
+])
+def test_malformed_query_lines(line, message):
+    """Malformed lines are rejected with their line number."""
+    with pytest.raises(ValueError) as error:
+        parse_batch_queries(["req-0", line])
+    assert str(error.value) == message
+
+
+def test_result_file_name():
+    """Result files are named after the resolved item, with unsafe characters replaced."""
+    assert result_file_name(BatchQuery("req-1"), "req-1~2", ".json") == "req-1~2.json"
+    assert result_file_name(BatchQuery("a/b\\c:d*e?"), None, ".txt") == "a_b_c_d_e_.txt"
+    assert result_file_name(BatchQuery("../../etc/passwd"), None, ".txt") == ".._.._etc_passwd.txt"
+    assert result_file_name(BatchQuery("spec id"), "spec id~1.0", ".json") == "spec_id~1.0.json"
+
+
+def test_resolve_and_render(tmp_path):
+    """Queries resolve IDs, versions and full item keys and render the trace chain of the item."""
+    aspec_file = str(tmp_path / "synthetic.aspec")
+    generate_aspec(aspec_file, items=100, duplicate_rate=0.2, seed=41)
+    analyzer = AnalysisPipeline(aspec_file, use_cache=False).analyzer
+    item = next(item for item in analyzer.spec_items.values() if len(analyzer.id_map[item.id]) > 1)
+    other_key = analyzer.id_map[item.id][1]
+
+    assert resolve_query(analyzer, BatchQuery(item.id)) == analyzer.id_map[item.id][0]
+    assert resolve_query(analyzer, BatchQuery(other_key)) == other_key
+    assert resolve_query(analyzer, BatchQuery(item.id, version=other_key.split("~")[1])) == other_key
+    assert resolve_query(analyzer, BatchQuery(item.id, doctype="missing")) is None
+
+    item_key, result = render_query(analyzer, BatchQuery(other_key, direction="incoming"))
+    assert item_key == other_key
+    assert json.loads(result) == {"query": {"id": other_key, "direction": "incoming"}, "key": other_key,
+                                  "trace": json_trace_chain(analyzer, other_key, "incoming")}
+    assert render_query(analyzer, BatchQuery("missing"), format='text') == \
+        (None, "Error: Item missing not found in the aspec file.\n")
+
+
+def test_parallel_map_is_serial_by_default(tmp_path):
+    """Items are processed in this process unless more than one job is asked for, and always in order."""
+    aspec_file = str(tmp_path / "synthetic.aspec")
+    generate_aspec(aspec_file, items=50, seed=43)
+    analyzer = AnalysisPipeline(aspec_file, use_cache=False).analyzer
+    keys = list(analyzer.spec_items)
+
+    def work(analyzer, key):
+        return analyzer.spec_items[key].doctype, os.getpid()
+
+    expected = [(analyzer.spec_items[key].doctype, os.getpid()) for key in keys]
+    assert list(parallel_map(work, analyzer, keys)) == expected
+    assert list(parallel_map(work, analyzer, keys, jobs=1)) == expected
+    if 'fork' in multiprocessing.get_all_start_methods():
+        results = list(parallel_map(work, analyzer, keys, jobs=2, chunksize=4))
+        assert [doctype for doctype, _ in results] == [doctype for doctype, _ in expected]
+        assert os.getpid() not in {pid for _, pid in results}
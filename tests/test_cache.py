@@ -0,0 +1,131 @@
+"""Tests for the on-disk cache of parsed models."""
+
+import os
+
+import pytest
+
+from oft_trace import cache, pipeline
+from oft_trace.analyzer import TraceAnalyzer
+from oft_trace.cache import file_fingerprint, load_cached_model, prune_cache, store_cached_model
+from oft_trace.pipeline import AnalysisPipeline
+from oft_trace.synthetic import generate_aspec
+
+
+def test_cache_hit_skips_parsing(tmp_path, monkeypatch):
+    """An unchanged file is loaded from the cache with the same items as a fresh parse."""
+    aspec_file = str(tmp_path / "synthetic.aspec")
+    cache_dir = str(tmp_path / "cache")
+    generate_aspec(aspec_file, items=300, seed=1)
+    parsed = AnalysisPipeline(aspec_file, cache_dir=cache_dir).parse()
+
+    def fail(*args):
+        raise AssertionError("parsed although the model is cached")
+
+    monkeypatch.setattr(pipeline, "_parse_file", fail)
+    cached = AnalysisPipeline(aspec_file, cache_dir=cache_dir).parse()
+    assert cached is not parsed
+    assert {key: item.__getstate__() for key, item in cached[0].items()} == \
+        {key: item.__getstate__() for key, item in parsed[0].items()}
+    assert cached[1:] == parsed[1:]
+
+
+def test_fingerprint_invalidation(tmp_path):
+    """Changing the modification time, the size or only the content of a file misses the cache."""
+    aspec_file = str(tmp_path / "synthetic.aspec")
+    cache_dir = str(tmp_path / "cache")
+    generate_aspec(aspec_file, items=50, seed=2)
+    fingerprint = file_fingerprint(aspec_file)
+    store_cached_model(fingerprint, "model", cache_dir)
+    assert load_cached_model(file_fingerprint(aspec_file), cache_dir) == "model"
+
+    stat = os.stat(aspec_file)
+    os.utime(aspec_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+    assert load_cached_model(file_fingerprint(aspec_file), cache_dir) is None
+
+    with open(aspec_file, 'ab') as f:
+        f.write(b"\n")
+    assert load_cached_model(file_fingerprint(aspec_file), cache_dir) is None
+
+    # Same size and modification time, different content
+    with open(aspec_file, 'r+b') as f:
+        f.seek(-1, os.SEEK_END)
+        f.write(b" ")
+    store_cached_model(file_fingerprint(aspec_file), "model", cache_dir)
+    with open(aspec_file, 'r+b') as f:
+        f.seek(-1, os.SEEK_END)
+        f.write(b"\t")
+    os.utime(aspec_file, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    changed = file_fingerprint(aspec_file)
+    assert changed[:2] == (stat.st_size + 1, stat.st_mtime_ns)
+    assert load_cached_model(changed, cache_dir) is None
+
+
+def test_format_bump_misses(tmp_path, monkeypatch):
+    """Entries written with another cache format are ignored."""
+    cache_dir = str(tmp_path / "cache")
+    store_cached_model((1, 2, "hash"), "model", cache_dir)
+    monkeypatch.setattr(cache, "CACHE_FORMAT", cache.CACHE_FORMAT + 1)
+    assert load_cached_model((1, 2, "hash"), cache_dir) is None
+
+    # Also when an old entry sits at the path of the new format
+    os.replace(os.path.join(cache_dir, os.listdir(cache_dir)[0]), cache.cache_path((1, 2, "hash"), cache_dir))
+    assert load_cached_model((1, 2, "hash"), cache_dir) is None
+
+
+def test_prune_least_recently_used(tmp_path):
+    """Pruning removes the entries used longest ago until the cache fits."""
+    cache_dir = str(tmp_path / "cache")
+    fingerprints = [(number, 0, "hash") for number in range(3)]
+    for age, fingerprint in enumerate(fingerprints):
+        store_cached_model(fingerprint, "x" * 1000, cache_dir, max_size=None)
+        path = cache.cache_path(fingerprint, cache_dir)
+        os.utime(path, (1000 + age, 1000 + age))
+    size = os.path.getsize(cache.cache_path(fingerprints[0], cache_dir))
+
+    # Loading the oldest entry makes it the most recently used one
+    assert load_cached_model(fingerprints[0], cache_dir) == "x" * 1000
+    assert prune_cache(cache_dir, max_size=2 * size) == 1
+    assert load_cached_model(fingerprints[1], cache_dir) is None
+    assert load_cached_model(fingerprints[0], cache_dir) is not None
+    assert load_cached_model(fingerprints[2], cache_dir) is not None
+
+
+@pytest.mark.parametrize("model", [lambda: None, "nested"])
+def test_unpicklable_model_is_not_cached(tmp_path, model):
+    """Models that cannot be pickled are skipped without an error or a leftover file."""
+    cache_dir = str(tmp_path / "cache")
+    if model == "nested":
+        model = []
+        for _ in range(100000):
+            model = [model]
+    store_cached_model((1, 2, "hash"), model, cache_dir)
+    assert load_cached_model((1, 2, "hash"), cache_dir) is None
+    assert os.listdir(cache_dir) == []
+
+
+def test_cycles_are_cached_with_the_model(tmp_path, monkeypatch):
+    """Cycles found once are loaded with the cached model and flag the same items."""
+    aspec_file = str(tmp_path / "synthetic.aspec")
+    cache_dir = str(tmp_path / "cache")
+    generate_aspec(aspec_file, items=300, fan_out=3, cycles=3, seed=14)
+    first = AnalysisPipeline(aspec_file, cache_dir=cache_dir)
+    cycles = first.cycles()
+    assert cycles
+
+    def fail(*args):
+        raise AssertionError("searched for cycles although they are cached")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(TraceAnalyzer, "mark_circular_dependencies", fail)
+        patch.setattr(TraceAnalyzer, "mark_reachable_circular_dependencies", fail)
+        second = AnalysisPipeline(aspec_file, cache_dir=cache_dir)
+        assert second.cycles() == cycles
+        assert second.analyzer.get_circular_dependencies() == cycles
+        assert second.analyzer._graph is None
+        assert [item.coverage_type for item in second.analyzer.spec_items.values()] == \
+            [item.coverage_type for item in first.analyzer.spec_items.values()]
+
+    # Another version of the file has cycles of its own
+    generate_aspec(aspec_file, items=300, fan_out=3, cycles=0, seed=14)
+    assert AnalysisPipeline(aspec_file, cache_dir=cache_dir).cycles() == []
+    assert AnalysisPipeline(aspec_file, use_cache=False).cycles() == []
@@ -0,0 +1,68 @@
+"""Tests for the incremental coverage engine."""
+
+import os
+import glob
+import random
+
+import pytest
+
+from oft_trace.coverage import CoverageEngine
+from oft_trace.markdown import import_markdown_file
+from oft_trace.models import CoveredItem, SpecItem
+from oft_trace.pipeline import AnalysisPipeline
+from oft_trace.synthetic import generate_aspec
+from oft_trace.tracer import trace_items
+
+CONTENT_DIR = os.path.join(os.path.dirname(__file__), "content")
+
+
+@pytest.mark.parametrize("md_file", sorted(glob.glob(os.path.join(CONTENT_DIR, "*.md"))),
+                         ids=os.path.basename)
+def test_engine_reproduces_traced_coverage(md_file):
+    """The engine computes the coverage the tracer wrote for every item."""
+    if os.path.basename(md_file) == "duplicated-ids.md":
+        pytest.skip("a model keyed by ID and version keeps only one of the duplicated items")
+    spec_items = trace_items(import_markdown_file(md_file))[0]
+    engine = CoverageEngine(spec_items)
+
+    assert engine.mismatches() == []
+    for key, item in spec_items.items():
+        assert engine.coverage(key) == item.coverage
+
+
+def test_incremental_edits_match_rebuild(tmp_path):
+    """After random edits, the incremental coverage equals a fresh computation over the edited model."""
+    aspec_file = tmp_path / "synthetic.aspec"
+    rnd = random.Random(5)
+    for seed in range(5):
+        generate_aspec(str(aspec_file), items=300, fan_out=3, cycles=3, mismatch_rate=0.05,
+                       duplicate_rate=0, seed=seed)
+        spec_items = AnalysisPipeline(str(aspec_file), use_cache=False).parse()[0]
+        engine = CoverageEngine(spec_items)
+
+        for step in range(25):
+            keys = list(engine.nodes)
+            key = rnd.choice(keys)
+            edit = rnd.randrange(5)
+            if edit == 0:
+                engine.add_link(key, rnd.choice(keys))
+            elif edit == 1 and engine.nodes[key].covers:
+                spec_id, version, _ = rnd.choice(engine.nodes[key].covers)
+                engine.remove_link(key, f"{spec_id}~{version}")
+            elif edit == 2 and f"{engine.nodes[key].id}~{int(engine.nodes[key].version) + 1}" not in engine.nodes:
+                engine.bump_version(key)
+            elif edit == 3:
+                engine.remove_item(key)
+            elif edit == 4:
+                target = rnd.choice(keys)
+                item = SpecItem(f"new-{step}", "1", rnd.choice(["req", "dsn", "impl"]))
+                item.covers = [CoveredItem(id=engine.nodes[target].id, version=engine.nodes[target].version,
+                                           doctype=engine.nodes[target].doctype)]
+                engine.add_item(item, needs=rnd.choice([(), ("impl",)]))
+
+        engine.apply(spec_items)
+        rebuilt = CoverageEngine(spec_items)
+        assert list(rebuilt.nodes) == list(spec_items)
+        assert rebuilt.mismatches() == []
+        for key in spec_items:
+            assert rebuilt.coverage(key) == engine.coverage(key)
@@ -0,0 +1,104 @@
+"""Tests for comparing two aspec reports."""
+
+import json
+import re
+import subprocess
+import sys
+
+from oft_trace.diff import diff_reports, hash_report
+from oft_trace.synthetic import generate_aspec
+
+
+def replace_object(aspec_file, spec_id, change):
+    """Rewrite the spec object with the given ID through change(fragment)."""
+    with open(aspec_file, encoding='utf-8') as f:
+        text = f.read()
+    pattern = re.compile(r'<specobject>\s*<id>%s</id>.*?</specobject>' % re.escape(spec_id), re.S)
+    with open(aspec_file, 'w', encoding='utf-8') as f:
+        f.write(pattern.sub(lambda match: change(match.group()), text, count=1))
+
+
+def set_coverage(status):
+    def change(fragment):
+        return re.sub(r'<(shallow|deep)CoverageStatus>\w+</', rf'<\1CoverageStatus>{status}</', fragment)
+    return change
+
+
+def keys(report, section):
+    return [(entry["before"] or {}).get("key") or entry["after"]["key"] for entry in report[section]]
+
+
+def test_diff_reports_changes(tmp_path):
+    """Only the items whose coverage or key changed are reported, in their sections."""
+    baseline = str(tmp_path / "baseline.aspec")
+    current = str(tmp_path / "current.aspec")
+    generate_aspec(baseline, items=200, uncovered_rate=0, mismatch_rate=0, duplicate_rate=0, seed=3)
+    generate_aspec(current, items=200, uncovered_rate=0, mismatch_rate=0, duplicate_rate=0, seed=3)
+
+    replace_object(baseline, "dsn-1", set_coverage("UNCOVERED"))
+    replace_object(current, "req-1", set_coverage("UNCOVERED"))
+    replace_object(current, "feat-2", lambda fragment: fragment.replace("<description>", "<description>new "))
+    replace_object(current, "feat-3", lambda fragment: re.sub(r'<version>\d+</version>', '<version>7</version>',
+                                                             fragment, count=1))
+    replace_object(current, "impl-4", lambda fragment: "")
+
+    report = diff_reports(baseline, current)
+    assert report["summary"]["unchanged_objects"] == 195
+    assert keys(report, "newly_broken") == ["req-1~1"]
+    assert report["newly_broken"][0]["after"]["failure_reasons"]
+    assert keys(report, "fixed") == ["dsn-1~1"]
+    assert report["changed_coverage"] == []
+    assert [(entry["before"]["key"], entry["after"]["key"]) for entry in report["version_bumped"]] == [
+        ("feat-3~1", "feat-3~7")]
+    assert report["added"] == []
+    assert keys(report, "removed") == ["impl-4~1"]
+
+
+def test_unsplittable_reports_are_parsed_without_cache(tmp_path, monkeypatch):
+    """Reports the scanner cannot split are compared by their parsed items, which are not cached."""
+    cache_dir = tmp_path / "cache"
+    monkeypatch.setenv("OFT_TRACE_CACHE_DIR", str(cache_dir))
+    baseline = str(tmp_path / "baseline.aspec")
+    current = str(tmp_path / "current.aspec")
+    generate_aspec(baseline, items=200, seed=5)
+    shape = generate_aspec(current, items=200, seed=5)
+    replace_object(current, "req-1", set_coverage("UNCOVERED"))
+    replace_object(current, "impl-4", lambda fragment: "")
+    scanned = diff_reports(baseline, current)
+
+    report = hash_report(current)
+    assert report.count == len(report.objects) == shape["items"] - 1
+    with open(current, 'rb') as f:
+        data = f.read()
+    assert all(data[start:end].startswith(b'<specobject>') and data[start:end].endswith(b'</specobject>')
+               for start, end in report.objects.values())
+
+    replace_object(current, "feat-0", lambda fragment: "<!-- first feature -->" + fragment)
+    assert hash_report(current).count == shape["items"] - 1
+    parsed = diff_reports(baseline, current)
+    for section in ("newly_broken", "fixed", "changed_coverage", "version_bumped", "added", "removed"):
+        assert parsed[section] == scanned[section], section
+    assert not cache_dir.exists()
+
+
+def test_diff_command_exit_code(tmp_path):
+    """The command fails the gate only for newly broken items unless asked otherwise."""
+    baseline = str(tmp_path / "baseline.aspec")
+    current = str(tmp_path / "current.aspec")
+    generate_aspec(baseline, items=100, seed=1)
+    generate_aspec(current, items=100, seed=1)
+
+    def run(*options):
+        return subprocess.run([sys.executable, "-m", "oft_trace.cli", "diff", baseline, current, *options],
+                              capture_output=True, text=True)
+
+    assert run().returncode == 0
+    replace_object(current, "impl-5", lambda fragment: "")
+    assert run().returncode == 0
+    assert run("--fail-on", "changes").returncode == 3
+
+    replace_object(current, "req-2", set_coverage("UNCOVERED"))
+    result = run("--format", "json")
+    assert result.returncode == 3
+    assert json.loads(result.stdout)["summary"]["newly_broken"] == 1
+    assert run("--fail-on", "never").returncode == 0
@@ -0,0 +1,44 @@
+"""Tests for the SQLite export of an analyzed report."""
+
+import sqlite3
+
+from oft_trace.export import EXPORT_FORMAT, export_sqlite
+from oft_trace.pipeline import AnalysisPipeline
+from oft_trace.reporter import iter_json_report_items
+from oft_trace.synthetic import generate_aspec
+
+
+def test_export_matches_json_report(tmp_path):
+    """The database holds every item with the coverage type, links and failure reasons of the JSON report."""
+    aspec_file = str(tmp_path / "synthetic.aspec")
+    db_file = str(tmp_path / "report.db")
+    generate_aspec(aspec_file, items=500, fan_out=3, cycles=3, mismatch_rate=0.1, seed=5)
+    pipeline = AnalysisPipeline(aspec_file, use_cache=False)
+    pipeline.cycles()
+    analyzer = pipeline.analyzer
+
+    counts = export_sqlite(analyzer, db_file, batch_size=64)
+    records = {record["key"]: record for record in iter_json_report_items(analyzer, list(analyzer.spec_items), True)}
+    connection = sqlite3.connect(db_file)
+    assert connection.execute("PRAGMA user_version").fetchone()[0] == EXPORT_FORMAT
+    assert counts["items"] == len(records)
+
+    items = connection.execute("SELECT item_key, coverage_type, in_circular_dependency FROM items ORDER BY rowid")
+    assert [(key, record["coverage_type"], int(record["in_circular_dependency"])) for key, record in records.items()] \
+        == items.fetchall()
+    reasons = {}
+    for key, reason in connection.execute("SELECT item_key, reason FROM failure_reasons ORDER BY item_key, position"):
+        reasons.setdefault(key, []).append(reason)
+    assert reasons == {key: record["failure_reasons"] for key, record in records.items() if record["failure_reasons"]}
+
+    edges = connection.execute("SELECT source_key, target_key FROM edges ORDER BY rowid").fetchall()
+    _, _, covering_map, _ = pipeline.parse()
+    assert edges == [(source, target) for source, targets in covering_map.items() for target in targets]
+    covering = connection.execute("SELECT COUNT(*) FROM covering").fetchone()[0]
+    assert covering == sum(len(record["covered_by"]) for record in records.values())
+
+    cycles = connection.execute("SELECT cycle, item_key FROM cycles ORDER BY cycle, position").fetchall()
+    assert cycles and cycles == [(number, key) for number, cycle in enumerate(pipeline.cycles(), 1) for key in cycle]
+
+    plan = connection.execute("EXPLAIN QUERY PLAN SELECT * FROM items WHERE coverage_type = 'ORPHANED'").fetchall()
+    assert "items_coverage_type" in str(plan)
@@ -0,0 +1,75 @@
+"""Tests for rendering the trace-failures report in worker processes."""
+
+import io
+import os
+import subprocess
+import sys
+from contextlib import redirect_stdout
+
+import pytest
+from rich.console import Console
+
+from oft_trace import console as shared_console
+from oft_trace.console import console
+from oft_trace.pipeline import AnalysisPipeline
+from oft_trace.reporter import analyze_and_display_failure, render_failure
+from oft_trace.synthetic import generate_aspec
+
+
+def failure_sections(output):
+    """Return the part of the trace-failures output after the loading messages and the report header."""
+    return output[output.index(b"items with issues"):]
+
+
+@pytest.mark.parametrize("output", ["file", "console"])
+def test_parallel_output_is_identical(tmp_path, output):
+    """Rendering with several jobs writes the same bytes, in the same order, as one job."""
+    aspec_file = str(tmp_path / "synthetic.aspec")
+    generate_aspec(aspec_file, items=300, fan_out=3, cycles=3, mismatch_rate=0.1, seed=7)
+
+    def run(jobs):
+        command = [sys.executable, "-m", "oft_trace.cli", "trace-failures", aspec_file, "--no-cache", "--jobs", jobs]
+        if output == "console":
+            env = dict(os.environ, FORCE_COLOR="1", COLUMNS="120")
+            return failure_sections(subprocess.run(command, capture_output=True, env=env, check=True).stdout)
+        output_file = str(tmp_path / f"failures-{jobs}.txt")
+        subprocess.run(command + ["--output", output_file], capture_output=True, check=True)
+        with open(output_file, 'rb') as f:
+            return failure_sections(f.read())
+
+    serial = run("1")
+    assert serial.count(b"FAILURE ") > 50
+    assert run("3") == serial
+
+
+@pytest.mark.parametrize("render_mode", ["auto", "full", "dag"])
+@pytest.mark.parametrize("output_file", [True, False])
+def test_sections_match_direct_output(tmp_path, monkeypatch, output_file, render_mode):
+    """A rendered section holds exactly what analyze_and_display_failure and the separator print directly."""
+    aspec_file = str(tmp_path / "synthetic.aspec")
+    generate_aspec(aspec_file, items=200, fan_out=3, cycles=3, mismatch_rate=0.1, seed=9)
+    pipeline = AnalysisPipeline(aspec_file, use_cache=False)
+    pipeline.cycles()
+    analyzer = pipeline.analyzer
+    keys = [key for key, item in analyzer.spec_items.items() if item.coverage_type != "COVERED"]
+    assert any(analyzer.spec_items[key].coverage_type == "CIRCULAR" for key in keys)
+
+    # The console as a color terminal, writing into a buffer
+    buffer = io.StringIO()
+    monkeypatch.setattr(shared_console, "_console",
+                        Console(file=buffer, force_terminal=True, color_system="truecolor", width=120))
+
+    for index, key in enumerate(keys, 1):
+        if output_file:
+            with redirect_stdout(io.StringIO()) as direct:
+                analyze_and_display_failure(analyzer, key, index, len(keys), True, render_mode)
+                print("\n" + "-" * 80 + "\n")
+            expected = direct.getvalue()
+        else:
+            buffer.seek(0)
+            buffer.truncate()
+            analyze_and_display_failure(analyzer, key, index, len(keys), False, render_mode)
+            console.print("\n" + "-" * 80 + "\n")
+            expected = buffer.getvalue()
+            assert "\x1b[" in expected
+        assert render_failure(analyzer, key, index, len(keys), output_file, render_mode) == expected
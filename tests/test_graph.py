@@ -0,0 +1,54 @@
+"""Tests for the integer-keyed trace graph."""
+
+from oft_trace.graph import TraceGraph
+from oft_trace.parser import parse_aspec_model
+from oft_trace.synthetic import generate_aspec
+
+
+def test_graph_matches_relationship_maps(tmp_path):
+    """Successors and predecessors list the keys of the relationship maps, in order."""
+    aspec_file = str(tmp_path / "synthetic.aspec")
+    generate_aspec(aspec_file, items=500, fan_out=3, cycles=3, duplicate_rate=0.05, seed=6)
+    spec_items, _, covering_map, covered_by_map = parse_aspec_model(aspec_file)
+    # A link to an item that is not in the report
+    first = next(iter(spec_items))
+    covering_map[first] = covering_map[first] + ["missing~1"]
+
+    graph = TraceGraph.from_maps(spec_items, covering_map, covered_by_map)
+    assert graph.keys[:len(spec_items)] == list(spec_items)
+    assert graph.items[:len(spec_items)] == list(spec_items.values())
+    assert "missing~1" in graph.keys[len(spec_items):]
+    assert graph.items[graph.node("missing~1")] is None
+    assert graph.node("unknown~1") is None
+    assert graph.node_count == len(set(spec_items).union(
+        *covering_map.values(), *covered_by_map.values(), covering_map, covered_by_map))
+    assert graph.edge_count == sum(len(targets) for targets in covering_map.values())
+
+    for node, key in enumerate(graph.keys):
+        assert [graph.keys[target] for target in graph.successors(node)] == covering_map.get(key, [])
+        assert [graph.keys[source] for source in graph.predecessors(node)] == covered_by_map.get(key, [])
+        assert all(graph.node(graph.keys[target]) == target for target in graph.successors(node))
+
+
+def test_self_loops_and_empty_graph():
+    """A node covering itself is a cycle of its own; an empty graph has no components."""
+    graph = TraceGraph.from_adjacency({"a~1": ["a~1", "b~1"], "b~1": []})
+    assert graph.has_self_loop(graph.node("a~1"))
+    assert not graph.has_self_loop(graph.node("b~1"))
+    assert [[graph.keys[node] for node in cycle] for cycle in graph.find_cycles()] == [["a~1"]]
+
+    empty = TraceGraph.from_adjacency({})
+    assert empty.node_count == empty.edge_count == 0
+    assert empty.strongly_connected_components() == []
+
+
+def test_long_cycle_beyond_recursion_limit():
+    """Components deeper than the recursion limit are found in one piece."""
+    keys = [f"item-{number}~1" for number in range(50000)]
+    adjacency = {key: [keys[(number + 1) % len(keys)]] for number, key in enumerate(keys)}
+    adjacency[keys[-1]].append("tail~1")
+    graph = TraceGraph.from_adjacency(adjacency)
+    cycles = graph.find_cycles()
+    assert len(cycles) == 1
+    assert sorted(cycles[0]) == list(range(len(keys)))
+    assert len(graph.strongly_connected_components()) == 2
@@ -0,0 +1,219 @@
+"""Tests for updating a parsed model from a changed aspec file."""
+
+import random
+import re
+
+import pytest
+
+from oft_trace.incremental import UnsupportedLayout, hash_spec_objects, scan_aspec_file
+from oft_trace.offsets import fragment_prefix, parse_fragment
+from oft_trace.parser import parse_aspec_model
+from oft_trace.pipeline import AnalysisPipeline
+from oft_trace.synthetic import generate_aspec
+
+
+def edit_aspec(aspec_file, rnd, edits):
+    """Apply random edits to the spec objects of an aspec file, keeping its layout valid."""
+    with open(aspec_file, 'rb') as f:
+        data = f.read()
+    objects = [(offset, offset + len(raw), doctype) for offset, raw, doctype in scan_aspec_file(aspec_file)[1]]
+    pieces = [[data[start:end], data[end:objects[position + 1][0] if position + 1 < len(objects) else len(data)],
+               doctype] for position, (start, end, doctype) in enumerate(objects)]
+    keys = [re.search(rb'<id>([^<]*)</id>.*?<version>([^<]*)</version>', piece[0], re.S).groups()
+            + (piece[2].encode(),) for piece in pieces]
+
+    for step in range(edits):
+        position = rnd.randrange(1, len(pieces))
+        fragment = pieces[position][0]
+        same_doctype = [other for other in range(len(pieces)) if pieces[other][2] == pieces[position][2]]
+        edit = rnd.randrange(7)
+        if edit == 0:
+            pieces[position][0] = re.sub(rb'<description>[^<]*</description>',
+                                         b'<description>edited %d</description>' % step, fragment)
+        elif edit == 1:
+            # Links from the top layer to the bottom one often close a cycle
+            position = rnd.choice([other for other in range(len(pieces)) if pieces[other][2] == pieces[0][2]])
+            target = rnd.choice([key for key in keys if key[2] == keys[-1][2]] if rnd.random() < 0.7 else keys)
+            link = b'<coveredType><id>%s</id><version>%s</version><doctype>%s</doctype></coveredType>' % target
+            fragment = pieces[position][0]
+            if b'<covering>' in fragment:
+                pieces[position][0] = fragment.replace(b'<covering>', b'<covering>' + link, 1)
+            else:
+                pieces[position][0] = fragment.replace(b'<coverage>', b'<covering>%s</covering><coverage>' % link, 1)
+        elif edit == 2:
+            pieces[position][0] = re.sub(rb'<coveredType><id>.*?</coveredType>', b'', fragment, count=1)
+        elif edit == 3:
+            pieces[position - 1][1] += pieces[position][1]
+            del pieces[position], keys[position]
+        elif edit == 4:
+            other = rnd.choice(same_doctype)
+            pieces[position][0], pieces[other][0] = pieces[other][0], fragment
+            keys[position], keys[other] = keys[other], keys[position]
+        elif edit == 5:
+            new_id = b'added-%d' % step
+            pieces.insert(position, [re.sub(rb'<id>[^<]*</id>', b'<id>%s</id>' % new_id, fragment, count=1),
+                                     b'\n    ', pieces[position][2]])
+            keys.insert(position, (new_id,) + keys[position][1:])
+        else:
+            version = int(keys[position][1]) + 1
+            pieces[position][0] = re.sub(rb'<version>\d+</version>', b'<version>%d</version>' % version, fragment,
+                                         count=1)
+            keys[position] = (keys[position][0], b'%d' % version, keys[position][2])
+
+    with open(aspec_file, 'wb') as f:
+        f.write(data[:objects[0][0]] + b''.join(fragment + separator for fragment, separator, _ in pieces))
+
+
+def analysis_state(pipeline):
+    """Everything the reports read from a fully analyzed pipeline."""
+    pipeline.run()
+    analyzer = pipeline.analyzer.prepare()
+    spec_items, id_map, covering_map, covered_by_map = pipeline.parse()
+    links = [(source, target) for source, targets in covering_map.items() for target in targets]
+    links += [(source, target) for target, sources in covered_by_map.items() for source in sources]
+    return {
+        'items': [(key, item.__getstate__()) for key, item in spec_items.items()],
+        'maps': [list(mapping.items()) for mapping in (id_map, covering_map, covered_by_map)],
+        'categories': analyzer.categorize_items_by_coverage(),
+        'doctypes': list(analyzer.count_coverage_by_doctype().items()),
+        'broken_chains': analyzer.broken_chains,
+        'cycles': pipeline.cycles(),
+        'version_mismatches': [analyzer.get_version_mismatch_details(*link) for link in links],
+        'edges': analyzer.graph.edge_count,
+    }
+
+
+def test_update_matches_fresh_analysis(tmp_path):
+    """An updated pipeline analyzes the edited report exactly like a fresh one."""
+    aspec_file = str(tmp_path / "synthetic.aspec")
+    rnd = random.Random(3)
+    for seed in range(3):
+        generate_aspec(aspec_file, items=400, fan_out=3, cycles=4, mismatch_rate=0.1, duplicate_rate=0.1, seed=seed)
+        pipeline = AnalysisPipeline(aspec_file, use_cache=False, track_changes=True)
+        analysis_state(pipeline)
+
+        for _ in range(6):
+            edit_aspec(aspec_file, rnd, rnd.randrange(1, 10))
+            changes = pipeline.update()
+            assert changes is not None
+            assert analysis_state(pipeline) == analysis_state(AnalysisPipeline(aspec_file, use_cache=False))
+
+
+def test_cached_model_is_updated(tmp_path):
+    """A changed file is loaded by updating the cached model of its previous version."""
+    aspec_file = str(tmp_path / "synthetic.aspec")
+    cache_dir = str(tmp_path / "cache")
+    generate_aspec(aspec_file, items=300, cycles=2, seed=4)
+    AnalysisPipeline(aspec_file, cache_dir=cache_dir).parse()
+    edit_aspec(aspec_file, random.Random(1), 5)
+
+    updated = AnalysisPipeline(aspec_file, cache_dir=cache_dir)
+    updated.parse()
+    assert updated.object_hashes[0] is not None
+    assert analysis_state(updated) == analysis_state(AnalysisPipeline(aspec_file, use_cache=False))
+
+
+# Markup the tag scanner leaves to expat, each applied to the text of the report
+MARKUP = [
+    lambda text: text.replace('<specdocument>', '<!DOCTYPE specdocument>\n<specdocument>', 1),
+    lambda text: text.replace('<specobject>', '<!-- removed <specobject> --><specobject>', 2),
+    lambda text: text.replace('<specobjects', '<?oft ignored?>\n  <specobjects', 1),
+    lambda text: re.sub(r'<description>([^<]*)</description>', r'<description><![CDATA[\1 <b>]]></description>',
+                        text, count=3),
+    lambda text: text.replace('</specobject>', '</specobject>text', 3),
+    lambda text: re.sub(r'(<specobjects doctype="[^"]*")>', r'\1 xmlns:oft="urn:oft">', text),
+]
+
+
+def test_markup_is_updated(tmp_path):
+    """Comments, CDATA sections, a DOCTYPE, processing instructions and namespaces are updated in place."""
+    aspec_file = str(tmp_path / "synthetic.aspec")
+    rnd = random.Random(5)
+    generate_aspec(aspec_file, items=300, fan_out=3, cycles=3, mismatch_rate=0.1, duplicate_rate=0.1, seed=2)
+    pipeline = AnalysisPipeline(aspec_file, use_cache=False, track_changes=True)
+    analysis_state(pipeline)
+
+    for markup in MARKUP:
+        with open(aspec_file, encoding='utf-8') as f:
+            text = markup(f.read())
+        with open(aspec_file, 'w', encoding='utf-8') as f:
+            f.write(text)
+        assert pipeline.update() is not None
+        edit_aspec(aspec_file, rnd, 3)
+        assert pipeline.update() is not None
+        assert analysis_state(pipeline) == analysis_state(AnalysisPipeline(aspec_file, use_cache=False))
+
+
+def test_unsupported_layout_is_not_updated(tmp_path):
+    """Files that cannot be split by their raw bytes are left to a full parse."""
+    aspec_file = str(tmp_path / "synthetic.aspec")
+    generate_aspec(aspec_file, items=50, seed=2)
+    pipeline = AnalysisPipeline(aspec_file, use_cache=False, track_changes=True)
+    spec_items = dict(pipeline.parse()[0])
+
+    with open(aspec_file, encoding='utf-8') as f:
+        text = f.read()
+    with open(aspec_file, 'wb') as f:
+        f.write(text.replace('encoding="UTF-8"', 'encoding="UTF-16"', 1).encode('utf-16'))
+    assert pipeline.update() is None
+    assert pipeline.parse()[0] == spec_items
+    assert hash_spec_objects(aspec_file, list(spec_items)) is None
+
+
+def scanned_objects(aspec_file, chunk_size):
+    """Return the encoding and the spec objects scanned in chunks, or the error message."""
+    try:
+        encoding, objects = scan_aspec_file(aspec_file, chunk_size)
+        return encoding, list(objects)
+    except UnsupportedLayout as error:
+        return str(error)
+
+
+@pytest.mark.parametrize("edit", [
+    lambda data: data,
+    lambda data: b'\xef\xbb\xbf' + data.replace(b'encoding="UTF-8"', b'encoding="ISO-8859-1"', 1),
+    lambda data: re.sub(rb'<specobject>.*?</specobject>', b'<specobject/>', data, count=2, flags=re.S),
+    lambda data: data.replace(b'<specobjects', b'<specobjects xmlns="urn:oft"', 1),
+    lambda data: data.replace(b'<specdocument>', b'<specdocument xmlns="urn:oft">', 1),
+    lambda data: data[:len(data) // 2],
+] + [lambda data, markup=markup: markup(data.decode('utf-8')).encode('utf-8') for markup in MARKUP])
+def test_chunked_scan_matches_parser(tmp_path, edit):
+    """Scanning in chunks of any size finds the spec objects the parser finds, or the same error."""
+    aspec_file = str(tmp_path / "synthetic.aspec")
+    generate_aspec(aspec_file, items=40, seed=6)
+    with open(aspec_file, 'rb') as f:
+        data = edit(f.read())
+    with open(aspec_file, 'wb') as f:
+        f.write(data)
+
+    expected = scanned_objects(aspec_file, len(data) + 1)
+    for chunk_size in (1, 2, 7, 64, 1000):
+        assert scanned_objects(aspec_file, chunk_size) == expected
+    if isinstance(expected, str):
+        assert expected.startswith("malformed XML")
+        return
+    encoding, objects = expected
+    assert all(data[offset:offset + len(raw)] == raw for offset, raw, _ in objects)
+    object_keys = []
+    parse_aspec_model(aspec_file, True, object_keys)
+    items = [parse_fragment(raw, doctype, fragment_prefix(encoding)) for _, raw, doctype in objects]
+    assert [item.key if item else None for item in items] == object_keys
+
+
+def test_hashes_are_taken_when_needed(tmp_path):
+    """Uncached pipelines only hash the spec objects with track_changes, which update() needs."""
+    aspec_file = str(tmp_path / "synthetic.aspec")
+    generate_aspec(aspec_file, items=100, seed=7)
+
+    pipeline = AnalysisPipeline(aspec_file, use_cache=False)
+    pipeline.parse()
+    assert pipeline.object_hashes == [None]
+    assert pipeline.update() is None
+
+    tracked = AnalysisPipeline(aspec_file, use_cache=False, track_changes=True)
+    keys = list(tracked.parse()[0])
+    assert tracked.object_hashes[0].keys == keys
+    assert tracked.object_hashes[0] == hash_spec_objects(aspec_file, keys)
+    cached = AnalysisPipeline(aspec_file, cache_dir=str(tmp_path / "cache"))
+    cached.parse()
+    assert cached.object_hashes == tracked.object_hashes
@@ -0,0 +1,75 @@
+"""Tests for the native markdown importer and tracer against the recorded OpenFastTrace results."""
+
+import os
+import glob
+import json
+
+import pytest
+
+from oft_trace.markdown import parse_markdown_lines
+from oft_trace.pipeline import AnalysisPipeline
+from oft_trace.reporter import generate_json_report
+
+CONTENT_DIR = os.path.join(os.path.dirname(__file__), "content")
+
+
+def load_expected(md_file):
+    """Load the trace-failures JSON recorded for a markdown file from the OpenFastTrace aspec report."""
+    with open(md_file[:-3] + "-trace.json", encoding="utf-8") as f:
+        text = f.read()
+    try:
+        return json.loads(text[text.find("{"):])
+    except ValueError:
+        return None
+
+
+def item_summary(item):
+    """Return the parts of a report item that come from tracing."""
+    return (item["key"], item["doctype"], item["title"], item["source"]["line"], item["coverage_type"],
+            item["covers"], item["covered_by"])
+
+
+@pytest.mark.parametrize("md_file", sorted(glob.glob(os.path.join(CONTENT_DIR, "*.md"))),
+                         ids=os.path.basename)
+def test_markdown_trace_matches_openfasttrace(md_file):
+    """Tracing a markdown file natively gives the result of the OpenFastTrace aspec report."""
+    expected = load_expected(md_file)
+    if expected is None:
+        pytest.skip("no recorded result")
+
+    pipeline = AnalysisPipeline(md_file, use_cache=False)
+    pipeline.run()
+    report = generate_json_report(pipeline.analyzer, pipeline.analyzer.broken_chains)
+
+    assert report["summary"]["total_items"] == expected["summary"]["total_items"]
+    assert report["summary"]["coverage_by_type"] == expected["summary"]["coverage_by_type"]
+    assert [item_summary(item) for item in report["items"]] == [item_summary(item) for item in expected["items"]]
+
+
+def test_markdown_sections():
+    """IDs, titles, sections, statuses and forwarded coverage are read from markdown."""
+    items = parse_markdown_lines([
+        "## Login form\n",
+        "`req~login.form~2`\n",
+        "The user can log in.\n",
+        "\n",
+        "Status: draft\n",
+        "Needs: dsn, utest\n",
+        "Covers:\n",
+        "* [feat~login~1](#feat~login~1)\n",
+        "- `feat~session~3`\n",
+        "Tags: ui\n",
+        "`dsn --> impl : req~login.form~2`\n",
+    ], "spec.md")
+
+    assert len(items) == 2
+    requirement, design = items
+    assert (requirement.doctype, requirement.name, requirement.revision) == ("req", "login.form", "2")
+    assert requirement.title == "Login form"
+    assert requirement.description == "The user can log in."
+    assert requirement.status == "draft"
+    assert requirement.needs == ("dsn", "utest")
+    assert requirement.covers == (("feat", "login", "1"), ("feat", "session", "3"))
+    assert requirement.sourceline == "2"
+    assert (design.doctype, design.name, design.needs, design.covers) == (
+        "dsn", "login.form", ("impl",), (("req", "login.form", "2"),))
@@ -0,0 +1,67 @@
+"""Tests for the slotted item model."""
+
+import pickle
+
+import pytest
+
+from oft_trace.models import Coverage, CoveredItem, CoveringItem, SpecItem
+from oft_trace.parser import parse_aspec_model
+from oft_trace.synthetic import generate_aspec
+
+
+def test_record_behaves_like_dict_of_present_fields():
+    """Records answer dict-style reads; fields that were not set are missing keys."""
+    covering = CoveringItem(id="dsn-1", version="2", coveringStatus="COVERING")
+    expected = {'id': "dsn-1", 'version': "2", 'coveringStatus': "COVERING"}
+    assert dict(covering) == expected
+    assert covering == expected
+    assert len(covering) == 3
+    assert list(covering) == ['id', 'version', 'coveringStatus']
+    assert covering['version'] == "2" and covering.get('version') == "2"
+    assert 'doctype' not in covering and covering.get('doctype', 'none') == 'none'
+    assert covering.doctype is None
+    with pytest.raises(KeyError):
+        covering['doctype']
+    with pytest.raises(KeyError):
+        covering['unknown']
+    assert not hasattr(covering, '__dict__')
+    assert Coverage(coveringItems=[]).get('coveringItems') == []
+    assert repr(CoveredItem(id="req-1")) == "CoveredItem({'id': 'req-1'})"
+
+
+def test_pickle_round_trip(tmp_path):
+    """Pickled items keep their fields and records, and recompute the memoized coverage type."""
+    aspec_file = str(tmp_path / "synthetic.aspec")
+    generate_aspec(aspec_file, items=200, mismatch_rate=0.1, seed=4)
+    spec_items = parse_aspec_model(aspec_file)[0]
+    for item in spec_items.values():
+        item.coverage_type
+
+    loaded = pickle.loads(pickle.dumps(spec_items, protocol=pickle.HIGHEST_PROTOCOL))
+    assert list(loaded) == list(spec_items)
+    for key, item in spec_items.items():
+        copy = loaded[key]
+        assert copy.__getstate__() == item.__getstate__()
+        assert type(copy.coverage) is Coverage
+        assert all(type(covered) is CoveredItem for covered in copy.covers)
+        assert copy._coverage_type is None
+        assert copy.coverage_type == item.coverage_type
+
+
+def test_repeated_values_are_interned(tmp_path):
+    """IDs, versions, doctypes and statuses read from a report share one string object per value."""
+    aspec_file = str(tmp_path / "synthetic.aspec")
+    generate_aspec(aspec_file, items=200, seed=5)
+    spec_items = parse_aspec_model(aspec_file)[0]
+
+    strings = {}
+    for item in spec_items.values():
+        values = [item.id, item.version, item.doctype, item.key, item.status, item.sourcefile,
+                  item.coverage.deepCoverageStatus]
+        for covered in item.covers:
+            values += [covered.id, covered.version, covered.doctype]
+        for covering in item.coverage.coveringItems:
+            values += [covering.id, covering.version, covering.doctype, covering.coveringStatus]
+        for value in values:
+            if value is not None:
+                assert strings.setdefault(value, value) is value
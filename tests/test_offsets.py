@@ -0,0 +1,71 @@
+"""Tests for the sidecar offset index of aspec files."""
+
+import os
+import random
+
+from oft_trace.offsets import build_offset_index, index_path, open_offset_index, scan_spec_objects
+from oft_trace.pipeline import AnalysisPipeline
+from oft_trace.synthetic import generate_aspec
+from oft_trace.visualizer import create_ascii_chain
+
+
+def render_chain(pipeline, spec_id, version, direction, capsys):
+    """Render a trace chain as ASCII text the way the trace command does."""
+    pipeline.cycles()
+    analyzer = pipeline.analyzer
+    item_key = analyzer.get_item_by_id(spec_id, version=version)
+    create_ascii_chain(analyzer, item_key, direction=direction)
+    return item_key, capsys.readouterr().out
+
+
+def test_trace_chain_matches_full_model(tmp_path, capsys):
+    """Chains loaded through the index render exactly as with the full model."""
+    aspec_file = str(tmp_path / "synthetic.aspec")
+    generate_aspec(aspec_file, items=1500, fan_out=3, cycles=10, mismatch_rate=0.1, duplicate_rate=0.1, seed=11)
+    counts = build_offset_index(aspec_file)
+    assert os.path.exists(index_path(aspec_file))
+
+    full = AnalysisPipeline(aspec_file, use_cache=False)
+    spec_items = full.parse()[0]
+    assert counts["items"] == len(spec_items)
+    assert counts["cycles"] == len(full.cycles()) > 0
+
+    keys = random.Random(2).sample(list(spec_items), 40)
+    keys += [cycle[0] for cycle in full.cycles()]
+    for item_key in keys:
+        spec_id, version = item_key.rsplit('~', 1)
+        for direction in ('both', 'incoming', 'outgoing'):
+            chain = AnalysisPipeline(aspec_file, use_cache=False)
+            assert chain.parse_trace_chain(spec_id, version=version, direction=direction)
+            assert len(chain.parse()[0]) < len(spec_items)
+            assert (render_chain(chain, spec_id, version, direction, capsys)
+                    == render_chain(full, spec_id, version, direction, capsys))
+
+
+def test_changed_report_ignores_index(tmp_path):
+    """An index written for an older version of the report is not used."""
+    aspec_file = str(tmp_path / "synthetic.aspec")
+    generate_aspec(aspec_file, items=200, seed=1)
+    build_offset_index(aspec_file)
+    with open_offset_index(aspec_file) as index:
+        assert index.find("missing") is None
+        assert not index.load_trace_chain("missing")[0]
+
+    generate_aspec(aspec_file, items=300, seed=1)
+    assert open_offset_index(aspec_file) is None
+    assert not AnalysisPipeline(aspec_file, use_cache=False).parse_trace_chain("feat-0")
+
+
+def test_scan_in_small_chunks(tmp_path):
+    """Spec objects are scanned completely when their tags span the chunks the file is read in."""
+    aspec_file = str(tmp_path / "synthetic.aspec")
+    generate_aspec(aspec_file, items=30, duplicate_rate=0.1, seed=3)
+    with open(aspec_file, 'rb') as f:
+        data = f.read()
+
+    objects = list(scan_spec_objects(aspec_file))
+    assert len(objects) >= 30
+    assert all(data[offset:offset + len(fragment)] == fragment and fragment.startswith(b'<specobject>')
+               and fragment.endswith(b'</specobject>') for offset, fragment, _ in objects)
+    for chunk_size in (1, 2, 7, 64, 1000):
+        assert list(scan_spec_objects(aspec_file, chunk_size)) == objects
@@ -0,0 +1,94 @@
+"""Tests for parsing aspec files into the item model."""
+
+from oft_trace.parser import parse_aspec_model
+from oft_trace.pipeline import AnalysisPipeline
+from oft_trace.reporter import analyze_and_display_failure, iter_json_report_items
+from oft_trace.synthetic import generate_aspec
+
+UNCOVERED_TYPES_ASPEC = """<?xml version="1.0" encoding="UTF-8"?>
+<specdocument>
+  <specobjects doctype="req">
+    <specobject>
+      <id>req-1</id>
+      <version>1</version>
+      <shortdesc>Needs more coverage</shortdesc>
+      <coverage>
+        <shallowCoverageStatus>UNCOVERED</shallowCoverageStatus>
+        <deepCoverageStatus>UNCOVERED</deepCoverageStatus>
+        <coveringSpecObjects>
+          <coveringSpecObject>
+            <id>dsn-1</id>
+            <version>1</version>
+            <doctype>dsn</doctype>
+            <ownCoverageStatus>COVERED</ownCoverageStatus>
+            <deepCoverageStatus>COVERED</deepCoverageStatus>
+            <coveringStatus>COVERING</coveringStatus>
+          </coveringSpecObject>
+        </coveringSpecObjects>
+        <coveredTypes>
+          <coveredType>dsn</coveredType>
+        </coveredTypes>
+        <uncoveredTypes>
+          <uncoveredType>impl</uncoveredType>
+          <uncoveredType>utest</uncoveredType>
+        </uncoveredTypes>
+      </coverage>
+    </specobject>
+  </specobjects>
+</specdocument>
+"""
+
+
+def test_covered_and_uncovered_types(tmp_path, capsys):
+    """The types OpenFastTrace lists as (un)covered are parsed and named in the failure reasons."""
+    aspec_file = tmp_path / "types.aspec"
+    aspec_file.write_text(UNCOVERED_TYPES_ASPEC, encoding='utf-8')
+
+    for streaming in (True, False):
+        pipeline = AnalysisPipeline(str(aspec_file), use_cache=False, streaming=streaming)
+        item = pipeline.parse()[0]["req-1~1"]
+        assert item.coverage.coveredTypes == ["dsn"]
+        assert item.coverage.uncoveredTypes == ["impl", "utest"]
+
+    analyzer = pipeline.analyzer
+    record = next(iter_json_report_items(analyzer, ["req-1~1"]))
+    assert record["coverage_type"] == "UNCOVERED"
+    assert record["failure_reasons"] == ["❌ Missing coverage for types: impl, utest"]
+
+    capsys.readouterr()
+    analyze_and_display_failure(analyzer, "req-1~1", 1, 1, output_file=True)
+    assert "Failure reasons:\n- ❌ Missing coverage for types: impl, utest\n" in capsys.readouterr().out
+
+
+def item_states(model):
+    """Return the items and relationship maps of a model as comparable plain values."""
+    spec_items, id_map, covering_map, covered_by_map = model
+    # Records compare like the dicts of their fields
+    items = {key: item.__getstate__() for key, item in spec_items.items()}
+    return items, dict(id_map), dict(covering_map), dict(covered_by_map)
+
+
+def test_streaming_matches_dom(tmp_path):
+    """Streaming the spec objects with iterparse yields the same model as the full DOM."""
+    aspec_file = str(tmp_path / "synthetic.aspec")
+    generate_aspec(aspec_file, items=600, doctypes=('feat', 'req', 'dsn', 'impl', 'utest'), fan_out=3, cycles=2,
+                   mismatch_rate=0.1, duplicate_rate=0.05, seed=11)
+
+    streamed_keys, dom_keys = [], []
+    streamed = parse_aspec_model(aspec_file, True, streamed_keys)
+    dom = parse_aspec_model(aspec_file, False, dom_keys)
+    assert len(streamed[0]) > 600
+    assert list(streamed[0]) == list(dom[0])
+    assert item_states(streamed) == item_states(dom)
+    assert streamed_keys == dom_keys
+
+
+def test_relationship_maps(sample_aspec):
+    """Versions of an ID, links to missing items and self links end up in the relationship maps."""
+    spec_items, id_map, covering_map, covered_by_map = parse_aspec_model(sample_aspec)
+    assert id_map["req-login"] == ["req-login~1", "req-login~2"]
+    assert covering_map["impl-login~1"] == ["dsn-login~1", "dsn-missing~1"]
+    assert "dsn-missing~1" not in spec_items
+    assert covered_by_map["dsn-self~1"] == ["dsn-self~1"]
+    assert covered_by_map["req-cycle~1"] == ["dsn-cycle~1"]
+    assert covering_map["req-cycle~1"] == ["dsn-cycle~1"]
@@ -0,0 +1,60 @@
+"""Tests for loading several aspec files into one analysis pipeline."""
+
+import os
+
+from oft_trace.parser import parse_aspec_model
+from oft_trace.pipeline import AnalysisPipeline, find_aspec_files, merge_aspec_models
+from oft_trace.synthetic import generate_aspec
+
+
+def test_merge_keeps_first_definition(tmp_path):
+    """Merged models hold every key once, from the first file that defines it, and list the duplicates."""
+    files = [str(tmp_path / f"part{number}.aspec") for number in range(3)]
+    generate_aspec(files[0], items=200, seed=21)
+    generate_aspec(files[1], items=300, doctypes=('req', 'dsn'), seed=22)
+    generate_aspec(files[2], items=50, doctypes=('utest',), seed=23)
+    models = [parse_aspec_model(path) for path in files]
+
+    (spec_items, id_map, covering_map, covered_by_map), duplicates = merge_aspec_models(models, files)
+
+    origin = {}
+    expected_duplicates = []
+    for (file_items, _, _, _), path in zip(models, files):
+        for item_key in file_items:
+            if item_key in origin:
+                expected_duplicates.append((item_key, origin[item_key], path))
+            else:
+                origin[item_key] = path
+    assert duplicates == expected_duplicates
+    assert {path for _, _, path in duplicates} == {files[1]}
+    assert list(spec_items) == list(origin)
+
+    model_of = dict(zip(files, models))
+    for item_key, path in origin.items():
+        file_items, _, file_covering_map, file_covered_by_map = model_of[path]
+        assert spec_items[item_key] is file_items[item_key]
+        assert covering_map.get(item_key, []) == file_covering_map.get(item_key, [])
+        assert covered_by_map.get(item_key, []) == file_covered_by_map.get(item_key, [])
+    assert {spec_id: keys for spec_id, keys in id_map.items()} == \
+        {spec_id: [key for key in origin if spec_items[key].id == spec_id] for spec_id in id_map}
+    assert set(covering_map) <= set(spec_items) and set(covered_by_map) <= set(spec_items)
+
+    # Parsing in worker processes gives the same model
+    serial = AnalysisPipeline(files, use_cache=False, jobs=1)
+    parallel = AnalysisPipeline(files, use_cache=False, jobs=2)
+    assert list(serial.parse()[0]) == list(parallel.parse()[0]) == list(spec_items)
+    assert serial.duplicates == parallel.duplicates == duplicates
+    assert serial.parse()[2] == parallel.parse()[2] == covering_map
+
+
+def test_find_aspec_files(tmp_path):
+    """Files, directories and globs expand to each aspec file once, in the given order."""
+    nested = tmp_path / "docs" / "nested"
+    nested.mkdir(parents=True)
+    for path in (tmp_path / "b.aspec", tmp_path / "a.aspec", nested / "c.aspec", nested / "notes.txt"):
+        path.write_text("<specdocument/>")
+
+    found = find_aspec_files([str(tmp_path / "b.aspec"), str(tmp_path / "*.aspec"), str(tmp_path / "docs"),
+                              str(tmp_path / "missing.aspec")])
+    assert [os.path.relpath(path, tmp_path) for path in found] == \
+        ["b.aspec", "a.aspec", os.path.join("docs", "nested", "c.aspec")]
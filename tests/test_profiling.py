@@ -0,0 +1,75 @@
+"""Tests for the per-stage profile of a command."""
+
+import json
+import os
+import subprocess
+import sys
+
+from oft_trace.profiling import Profiler, activate, profile_stage
+from oft_trace.synthetic import generate_aspec
+
+
+def cli(*args):
+    """Run an oft-trace command with a wide terminal and return its standard output."""
+    return subprocess.run([sys.executable, "-m", "oft_trace.cli", *args], capture_output=True, text=True,
+                          check=True, env=dict(os.environ, COLUMNS="200")).stdout
+
+
+def test_stages_nest_and_accumulate():
+    """Stages opened inside another one are its children; repeated stages add up calls and counts."""
+    profiler = Profiler("check", trace_memory=True).start()
+    activate(profiler)
+    try:
+        with profile_stage('parse') as stage:
+            stage.count(items=3)
+            for _ in range(2):
+                with profile_stage('xml') as inner:
+                    inner.count(items=2)
+                    data = [bytes(1000) for _ in range(100)]
+        with profile_stage('render'):
+            del data
+    finally:
+        activate(None)
+    profiler.finish()
+
+    stages = {stage["stage"]: stage for stage in profiler.as_dict()["stages"]}
+    assert list(stages) == ["parse", "parse/xml", "render"]
+    assert [stages[name]["depth"] for name in stages] == [0, 1, 0]
+    assert stages["parse"]["calls"] == 1 and stages["parse"]["counts"] == {"items": 3}
+    assert stages["parse/xml"]["calls"] == 2 and stages["parse/xml"]["counts"] == {"items": 4}
+    assert stages["parse/xml"]["peak_memory"] >= 100 * 1000
+    assert stages["parse"]["peak_memory"] >= stages["parse/xml"]["peak_memory"]
+    assert stages["render"]["memory_delta"] < 0
+    assert profiler.peak_memory >= stages["parse"]["peak_memory"]
+
+
+def test_profile_of_a_command(tmp_path):
+    """--profile-json records the stages of the command with their counts; --profile prints them as a table."""
+    aspec_file = str(tmp_path / "synthetic.aspec")
+    shape = generate_aspec(aspec_file, items=200, fan_out=3, cycles=2, seed=5)
+    profile_file = str(tmp_path / "profile.json")
+    cli("--profile-json", profile_file, "--no-profile-memory", "list-items", aspec_file, "--no-cache",
+        "-o", str(tmp_path / "items.txt"))
+
+    with open(profile_file, encoding="utf-8") as f:
+        profile = json.load(f)
+    assert profile["command"] == "list-items"
+    assert profile["memory_traced"] is False
+    assert profile["total"]["wall"] > 0 and profile["total"]["max_rss"] > 0
+    stages = {stage["stage"]: stage for stage in profile["stages"]}
+    for name in ("parse", "parse/xml", "parse/links", "index", "cycles", "cycles/graph", "render"):
+        assert stages[name]["calls"] == 1, name
+        assert stages[name]["peak_memory"] == 0, name
+    assert stages["parse"]["counts"]["files"] == 1
+    assert stages["parse"]["counts"]["items"] == stages["parse/xml"]["counts"]["items"] == shape["items"]
+    assert stages["parse"]["counts"]["links"] == stages["parse/links"]["counts"]["links"] == shape["links"]
+    assert stages["cycles/graph"]["counts"]["edges"] == shape["links"]
+    assert stages["cycles"]["counts"]["cycles"] > 0
+
+    output = cli("--profile", "--no-profile-memory", "list-items", aspec_file, "--no-cache",
+                 "-o", str(tmp_path / "items.txt"))
+    table = output[output.index("Profile of list-items"):]
+    rows = [line.split() for line in table.splitlines()]
+    for name in ("parse", "xml", "links", "index", "cycles", "graph", "render", "total"):
+        assert any(row and row[0] == name for row in rows), name
+    assert f"items={shape['items']}" in table
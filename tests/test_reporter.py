@@ -0,0 +1,59 @@
+"""Tests for the streamed JSON reports of trace-failures."""
+
+import io
+import json
+from datetime import datetime
+
+import pytest
+
+from oft_trace import reporter
+from oft_trace.pipeline import AnalysisPipeline
+from oft_trace.reporter import generate_json_report, write_json_report, write_ndjson_report
+from oft_trace.synthetic import generate_aspec
+
+
+class FixedDatetime(datetime):
+    """Datetime whose now() always returns the same moment, so reports can be compared."""
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls(2024, 1, 2, 3, 4, 5)
+
+
+@pytest.fixture
+def analyzer(tmp_path, monkeypatch):
+    """Analyzer of a synthetic report with cycles, reporting a fixed timestamp."""
+    monkeypatch.setattr(reporter, "datetime", FixedDatetime)
+    aspec_file = str(tmp_path / "synthetic.aspec")
+    generate_aspec(aspec_file, items=300, fan_out=3, cycles=2, mismatch_rate=0.1, uncovered_rate=0.2, seed=13)
+    pipeline = AnalysisPipeline(aspec_file, use_cache=False)
+    pipeline.cycles()
+    return pipeline.analyzer
+
+
+@pytest.mark.parametrize("include_all", [False, True])
+def test_streamed_json_matches_document(analyzer, include_all):
+    """The streamed report equals dumping the whole document, indented and compact."""
+    items = list(analyzer.spec_items)
+    for items_to_analyze in (items, [], [key for key in items if analyzer.spec_items[key].coverage_type == "COVERED"]):
+        report = generate_json_report(analyzer, items_to_analyze, include_all)
+
+        stream = io.StringIO()
+        count = write_json_report(analyzer, stream, items_to_analyze, include_all)
+        assert stream.getvalue() == json.dumps(report, indent=2)
+        assert count == len(report["items"])
+
+        stream = io.StringIO()
+        write_json_report(analyzer, stream, items_to_analyze, include_all, compact=True)
+        assert stream.getvalue() == json.dumps(report, separators=(',', ':'))
+
+
+def test_ndjson_holds_header_and_one_item_per_line(analyzer):
+    """NDJSON output is the report header followed by one line per item record."""
+    report = generate_json_report(analyzer, list(analyzer.spec_items))
+    stream = io.StringIO()
+    write_ndjson_report(analyzer, stream, list(analyzer.spec_items))
+    lines = stream.getvalue().splitlines()
+    assert json.loads(lines[0]) == {key: value for key, value in report.items() if key != "items"}
+    assert [json.loads(line) for line in lines[1:]] == report["items"]
+    assert len(report["items"]) > 50
@@ -0,0 +1,241 @@
+"""Tests for the resident query server and the query client."""
+
+import contextlib
+import json
+import re
+import subprocess
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from oft_trace.pipeline import AnalysisPipeline
+from oft_trace.server import QueryService, create_server, send_query
+from oft_trace.synthetic import generate_aspec
+
+CHAIN_ITEM = re.compile(r"(?:── )(?:\S+ )?(\S+) \(v([^)]*)\) \[|NOT FOUND: (\S+)")
+
+
+def cli(*args):
+    """Run an oft-trace command and return its standard output."""
+    return subprocess.run([sys.executable, "-m", "oft_trace.cli", *args], capture_output=True, text=True,
+                          check=True).stdout
+
+
+def new_service(aspec_file):
+    """Return a query service over an uncached pipeline that is reloaded on demand only."""
+    return QueryService([aspec_file], lambda files: AnalysisPipeline(files, use_cache=False, track_changes=True),
+                        poll_interval=0)
+
+
+@contextlib.contextmanager
+def running(service, **address):
+    """Serve the service in a background thread while the block runs."""
+    server = create_server(service, **address)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def aspec_file(tmp_path):
+    """Synthetic report with cycles, duplicate versions and version mismatches."""
+    path = str(tmp_path / "synthetic.aspec")
+    generate_aspec(path, items=300, fan_out=3, cycles=3, mismatch_rate=0.1, duplicate_rate=0.05, seed=31)
+    return path
+
+
+def test_queries_match_cli(tmp_path, aspec_file):
+    """The server answers like the one-shot commands on the same report."""
+    service = new_service(aspec_file)
+
+    report_file = str(tmp_path / "failures.json")
+    cli("trace-failures", aspec_file, "--no-cache", "--format", "json", "--include-covered", "-o", report_file)
+    with open(report_file) as f:
+        report = json.load(f)
+    status, failures = service.query("failures", {"include_covered": "true"})
+    assert status == 200 and failures["items"] == report["items"]
+    status, stats = service.query("stats", {})
+    assert stats["summary"] == report["summary"]
+    assert stats["summary"]["circular"] > 0
+    status, failures = service.query("failures", {"limit": "5"})
+    assert failures["items"] == [item for item in report["items"] if item["coverage_type"] != "COVERED"][:5]
+
+    items_file = str(tmp_path / "items.txt")
+    cli("list-items", aspec_file, "--no-cache", "--doctype", "req", "-o", items_file)
+    with open(items_file) as f:
+        listed = [line.split()[:2] + [line.split()[4]] for line in f if line.startswith("req-")]
+    status, items = service.query("items", {"doctype": "req"})
+    assert [[item["id"], item["version"], item["coverage_type"]] for item in items["items"]] == listed
+
+    for item in items["items"][::10]:
+        trace_file = str(tmp_path / "trace.txt")
+        cli("trace", aspec_file, item["id"], "--version", item["version"], "--no-cache", "--render-mode", "full",
+            "-o", trace_file)
+        with open(trace_file) as f:
+            shown = {match[2] or f"{match[0]}~{match[1]}" for match in CHAIN_ITEM.findall(f.read())}
+        status, chain = service.query("trace", {"id": item["id"], "version": item["version"]})
+        assert status == 200 and set(chain["items"]) == shown
+
+    assert service.query("trace", {"id": "missing"})[0] == 404
+    assert service.query("trace", {})[0] == 400
+    assert service.query("unknown", {})[0] == 404
+
+
+def edit_aspec(aspec_file, old, new):
+    """Replace the first occurrence of a text in an aspec file."""
+    with open(aspec_file) as f:
+        content = f.read()
+    assert old in content
+    with open(aspec_file, 'w') as f:
+        f.write(content.replace(old, new, 1))
+
+
+def test_reload_and_incremental_update(tmp_path, aspec_file, monkeypatch):
+    """Changed files update the model in place, fall back to a reload and report failed updates."""
+    service = new_service(aspec_file)
+    model = service.model
+    assert service.reload_if_changed() is False
+
+    # A changed spec object is patched into the loaded model
+    edit_aspec(aspec_file, "<deepCoverageStatus>UNCOVERED</deepCoverageStatus>",
+                     "<deepCoverageStatus>COVERED</deepCoverageStatus>")
+    assert service.reload_if_changed() is True
+    assert service.model is model and service.reloads == 1
+    fresh = new_service(aspec_file)
+    assert service.query("failures", {"include_covered": "1"}) == fresh.query("failures", {"include_covered": "1"})
+    assert service.query("stats", {})[1]["summary"] == fresh.query("stats", {})[1]["summary"]
+
+    # Comments and other markup are patched in as well
+    edit_aspec(aspec_file, "<specdocument>", "<specdocument>\n  <!-- Updated in place -->")
+    assert service.reload_if_changed() is True
+    assert service.model is model
+
+    # A file the update cannot handle is loaded again as a whole
+    generate_aspec(aspec_file, items=200, seed=32)
+    with open(aspec_file, encoding='utf-8') as f:
+        text = f.read()
+    with open(aspec_file, 'wb') as f:
+        f.write(text.replace('encoding="UTF-8"', 'encoding="UTF-16"', 1).encode('utf-16'))
+    assert service.reload_if_changed() is True
+    assert service.model is not model
+    assert service.query("stats", {})[1]["summary"]["total_items"] == new_service(aspec_file).query(
+        "stats", {})[1]["summary"]["total_items"]
+    generate_aspec(aspec_file, items=200, seed=32)
+    assert service.reload_if_changed() is True
+
+    # A failing update is recorded, and the complete reload still happens
+    def fail(self):
+        raise RuntimeError("broken update")
+
+    monkeypatch.setattr(AnalysisPipeline, "update", fail)
+    model = service.model
+    edit_aspec(aspec_file, "<shortdesc>Feat 0</shortdesc>", "<shortdesc>Feat zero</shortdesc>")
+    assert service.reload_if_changed() is True
+    assert service.model is not model
+    assert service.last_reload_error == "Incremental update failed: broken update"
+    assert service.query("stats", {})[1]["last_reload_error"] == service.last_reload_error
+    assert service.query("items", {"id": "feat-0"})[1]["items"][0]["title"] == "Feat zero"
+
+    # A report that cannot be loaded keeps the previous model
+    with open(aspec_file, 'w') as f:
+        f.write("<specdocument><specobjects doctype='req'><specobject>")
+    assert service.reload_if_changed() is False
+    assert service.model.analyzer.spec_items
+    assert service.last_reload_error.startswith("Incremental update failed: broken update; ")
+
+
+def test_failed_update_and_reload(aspec_file, monkeypatch):
+    """A model left partly patched by a failed update stops answering until a reload replaces it."""
+    service = new_service(aspec_file)
+    model = service.model
+
+    def fail(self):
+        self.analyzer.spec_items.popitem()
+        raise RuntimeError("broken update")
+
+    def fail_to_load(files):
+        raise RuntimeError("broken reload")
+
+    monkeypatch.setattr(AnalysisPipeline, "update", fail)
+    monkeypatch.setattr(service, "pipeline_factory", fail_to_load)
+    edit_aspec(aspec_file, "<shortdesc>Feat 0</shortdesc>", "<shortdesc>Feat zero</shortdesc>")
+    assert service.reload_if_changed() is False
+    assert service.model is model
+    assert service.last_reload_error == "Incremental update failed: broken update; broken reload"
+    for endpoint, params in [("stats", {}), ("items", {"id": "feat-0"}), ("trace", {"id": "feat-0"})]:
+        assert service.query(endpoint, params) == (503, {"error": f"Model unavailable: {service.last_reload_error}"})
+
+    # The next change of the files loads a complete new model
+    monkeypatch.undo()
+    edit_aspec(aspec_file, "<shortdesc>Feat zero</shortdesc>", "<shortdesc>Feat one</shortdesc>")
+    assert service.reload_if_changed() is True
+    assert service.model is not model and service.last_reload_error is None
+    assert service.query("items", {"id": "feat-0"})[1]["items"][0]["title"] == "Feat one"
+
+
+def test_server_errors(tmp_path, aspec_file, monkeypatch):
+    """A query that raises is answered with status 500 and the error."""
+    service = new_service(aspec_file)
+
+    def fail(self, model, params):
+        raise KeyError("broken query")
+
+    monkeypatch.setattr(QueryService, "_query_items", fail)
+    with running(service, socket_path=str(tmp_path / "serve.sock")):
+        assert send_query("items", socket_path=str(tmp_path / "serve.sock")) == (500, {"error": "'broken query'"})
+        assert send_query("stats", socket_path=str(tmp_path / "serve.sock"))[0] == 200
+
+
+def normalized(payload):
+    """Return a payload as text without the fields that change with every load or request."""
+    return json.dumps({key: value for key, value in payload.items() if key not in ("loaded_at", "timestamp", "reloads")},
+                      sort_keys=True)
+
+
+def test_concurrent_requests(tmp_path, aspec_file):
+    """Concurrent requests over a Unix socket and HTTP get the same answers as serial queries, also during reloads."""
+    service = new_service(aspec_file)
+    socket_path = str(tmp_path / "serve.sock")
+    queries = [("stats", {}), ("failures", {}), ("items", {"doctype": "dsn"}), ("items", {"coverage": "COVERED"}),
+               ("trace", {"id": "req-1"}), ("trace", {"id": "dsn-2", "direction": "incoming"})]
+
+    def answers():
+        answer = {}
+        for endpoint, params in queries:
+            answer[(endpoint, json.dumps(params))] = normalized(service.query(endpoint, params)[1])
+        return answer
+
+    before = answers()
+    with running(service, socket_path=socket_path), running(service, port=0) as http_server:
+        port = http_server.server_address[1]
+
+        def request(number):
+            endpoint, params = queries[number % len(queries)]
+            address = {"socket_path": socket_path} if number % 2 else {"port": port}
+            status, payload = send_query(endpoint, params, **address)
+            return (endpoint, json.dumps(params)), status, normalized(payload)
+
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            results = list(executor.map(request, range(200)))
+        assert all(status == 200 and before[key] == payload for key, status, payload in results)
+
+        # Every answer during an in-place update comes from the model before or after it
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            pending = executor.map(request, range(300))
+            edit_aspec(aspec_file, "<deepCoverageStatus>UNCOVERED</deepCoverageStatus>",
+                             "<deepCoverageStatus>COVERED</deepCoverageStatus>")
+            assert service.reload_if_changed() is True
+            results = list(pending)
+        after = answers()
+        assert before != after
+        assert all(status == 200 and payload in (before[key], after[key]) for key, status, payload in results)
+
+        # The query command is a client of the same server
+        output = cli("query", "items", "doctype=dsn", "--socket", socket_path, "--compact")
+        assert json.loads(output) == service.query("items", {"doctype": "dsn"})[1]
@@ -0,0 +1,85 @@
+"""Startup budget for the oft-trace command line."""
+
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Median time that importing the CLI may add to a bare interpreter start, in milliseconds
+STARTUP_BUDGET_MS = float(os.environ.get("OFT_TRACE_STARTUP_BUDGET_MS", "150"))
+STARTUP_RUNS = 7
+
+# Modules that only the commands themselves need
+DEFERRED_MODULES = [
+    "rich",
+    "xml.etree.ElementTree",
+    "oft_trace.parser",
+    "oft_trace.analyzer",
+    "oft_trace.pipeline",
+    "oft_trace.reporter",
+    "oft_trace.visualizer",
+    "oft_trace.batch",
+    "oft_trace.server",
+    "oft_trace.profiling",
+    "oft_trace.markdown",
+    "oft_trace.tracer",
+    "oft_trace.coverage",
+    "oft_trace.offsets",
+    "oft_trace.incremental",
+    "oft_trace.diff",
+    "oft_trace.stats",
+    "oft_trace.export",
+]
+
+
+def run_python(code):
+    """Run a snippet in a fresh interpreter with the package importable."""
+    env = dict(os.environ, PYTHONPATH=ROOT_DIR)
+    return subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                          env=env, cwd=ROOT_DIR, check=True)
+
+
+def median_runtime(code):
+    """Return the median wall time of a snippet over STARTUP_RUNS fresh interpreters, in ms."""
+    timings = []
+    for _ in range(STARTUP_RUNS):
+        start = time.perf_counter()
+        run_python(code)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+@pytest.mark.parametrize("module", DEFERRED_MODULES)
+def test_cli_import_defers_module(module):
+    """Importing the CLI must not import the modules that only commands use."""
+    result = run_python("import sys, oft_trace.cli; print('\\n'.join(sys.modules))")
+    assert module not in result.stdout.splitlines()
+
+
+def test_cli_import_within_budget():
+    """Importing the CLI stays within the startup budget."""
+    baseline = median_runtime("pass")
+    startup = median_runtime("import oft_trace.cli")
+    overhead = startup - baseline
+    print(f"\nCLI import adds {overhead:.0f} ms (budget {STARTUP_BUDGET_MS:.0f} ms)")
+    assert overhead <= STARTUP_BUDGET_MS
+
+
+def test_console_is_shared_and_created_on_first_use():
+    """All modules print through one console, which imports rich only when it is first used."""
+    result = run_python(
+        "import sys\n"
+        "from oft_trace import console as shared\n"
+        "assert shared._console is None and 'rich' not in sys.modules\n"
+        "shared.console.width\n"
+        "assert 'rich' in sys.modules and shared.get_console() is shared._console\n"
+        "from oft_trace import reporter, visualizer, parser\n"
+        "print(all(module.console is shared.console for module in (reporter, visualizer, parser)))\n"
+        "shared.console.print('[bold]printed[/]')\n"
+    )
+    assert result.stdout.splitlines() == ["True", "printed"]
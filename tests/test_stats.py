@@ -0,0 +1,124 @@
+"""Tests for the streamed coverage counts of aspec files."""
+
+import json
+import subprocess
+import sys
+
+from oft_trace.pipeline import AnalysisPipeline
+from oft_trace.stats import check_thresholds, count_coverage, parse_min_coverage
+from oft_trace.synthetic import generate_aspec
+
+
+def test_counts_match_full_model(tmp_path):
+    """Streamed counts and cycles equal the summary of the analyzed model, also across files and for markdown."""
+    first = str(tmp_path / "first.aspec")
+    second = str(tmp_path / "second.aspec")
+    generate_aspec(first, items=400, fan_out=3, cycles=5, mismatch_rate=0.1, duplicate_rate=0.1, seed=1)
+    generate_aspec(second, items=250, cycles=3, uncovered_rate=0.3, seed=2)
+
+    for aspec_files in ([first], [first, second], [second, first], ["tests/content/mixed-coverage.md"]):
+        counts = count_coverage(aspec_files)
+        pipeline = AnalysisPipeline(aspec_files, use_cache=False)
+        analyzer = pipeline.analyzer
+        assert counts.cycles == pipeline.cycles()
+        categories = analyzer.categorize_items_by_coverage()
+        assert counts.total_items == len(analyzer.spec_items)
+        assert counts.broken_chains == len(pipeline.classify())
+        assert counts.counts == {coverage_type: len(keys) for coverage_type, keys in categories.items()}
+        assert list(counts.by_doctype.items()) == list(analyzer.count_coverage_by_doctype().items())
+        assert counts.duplicates == pipeline.duplicates
+    assert count_coverage([first]).counts["CIRCULAR"] > 0
+
+
+def test_repeated_definitions_keep_their_links(tmp_path):
+    """Only the links of the definition the model keeps can close a cycle."""
+    def spec_object(spec_id, covered_id):
+        return (f"<specobject><id>{spec_id}</id><version>1</version><covering><coveredType><id>{covered_id}</id>"
+                f"<version>1</version><doctype>req</doctype></coveredType></covering></specobject>")
+
+    def write(path, *objects):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('<?xml version="1.0" encoding="UTF-8"?>\n<specdocument><specobjects doctype="req">'
+                    + "".join(objects) + '</specobjects></specdocument>\n')
+
+    first = str(tmp_path / "first.aspec")
+    second = str(tmp_path / "second.aspec")
+    # a covers b covers a, but the later definition of b within the file covers c instead
+    write(first, spec_object("a", "b"), spec_object("b", "a"), spec_object("b", "c"))
+    # The first file that defines a key wins, so this cycle through b is not in the merged model
+    write(second, spec_object("b", "d"), spec_object("d", "b"))
+
+    for aspec_files, cycles in (([first], []), ([second], [["b~1", "d~1"]]), ([first, second], []),
+                                ([second, first], [["b~1", "d~1"]])):
+        counts = count_coverage(aspec_files)
+        assert counts.cycles == cycles
+        assert counts.cycles == AnalysisPipeline(aspec_files, use_cache=False).cycles()
+        assert counts.counts["CIRCULAR"] == len(cycles and cycles[0])
+
+
+def test_output_matches_trace(tmp_path):
+    """The stats command prints the coverage summary and cycles of trace and the JSON summary of trace-failures."""
+    aspec_file = str(tmp_path / "synthetic.aspec")
+    generate_aspec(aspec_file, items=300, fan_out=3, cycles=4, duplicate_rate=0.05, seed=8)
+
+    def run(*args):
+        subprocess.run([sys.executable, "-m", "oft_trace.cli", *args], capture_output=True, check=True)
+
+    run("stats", aspec_file, "-o", str(tmp_path / "stats.txt"))
+    run("trace", aspec_file, "--no-cache", "-o", str(tmp_path / "trace.txt"))
+    stats_text = (tmp_path / "stats.txt").read_text(encoding="utf-8")
+    trace_text = (tmp_path / "trace.txt").read_text(encoding="utf-8")
+    summary = trace_text[trace_text.index("COVERAGE SUMMARY"):]
+    assert "CIRCULAR DEPENDENCIES" in summary
+    assert stats_text[stats_text.index("COVERAGE SUMMARY"):] == summary
+
+    run("stats", aspec_file, "--format", "json", "-o", str(tmp_path / "stats.json"))
+    run("trace-failures", aspec_file, "--no-cache", "--format", "json", "-o", str(tmp_path / "failures.json"))
+    with open(tmp_path / "stats.json", encoding="utf-8") as f:
+        stats_summary = json.load(f)["summary"]
+    with open(tmp_path / "failures.json", encoding="utf-8") as f:
+        failures_summary = json.load(f)["summary"]
+    assert stats_summary["circular"] > 0
+    assert stats_summary == failures_summary
+
+
+def test_thresholds(tmp_path):
+    """Coverage thresholds apply to all items or one doctype and set the exit code of the command."""
+    aspec_file = str(tmp_path / "synthetic.aspec")
+    generate_aspec(aspec_file, items=100, seed=3)
+    counts = count_coverage([aspec_file])
+    covered = counts.by_doctype["req"]["covered"] / counts.by_doctype["req"]["total"] * 100
+
+    assert check_thresholds(counts, [parse_min_coverage("req=%r" % covered)]) == []
+    assert len(check_thresholds(counts, [parse_min_coverage("req=%r" % (covered + 0.1)),
+                                         parse_min_coverage("missing=1"), parse_min_coverage("100")])) == 3
+    assert check_thresholds(counts, max_broken=counts.broken_chains) == []
+
+    def run(*options):
+        return subprocess.run([sys.executable, "-m", "oft_trace.cli", "stats", aspec_file, *options],
+                              capture_output=True, text=True)
+
+    result = run("--format", "json", "--min-coverage", "0")
+    assert result.returncode == 0
+    assert json.loads(result.stdout)["summary"]["total_items"] == counts.total_items
+    assert run("--max-broken", "0").returncode == 3
+    assert run("--min-coverage", "req=abc").returncode == 1
+
+
+def test_counts_without_cycles(tmp_path):
+    """Without cycle detection items in a cycle keep their reported coverage type and the gate still applies."""
+    aspec_file = str(tmp_path / "synthetic.aspec")
+    generate_aspec(aspec_file, items=300, fan_out=3, cycles=4, seed=5)
+    counts = count_coverage([aspec_file])
+    plain = count_coverage([aspec_file], find_cycles=False)
+    assert counts.counts["CIRCULAR"] > 0
+    assert plain.cycles == [] and plain.counts["CIRCULAR"] == 0
+    assert (plain.total_items, plain.broken_chains) == (counts.total_items, counts.broken_chains)
+    assert sum(plain.counts.values()) == sum(counts.counts.values())
+
+    result = subprocess.run([sys.executable, "-m", "oft_trace.cli", "stats", aspec_file, "--no-cycles",
+                             "--format", "json", "--max-broken", "0"], capture_output=True, text=True)
+    assert result.returncode == 3
+    summary = json.loads(result.stdout)["summary"]
+    assert summary["circular"] == 0
+    assert summary["total_items"] == counts.total_items
@@ -0,0 +1,43 @@
+"""Tests for the synthetic aspec generator."""
+
+import io
+
+from oft_trace.pipeline import AnalysisPipeline
+from oft_trace.synthetic import generate_aspec
+
+
+def load(path):
+    """Parse and analyze a generated report without the cache."""
+    pipeline = AnalysisPipeline(str(path), use_cache=False)
+    pipeline.run('classify', 'cycles')
+    return pipeline
+
+
+def test_generated_report_matches_counts(tmp_path):
+    """The parsed report has the items, links, cycles and duplicates the generator reports."""
+    aspec_file = tmp_path / "synthetic.aspec"
+    counts = generate_aspec(str(aspec_file), items=2000, fan_out=3, cycles=4, mismatch_rate=0.05,
+                            duplicate_rate=0.05, seed=7)
+
+    pipeline = load(aspec_file)
+    analyzer = pipeline.analyzer
+    assert len(analyzer.spec_items) == counts["items"]
+    assert sum(len(targets) for targets in analyzer.covering_map.values()) == counts["links"]
+    assert len(analyzer.circular_dependencies) == counts["cycles"] == 4
+    assert sum(len(keys) > 1 for keys in analyzer.id_map.values()) == counts["duplicates"] > 0
+
+    coverage_types = analyzer.categorize_items_by_coverage()
+    assert coverage_types.get("OUTDATED")
+    assert coverage_types.get("CIRCULAR")
+    assert len(coverage_types["COVERED"]) > len(analyzer.spec_items) // 2
+
+
+def test_generated_report_is_deterministic():
+    """The same options produce the same report, a different seed a different one."""
+    first, second, other = io.StringIO(), io.StringIO(), io.StringIO()
+    generate_aspec(first, items=500, cycles=2, seed=3)
+    generate_aspec(second, items=500, cycles=2, seed=3)
+    generate_aspec(other, items=500, cycles=2, seed=4)
+
+    assert first.getvalue() == second.getvalue()
+    assert first.getvalue() != other.getvalue()
@@ -2,6 +2,7 @@
 
 import os
 import json
+import importlib.util
 import subprocess
 import glob
 import sys
@@ -20,6 +21,8 @@ OFT_JAR = "_install/openfasttrace-4.1.0.jar"
 REPORTS_DIR = "reports"
 CONTENT_DIR = "content"  # Content directory with test files
 TEST_REPORT_FILE = "test_report.md"  # Test report output file
+# Markdown files are traced directly if the package can import them
+SUPPORTS_DIRECT_IMPORT = importlib.util.find_spec("oft_trace.markdown") is not None
 
 
 def setup_module(module):
@@ -97,7 +100,7 @@ def run_python_oft(aspec_file, md_file=None, output_format="json"):
     output_file = f"{aspec_file}-python-output.{output_format}"
     
     # Choose input file (md_file if direct import is supported, otherwise aspec)
-    input_file = md_file if md_file and hasattr(oft_main, 'supports_direct_import') else aspec_file
+    input_file = md_file if md_file and SUPPORTS_DIRECT_IMPORT else aspec_file
     
     # Call the main entry point function with appropriate arguments
     sys.argv = ["oft-trace", "trace-failures", input_file, "--format", output_format, "--output", output_file]
@@ -0,0 +1,79 @@
+"""Tests for rendering trace chains as full trees and as DAGs."""
+
+import contextlib
+import io
+import re
+
+from oft_trace.pipeline import AnalysisPipeline
+from oft_trace.synthetic import generate_aspec
+from oft_trace.visualizer import choose_render_mode, create_ascii_chain, create_rich_tree, estimate_trace_size
+
+ITEM_LABEL = re.compile(r"(\S+)\[/\] \[dim\]\(v([^)]*)\)")
+
+
+def synthetic_analyzer(tmp_path, cycles):
+    """Return the analyzer of a synthetic report with shared subtrees."""
+    aspec_file = str(tmp_path / "synthetic.aspec")
+    generate_aspec(aspec_file, items=300, fan_out=3, fan_in_skew=1.0, mismatch_rate=0.1, cycles=cycles, seed=12)
+    return AnalysisPipeline(aspec_file, use_cache=False).analyzer
+
+
+def ascii_lines(analyzer, item_key, direction, rendered):
+    """Return the lines of an ASCII chain, without the version mismatch notes between them."""
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        create_ascii_chain(analyzer, item_key, direction=direction, rendered=rendered)
+    return [line for line in output.getvalue().splitlines() if "VERSION MISMATCH" not in line]
+
+
+def expanded_keys(tree):
+    """Return the item keys of the nodes of a rich tree, in render order."""
+    keys = []
+    pending = [tree]
+    while pending:
+        node = pending.pop()
+        match = ITEM_LABEL.search(str(node.label))
+        if match:
+            keys.append("~".join(match.groups()))
+        pending.extend(reversed(node.children))
+    return keys
+
+
+def test_estimate_matches_rendered_sizes(tmp_path):
+    """For acyclic chains the estimate is the number of lines of the full and the DAG rendering."""
+    analyzer = synthetic_analyzer(tmp_path, cycles=0)
+    largest = 0
+    for item_key in list(analyzer.spec_items)[::5]:
+        for direction in ('both', 'outgoing', 'incoming'):
+            full = ascii_lines(analyzer, item_key, direction, None)
+            dag = ascii_lines(analyzer, item_key, direction, set())
+            assert estimate_trace_size(analyzer, item_key, direction) == {'full': len(full), 'dag': len(dag)}
+            largest = max(largest, len(full) - len(dag))
+    assert largest > 5
+    assert estimate_trace_size(analyzer, "missing~1") == {'full': 1, 'dag': 1}
+
+
+def test_dag_shows_every_item_of_the_full_tree(tmp_path):
+    """DAG rendering expands each item once per direction and reaches the same items as the full tree."""
+    analyzer = synthetic_analyzer(tmp_path, cycles=3)
+    for item_key in list(analyzer.spec_items)[::5]:
+        for direction in ('outgoing', 'incoming'):
+            full = expanded_keys(create_rich_tree(analyzer, item_key, direction=direction))
+            dag = expanded_keys(create_rich_tree(analyzer, item_key, direction=direction, rendered=set()))
+            assert len(dag) == len(set(dag))
+            assert set(dag) == set(full)
+
+            full_lines = ascii_lines(analyzer, item_key, direction, None)
+            dag_lines = ascii_lines(analyzer, item_key, direction, set())
+            assert {line.split("── ")[1] for line in dag_lines if "see " not in line} == \
+                {line.split("── ")[1] for line in full_lines}
+
+
+def test_auto_mode_switches_on_size(tmp_path):
+    """Auto mode keeps the full tree up to the threshold and switches to a DAG above it."""
+    analyzer = synthetic_analyzer(tmp_path, cycles=0)
+    item_key = max(analyzer.spec_items, key=lambda key: estimate_trace_size(analyzer, key)['full'])
+    size = estimate_trace_size(analyzer, item_key)['full']
+    assert choose_render_mode(analyzer, item_key, threshold=size) == 'full'
+    assert choose_render_mode(analyzer, item_key, threshold=size - 1) == 'dag'
+    assert choose_render_mode(analyzer, item_key, render_mode='full', threshold=0) == 'full'